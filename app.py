@@ -1,8 +1,24 @@
 import streamlit as st
+import numpy as np
 import pandas as pd
-import yfinance as yf
-from datetime import datetime, timezone, time
-import pytz
+from datetime import datetime
+from collections import namedtuple
+
+from data_utils_module import (
+    load_market_snapshot, invalidate_markets, snapshot_cache_key, get_market_statuses, get_breadth_history,
+    get_correlation_matrix, get_intraday_market_data, refresh_intraday, TREND_LABELS, OPEN_MARKET_TTL
+)
+from intraday import get_intraday_store
+from cache_backend import get_cache_backend
+from refresh_scheduler import SnapshotScheduler
+from snapshot_file import open_snapshot_file
+from history_store import get_history_store
+from instrument_registry import get_registry
+from market_breadth import snapshot_breadth
+from market_correlation import CORRELATION_WINDOWS
+from map_renderer import MapRenderer
+from fetch_scheduler import get_fetch_scheduler
+from telemetry import get_telemetry, start_metrics_server, METRICS_HOST, METRICS_PORT
 
 # Configuración de la página
 st.set_page_config(
@@ -12,224 +28,67 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# Configuración de mercados principales
-MARKETS_CONFIG = {
-    '^GSPC': {  # S&P 500
-        'name': 'S&P 500 (NYSE)',
-        'country': 'United States',
-        'timezone': 'America/New_York',
-        'lat': 40.7128,
-        'lon': -74.0060,
-        'region': 'América del Norte'
-    },
-    '^IXIC': {  # NASDAQ
-        'name': 'NASDAQ',
-        'country': 'United States',
-        'timezone': 'America/New_York',
-        'lat': 40.7589,
-        'lon': -73.9851,
-        'region': 'América del Norte'
-    },
-    '^FTSE': {  # FTSE 100
-        'name': 'FTSE 100 (Londres)',
-        'country': 'United Kingdom',
-        'timezone': 'Europe/London',
-        'lat': 51.5074,
-        'lon': -0.1278,
-        'region': 'Europa'
-    },
-    '^GDAXI': {  # DAX
-        'name': 'DAX (Frankfurt)',
-        'country': 'Germany',
-        'timezone': 'Europe/Berlin',
-        'lat': 50.1109,
-        'lon': 8.6821,
-        'region': 'Europa'
-    },
-    '^FCHI': {  # CAC 40
-        'name': 'CAC 40 (París)',
-        'country': 'France',
-        'timezone': 'Europe/Paris',
-        'lat': 48.8566,
-        'lon': 2.3522,
-        'region': 'Europa'
-    },
-    '^IBEX': {  # IBEX 35
-        'name': 'IBEX 35 (Madrid)',
-        'country': 'Spain',
-        'timezone': 'Europe/Madrid',
-        'lat': 40.4168,
-        'lon': -3.7038,
-        'region': 'Europa'
-    },
-    '^N225': {  # Nikkei 225
-        'name': 'Nikkei 225 (Tokio)',
-        'country': 'Japan',
-        'timezone': 'Asia/Tokyo',
-        'lat': 35.6762,
-        'lon': 139.6503,
-        'region': 'Asia-Pacífico'
-    },
-    '000001.SS': {  # Shanghai Composite
-        'name': 'Shanghai Composite',
-        'country': 'China',
-        'timezone': 'Asia/Shanghai',
-        'lat': 31.2304,
-        'lon': 121.4737,
-        'region': 'Asia-Pacífico'
-    },
-    '^HSI': {  # Hang Seng
-        'name': 'Hang Seng (Hong Kong)',
-        'country': 'Hong Kong',
-        'timezone': 'Asia/Hong_Kong',
-        'lat': 22.3193,
-        'lon': 114.1694,
-        'region': 'Asia-Pacífico'
-    },
-    '^BVSP': {  # Bovespa
-        'name': 'Bovespa (São Paulo)',
-        'country': 'Brazil',
-        'timezone': 'America/Sao_Paulo',
-        'lat': -23.5505,
-        'lon': -46.6333,
-        'region': 'América Latina'
-    },
-    '^GSPTSE': {  # TSX
-        'name': 'TSX (Toronto)',
-        'country': 'Canada',
-        'timezone': 'America/Toronto',
-        'lat': 43.6532,
-        'lon': -79.3832,
-        'region': 'América del Norte'
-    },
-    '^AXJO': {  # ASX 200
-        'name': 'ASX 200 (Sídney)',
-        'country': 'Australia',
-        'timezone': 'Australia/Sydney',
-        'lat': -33.8688,
-        'lon': 151.2093,
-        'region': 'Asia-Pacífico'
-    }
+# Modo en vivo: fragmentos que se vuelven a ejecutar solos (st.fragment desde Streamlit 1.37)
+LIVE_FRAGMENT = getattr(st, 'fragment', None) or getattr(st, 'experimental_fragment', None)
+LIVE_REFRESH_INTERVAL = 30  # Segundos entre refrescos por defecto
+HANDOVER_INTERVAL = 10      # Sin modo en vivo, cada cuánto se mira si hay datos en vivo o barras intradía nuevas
+COLD_START_TIMEOUT = 120    # Sin ningún snapshot guardado, cuánto se espera al primer refresco (segundos)
+REFRESH_BUTTON_TIMEOUT = 30 # Cuánto espera el botón de actualizar al hilo de refresco (segundos)
+
+# Tabla detallada: filas por página y columnas por las que se puede ordenar
+TABLE_PAGE_SIZES = (25, 50, 100, 500)
+TABLE_SORT_COLUMNS = ('Cambio (%)', 'Precio', 'Mercado', 'Región', 'RSI 14', 'Volatilidad 20d', 'Desde máx. 52s')
+
+# Columnas de indicadores técnicos de la tabla (clave en los datos del mercado -> columna)
+INDICATOR_LABELS = {
+    'ma20': 'MA20',
+    'ma50': 'MA50',
+    'ma200': 'Valor MA200',
+    'rsi14': 'RSI 14',
+    'volatility20': 'Volatilidad 20d',
+    'atr14': 'ATR 14',
+    'drawdown': 'Desde máx. 52s'
 }
 
-@st.cache_data(ttl=300)  # Cache por 5 minutos
-def get_single_market_data(symbol):
-    """Obtiene datos de un mercado específico"""
-    try:
-        ticker = yf.Ticker(symbol)
-        
-        # Obtener datos históricos
-        hist = ticker.history(period="1y")
-        
-        if hist.empty:
-            return None
-        
-        # Datos actuales
-        current_price = hist['Close'].iloc[-1]
-        previous_close = hist['Close'].iloc[-2] if len(hist) > 1 else current_price
-        
-        # Calcular cambio porcentual
-        change_percent = ((current_price - previous_close) / previous_close) * 100
-        
-        # Calcular MA200 si hay suficientes datos
-        if len(hist) >= 200:
-            ma200 = hist['Close'].rolling(window=200).mean().iloc[-1]
-            ma200_trend = "📈 Alcista" if current_price > ma200 else "📉 Bajista"
-        else:
-            ma200_trend = "📊 Sin datos"
-        
-        return {
-            'price': float(current_price),
-            'change_percent': float(change_percent),
-            'ma200_trend': ma200_trend,
-            'volume': float(hist['Volume'].iloc[-1]) if not hist['Volume'].empty else 0,
-            'last_update': datetime.now().strftime('%H:%M:%S')
-        }
-        
-    except Exception as e:
-        st.error(f"Error obteniendo datos para {symbol}: {str(e)}")
-        return None
+# Datos preparados para pintar las secciones de mercado de una sesión
+MarketView = namedtuple('MarketView', ['key', 'snapshot', 'market_data', 'market_status', 'map_html', 'table'])
 
-def get_market_data():
-    """Obtiene datos de todos los mercados configurados"""
-    market_data = {}
-    
-    # Crear barra de progreso
-    progress_bar = st.progress(0)
-    status_text = st.empty()
-    
-    total_markets = len(MARKETS_CONFIG)
-    successful_requests = 0
+# Configuración de mercados (vista del registro de instrumentos, instruments.csv)
+MARKETS_CONFIG = get_registry().as_config()
+
+@st.cache_resource
+def get_snapshot_scheduler():
+    """Planificador de refresco en segundo plano, compartido por todas las sesiones
+    
+    El último snapshot conocido (el de la caché compartida, aunque haya caducado,
+    o el precalculado con snapshot_file.py si es más reciente) se publica al
+    momento para pintar sin esperar a la red. El histórico del precalculado se
+    vuelca al almacén antes del primer refresco real, que así solo descarga las
+    barras nuevas. El mismo hilo descarga las barras intradía que piden las sesiones.
+    """
+    snapshot_file = open_snapshot_file()
+    scheduler = SnapshotScheduler(
+        load_market_snapshot,
+        warmup=(lambda: snapshot_file.seed_history_store(get_history_store())) if snapshot_file else None,
+        tasks=(refresh_intraday,)
+    )
     
-    for i, symbol in enumerate(MARKETS_CONFIG.keys()):
-        status_text.text(f'📡 Obteniendo datos de {MARKETS_CONFIG[symbol]["name"]}...')
-        progress_bar.progress((i + 1) / total_markets)
-        
-        data = get_single_market_data(symbol)
-        if data:
-            market_data[symbol] = data
-            successful_requests += 1
-        else:
-            market_data[symbol] = None
-    
-    # Limpiar elementos de progreso
-    progress_bar.empty()
-    status_text.empty()
-    
-    # Mostrar resultado
-    if successful_requests > 0:
-        st.success(f"✅ Datos obtenidos exitosamente de {successful_requests}/{total_markets} mercados")
-    else:
-        st.error("❌ No se pudieron obtener datos de ningún mercado")
+    saved = []
+    entry = get_cache_backend().get(snapshot_cache_key(True))
+    if entry is not None and entry.value:
+        saved.append((entry.created_at, 'cache', entry.value))
+    if snapshot_file is not None:
+        saved.append((snapshot_file.created_at, 'file', snapshot_file.market_data(TREND_LABELS)))
+    
+    if saved:
+        created_at, source, market_data = max(saved, key=lambda item: item[0])
+        scheduler.seed(
+            {symbol: market_data.get(symbol) for symbol in MARKETS_CONFIG.keys()},
+            datetime.fromtimestamp(created_at),
+            source=source
+        )
     
-    return market_data
-
-def get_market_status(timezone_str):
-    """Determina si un mercado está abierto o cerrado"""
-    try:
-        # Zona horaria del mercado
-        market_tz = pytz.timezone(timezone_str)
-        now_market = datetime.now(market_tz)
-        
-        # Obtener día de la semana (0=lunes, 6=domingo)
-        weekday = now_market.weekday()
-        
-        # Mercados cerrados en fin de semana
-        if weekday >= 5:  # Sábado o domingo
-            return {
-                'is_open': False,
-                'status': 'Cerrado (Fin de semana)',
-                'next_action': 'Abre el lunes'
-            }
-        
-        # Horarios aproximados (9:00 - 17:00)
-        current_hour = now_market.hour
-        
-        if 9 <= current_hour <= 17:
-            return {
-                'is_open': True,
-                'status': 'Abierto',
-                'next_action': f'Cierra a las 17:00'
-            }
-        elif current_hour < 9:
-            return {
-                'is_open': False,
-                'status': 'Pre-mercado',
-                'next_action': f'Abre a las 09:00'
-            }
-        else:
-            return {
-                'is_open': False,
-                'status': 'Post-mercado',
-                'next_action': f'Abre mañana a las 09:00'
-            }
-            
-    except Exception as e:
-        return {
-            'is_open': False,
-            'status': 'Estado desconocido',
-            'next_action': 'Verificar zona horaria'
-        }
+    return scheduler.start()
 
 def get_emoji_by_change(change_pct):
     """Determina el emoji según el cambio porcentual"""
@@ -242,6 +101,14 @@ def get_emoji_by_change(change_pct):
     else:
         return "🌩️"  # Bajada fuerte
 
+def emojis_by_change(changes):
+    """get_emoji_by_change sobre un array de cambios (sin bucle por fila)"""
+    return np.select(
+        [changes > 1, changes > 0, changes > -1],
+        ["☀️", "🌤️", "☁️"],
+        default="🌩️"
+    )
+
 def get_color_by_change(change_pct):
     """Determina el color según el cambio porcentual"""
     if change_pct > 1:
@@ -253,83 +120,39 @@ def get_color_by_change(change_pct):
     else:
         return "#FF1744"  # Rojo fuerte
 
-def create_world_map_alternative(market_data):
-    """Mapa mundial simplificado usando emojis y HTML"""
+@st.cache_resource
+def get_map_renderer():
+    """Renderizador del mapa con caché de tarjetas, compartido por todas las sesiones"""
+    return MapRenderer(get_emoji_by_change, get_color_by_change)
+
+def build_world_map_html(market_data, market_status):
+    """HTML del mapa mundial (solo se regeneran las tarjetas que han cambiado)"""
+    # Organizar por regiones (agrupación precomputada en el registro de instrumentos)
+    regions = get_registry().groups('map_region', symbols=market_data.keys())
+    names = {symbol: config['name'] for symbol, config in MARKETS_CONFIG.items()}
     
-    st.markdown("### 🌍 Vista Global de Mercados")
+    return get_map_renderer().render(regions, market_data, market_status, names)
+
+def create_world_map_alternative(market_data, market_status=None, map_html=None):
+    """Mapa mundial simplificado usando emojis y HTML"""
     
-    # Crear un mapa de texto estilizado
-    map_html = """
-    <div style="background: linear-gradient(180deg, #e3f2fd 0%, #bbdefb 100%); 
-                border-radius: 15px; padding: 30px; margin: 20px 0;">
-        <h3 style="text-align: center; color: #1976d2; margin-bottom: 30px;">
-            🌍 Estado Global de Mercados Bursátiles
-        </h3>
-    """
+    # Estado de sesión de todos los mercados (se calcula una vez por render)
+    if market_status is None:
+        market_status = get_market_statuses(MARKETS_CONFIG.keys())
     
-    # Organizar por regiones
-    regions = {
-        "🌅 Asia-Pacífico": ["^N225", "000001.SS", "^HSI", "^AXJO"],
-        "🌍 Europa": ["^FTSE", "^GDAXI", "^FCHI", "^IBEX"],
-        "🌎 América": ["^GSPC", "^IXIC", "^GSPTSE", "^BVSP"]
-    }
-    
-    for region_name, symbols in regions.items():
-        map_html += f"""
-        <div style="margin: 20px 0; padding: 20px; background: rgba(255,255,255,0.7); 
-                    border-radius: 10px; border-left: 5px solid #1976d2;">
-            <h4 style="color: #1976d2; margin-bottom: 15px;">{region_name}</h4>
-            <div style="display: flex; flex-wrap: wrap; gap: 15px; justify-content: center;">
-        """
-        
-        for symbol in symbols:
-            if symbol in market_data and market_data[symbol]:
-                data = market_data[symbol]
-                config = MARKETS_CONFIG[symbol]
-                
-                change_pct = data['change_percent']
-                weather_emoji = get_emoji_by_change(change_pct)
-                color = get_color_by_change(change_pct)
-                market_status = get_market_status(config['timezone'])
-                status_emoji = "🟢" if market_status['is_open'] else "🔴"
-                
-                market_name = config['name'].split('(')[0].strip()[:10]
-                
-                map_html += f"""
-                <div style="background: white; border-radius: 8px; padding: 15px; 
-                           min-width: 140px; text-align: center; border: 2px solid {color};
-                           box-shadow: 0 2px 4px rgba(0,0,0,0.1); cursor: pointer;
-                           transition: transform 0.2s;"
-                           onmouseover="this.style.transform='scale(1.05)'"
-                           onmouseout="this.style.transform='scale(1)'">
-                    <div style="font-size: 28px; margin-bottom: 5px;">{weather_emoji}</div>
-                    <div style="font-weight: bold; font-size: 12px; color: #333; margin-bottom: 5px;">
-                        {market_name}
-                    </div>
-                    <div style="color: {color}; font-weight: bold; font-size: 16px; margin-bottom: 5px;">
-                        {change_pct:+.2f}%
-                    </div>
-                    <div style="font-size: 12px; color: #666; margin-bottom: 3px;">
-                        ${data['price']:,.0f}
-                    </div>
-                    <div style="font-size: 10px; color: #888;">
-                        {status_emoji} {market_status['status'][:8]}
-                    </div>
-                </div>
-                """
-        
-        map_html += """
-            </div>
-        </div>
-        """
+    st.markdown("### 🌍 Vista Global de Mercados")
     
-    map_html += "</div>"
+    if map_html is None:
+        map_html = build_world_map_html(market_data, market_status)
     
     st.markdown(map_html, unsafe_allow_html=True)
 
-def create_summary_cards(market_data):
+def create_summary_cards(market_data, market_status=None):
     """Crea tarjetas resumen de los mercados"""
     
+    if market_status is None:
+        market_status = get_market_statuses(MARKETS_CONFIG.keys())
+    
     valid_data = [data for data in market_data.values() if data]
     
     if not valid_data:
@@ -345,7 +168,7 @@ def create_summary_cards(market_data):
     # Mercados abiertos
     open_markets = sum(1 for symbol in market_data.keys() 
                       if symbol in MARKETS_CONFIG and market_data[symbol] and
-                      get_market_status(MARKETS_CONFIG[symbol]['timezone'])['is_open'])
+                      market_status[symbol]['is_open'])
     
     total_markets = len(valid_data)
     
@@ -386,52 +209,356 @@ def create_summary_cards(market_data):
             delta=f"{open_markets/len(MARKETS_CONFIG)*100:.1f}%"
         )
 
-def create_detailed_table(market_data):
-    """Crea tabla detallada de mercados"""
+def create_breadth_summary(market_data):
+    """Muestra amplitud y sentimiento global calculados sobre el snapshot (sin descargas)"""
+    breadth = snapshot_breadth(market_data)
     
-    table_data = []
-    
-    for symbol, data in market_data.items():
-        if data and symbol in MARKETS_CONFIG:
-            config = MARKETS_CONFIG[symbol]
-            market_status = get_market_status(config['timezone'])
-            
-            table_data.append({
-                'Mercado': config['name'],
-                'Región': config['region'],
-                'Clima': get_emoji_by_change(data['change_percent']),
-                'Precio': f"${data['price']:,.2f}",
-                'Cambio (%)': f"{data['change_percent']:+.2f}%",
-                'MA200': data['ma200_trend'],
-                'Estado': "🟢 Abierto" if market_status['is_open'] else "🔴 Cerrado",
-                'Próxima Acción': market_status['next_action']
-            })
-    
-    if not table_data:
-        st.warning("⚠️ No hay datos disponibles para mostrar la tabla")
+    if breadth['total'] == 0:
         return
     
-    # Ordenar por cambio porcentual (descendente)
-    table_data.sort(key=lambda x: float(x['Cambio (%)'].replace('%', '').replace('+', '')), reverse=True)
+    ad_ratio = "—" if pd.isna(breadth['ad_ratio']) else f"{breadth['ad_ratio']:.2f}"
+    above_ma = "—" if pd.isna(breadth['above_ma200_ratio']) else f"{breadth['above_ma200_ratio']*100:.0f}%"
+    
+    st.markdown(
+        f"**🧭 Sentimiento global:** {breadth['sentiment']} · "
+        f"**Avances/Descensos:** {breadth['advancing']}/{breadth['declining']} (ratio {ad_ratio}) · "
+        f"**Sobre MA200:** {above_ma}"
+    )
+    
+    # Evolución diaria sobre el histórico guardado en disco
+    with st.expander("📈 Evolución de la amplitud del mercado"):
+        history = get_breadth_history(tuple(MARKETS_CONFIG.keys()))
+        
+        if history.empty:
+            st.info("Todavía no hay histórico guardado para calcular la evolución.")
+            return
+        
+        chart = history[['positive_ratio', 'above_ma200_ratio']].rename(columns={
+            'positive_ratio': '% mercados al alza',
+            'above_ma200_ratio': '% mercados sobre MA200'
+        }) * 100
+        st.line_chart(chart)
+        st.caption(f"Sentimiento de la última sesión: {history['sentiment'].iloc[-1]}")
+
+def create_correlation_heatmap(snapshot):
+    """Mapa de calor de la correlación móvil entre mercados (covarianza incremental compartida)"""
+    with st.expander("🔗 Correlación entre mercados"):
+        window = st.radio(
+            "Ventana (sesiones)", CORRELATION_WINDOWS, index=1, horizontal=True, key='correlation_window'
+        )
+        
+        # Con la misma versión del snapshot la matriz sale de la caché, sin leer el disco
+        matrix = get_correlation_matrix(tuple(MARKETS_CONFIG.keys()), window, version=snapshot.version)
+        ready = [symbol for symbol in matrix.index if not pd.isna(matrix.at[symbol, symbol])]
+        
+        if len(ready) < 2:
+            st.info(f"Todavía no hay histórico suficiente para la correlación a {window} sesiones.")
+            return
+        
+        import altair as alt
+        
+        names = [MARKETS_CONFIG[symbol]['name'] for symbol in ready]
+        values = matrix.loc[ready, ready].to_numpy()
+        cells = pd.DataFrame({
+            'Mercado': np.repeat(names, len(names)),
+            'Frente a': np.tile(names, len(names)),
+            'Correlación': values.ravel()
+        })
+        
+        chart = alt.Chart(cells).mark_rect().encode(
+            x=alt.X('Frente a:N', sort=names, title=None),
+            y=alt.Y('Mercado:N', sort=names, title=None),
+            color=alt.Color('Correlación:Q', scale=alt.Scale(scheme='redblue', domain=[-1, 1])),
+            tooltip=['Mercado', 'Frente a', alt.Tooltip('Correlación:Q', format='.2f')]
+        )
+        st.altair_chart(chart, use_container_width=True)
+        
+        missing = len(matrix) - len(ready)
+        st.caption(
+            f"Correlación de las rentabilidades diarias de las últimas {window} sesiones"
+            + (f"; {missing} mercados sin histórico suficiente" if missing else "")
+        )
+
+def numeric_column(rows, key):
+    """Campo numérico de varios mercados como array (NaN si falta, p. ej. en un snapshot antiguo)"""
+    return np.fromiter(
+        (np.nan if data.get(key) is None else data[key] for data in rows),
+        dtype=np.float64, count=len(rows)
+    )
+
+def build_detailed_table(market_data, market_status):
+    """Construye la tabla detallada tipada de mercados (None si no hay datos)
+    
+    Cada campo es una columna con su tipo (precio y cambio numéricos, región y
+    tendencia categóricas); el formato se aplica solo al mostrarla.
+    """
+    symbols = [symbol for symbol, data in market_data.items() if data and symbol in MARKETS_CONFIG]
+    
+    if not symbols:
+        return None
+    
+    registry = get_registry()
+    positions = np.fromiter((registry.position(symbol) for symbol in symbols), dtype=np.int64, count=len(symbols))
+    rows = [market_data[symbol] for symbol in symbols]
+    statuses = [market_status[symbol] for symbol in symbols]
+    
+    change = np.fromiter((data['change_percent'] for data in rows), dtype=np.float64, count=len(rows))
+    stale = np.fromiter((bool(data.get('stale')) for data in rows), dtype=bool, count=len(rows))
+    is_open = np.fromiter((status['is_open'] for status in statuses), dtype=bool, count=len(statuses))
+    names = np.asarray(registry.column('name'), dtype=object)[positions]
+    
+    table = pd.DataFrame({
+        'Mercado': np.where(stale, names + ' ⏳', names),
+        'Región': pd.Categorical(np.asarray(registry.column('region'), dtype=object)[positions]),
+        'Clima': emojis_by_change(change),
+        'Precio': np.fromiter((data['price'] for data in rows), dtype=np.float64, count=len(rows)),
+        'Cambio (%)': change,
+        'MA200': pd.Categorical([data['ma200_trend'] for data in rows]),
+        **{label: numeric_column(rows, key) for key, label in INDICATOR_LABELS.items()},
+        'Estado': pd.Categorical(np.where(is_open, "🟢 Abierto", "🔴 Cerrado")),
+        'Próxima Acción': [status['next_action'] for status in statuses]
+    })
+    
+    # Ordenar por cambio porcentual (descendente), directamente sobre la columna numérica
+    return table.sort_values('Cambio (%)', ascending=False, kind='stable', ignore_index=True)
+
+def filter_table(df):
+    """Controles de búsqueda, orden y paginación; devuelve solo las filas de la página
+    
+    El filtrado y la ordenación se hacen sobre las columnas tipadas y al
+    navegador solo llega la página visible, sea cual sea el tamaño del universo.
+    """
+    search_col, region_col, sort_col, size_col = st.columns([3, 3, 2, 1])
+    
+    query = search_col.text_input("🔎 Buscar mercado", key='table_query')
+    regions = region_col.multiselect("🌐 Regiones", list(df['Región'].cat.categories), key='table_regions')
+    sort_by = sort_col.selectbox("↕️ Ordenar por", TABLE_SORT_COLUMNS, key='table_sort')
+    page_size = size_col.selectbox("Filas", TABLE_PAGE_SIZES, index=1, key='table_page_size')
+    
+    mask = np.ones(len(df), dtype=bool)
+    if query:
+        mask &= df['Mercado'].str.contains(query, case=False, regex=False).to_numpy()
+    if regions:
+        mask &= df['Región'].isin(regions).to_numpy()
+    
+    filtered = df[mask]
+    if sort_by != 'Cambio (%)':
+        filtered = filtered.sort_values(sort_by, ascending=sort_by in ('Mercado', 'Región'), kind='stable')
+    
+    pages = max(1, -(-len(filtered) // page_size))
+    page = 1
+    if pages > 1:
+        page = st.number_input(f"Página (de {pages})", min_value=1, max_value=pages, value=1, key='table_page')
+        page = min(int(page), pages)
+    
+    start = (page - 1) * page_size
+    st.caption(f"{len(filtered)} de {len(df)} mercados · filas {min(start + 1, len(filtered))}-"
+               f"{min(start + page_size, len(filtered))}")
+    
+    return filtered.iloc[start:start + page_size]
+
+def create_detailed_table(market_data, market_status=None, table=None):
+    """Crea tabla detallada de mercados"""
+    
+    if market_status is None:
+        market_status = get_market_statuses(MARKETS_CONFIG.keys())
+    
+    df = table if table is not None else build_detailed_table(market_data, market_status)
     
-    df = pd.DataFrame(table_data)
+    if df is None:
+        st.warning("⚠️ No hay datos disponibles para mostrar la tabla")
+        return
     
-    # Mostrar tabla con estilo
+    # Mostrar tabla con estilo (formato numérico aplicado en el navegador)
     st.dataframe(
-        df,
+        filter_table(df),
         use_container_width=True,
         hide_index=True,
         column_config={
             'Clima': st.column_config.TextColumn('🌤️', width="small"),
-            'Cambio (%)': st.column_config.TextColumn('📈 Cambio (%)', width="medium"),
+            'Precio': st.column_config.NumberColumn('Precio', format="$%.2f"),
+            'Cambio (%)': st.column_config.NumberColumn('📈 Cambio (%)', format="%+.2f%%", width="medium"),
             'MA200': st.column_config.TextColumn('📊 MA200', width="medium"),
+            'MA20': st.column_config.NumberColumn('MA20', format="%.2f"),
+            'MA50': st.column_config.NumberColumn('MA50', format="%.2f"),
+            'Valor MA200': st.column_config.NumberColumn('Valor MA200', format="%.2f"),
+            'RSI 14': st.column_config.NumberColumn('RSI (14)', format="%.1f", help="Índice de fuerza relativa de Wilder, 14 sesiones"),
+            'Volatilidad 20d': st.column_config.NumberColumn('Volatilidad 20d', format="%.1f%%", help="Volatilidad realizada anualizada de 20 sesiones"),
+            'ATR 14': st.column_config.NumberColumn('ATR (14)', format="%.2f", help="Rango verdadero medio de Wilder, 14 sesiones"),
+            'Desde máx. 52s': st.column_config.NumberColumn('📉 Desde máx. 52s', format="%.1f%%", help="Distancia del último cierre al máximo de 52 semanas"),
             'Estado': st.column_config.TextColumn('🚦 Estado', width="medium")
         }
     )
 
+def get_market_view(snapshot):
+    """Datos listos para pintar las secciones de mercado
+    
+    Se guardan en la sesión y solo se recalculan cuando cambia la versión del
+    snapshot, la de los buffers intradía (en modo intradía) o el estado de sesión
+    de algún mercado; si no, el refresco en vivo reutiliza el mapa y la tabla.
+    """
+    market_status = get_market_statuses(MARKETS_CONFIG.keys())
+    market_data = snapshot.market_data
+    intraday_version = None
+    
+    # Modo intradía: los mercados abiertos se pintan desde su última barra de 1 minuto.
+    # Solo se leen los buffers; si se piden símbolos nuevos se adelanta el hilo de refresco
+    if st.session_state.get('intraday_mode'):
+        open_symbols = tuple(symbol for symbol, status in market_status.items() if status['is_open'])
+        if get_intraday_store().request(open_symbols):
+            get_snapshot_scheduler().request_refresh()
+        intraday_data = get_intraday_market_data(open_symbols, labels=TREND_LABELS)
+        # Precio, cambio y tendencia salen de la barra intradía; los indicadores son los diarios
+        market_data = {**market_data, **{
+            symbol: {**{key: (market_data.get(symbol) or {}).get(key) for key in INDICATOR_LABELS}, **data}
+            for symbol, data in intraday_data.items()
+        }}
+        intraday_version = get_intraday_store().version
+    
+    key = (snapshot.version, intraday_version, tuple(
+        (symbol, status['is_open'], status['status'], status['next_action'])
+        for symbol, status in market_status.items()
+    ))
+    
+    view = st.session_state.get('market_view')
+    if view is not None and view.key == key:
+        return view
+    
+    telemetry = get_telemetry()
+    with telemetry.timer('render', 'map_html'):
+        map_html = build_world_map_html(market_data, market_status)
+    with telemetry.timer('render', 'table_data'):
+        table = build_detailed_table(market_data, market_status)
+    
+    view = MarketView(
+        key=key,
+        snapshot=snapshot,
+        market_data=market_data,
+        market_status=market_status,
+        map_html=map_html,
+        table=table
+    )
+    st.session_state['market_view'] = view
+    return view
+
+def get_current_snapshot():
+    """Último snapshot publicado (o el último que vio esta sesión si se está regenerando)"""
+    snapshot = get_snapshot_scheduler().latest()
+    if snapshot is not None:
+        st.session_state['snapshot'] = snapshot
+        return snapshot
+    return st.session_state.get('snapshot')
+
+def render_summary_and_map():
+    """Sección de tarjetas resumen, sentimiento y mapa"""
+    view = get_market_view(get_current_snapshot())
+    market_data = view.market_data
+    
+    telemetry = get_telemetry()
+    
+    # Tarjetas resumen
+    st.markdown("### 📊 Resumen Global")
+    with telemetry.timer('render', 'summary'):
+        create_summary_cards(market_data, view.market_status)
+        create_breadth_summary(market_data)
+    with telemetry.timer('render', 'correlation'):
+        create_correlation_heatmap(view.snapshot)
+    st.caption(f"⏰ Datos de las {view.snapshot.created_at.strftime('%H:%M:%S')} (versión {view.snapshot.version})")
+    
+    if view.snapshot.source != 'live':
+        st.info("📦 Mostrando el último snapshot guardado; los datos en vivo se están descargando en segundo plano")
+    
+    # Mercados cuya descarga falló: se muestra su último dato bueno
+    stale = [
+        f"{MARKETS_CONFIG[symbol]['name']} ({data['as_of']})"
+        for symbol, data in market_data.items() if data and data.get('stale')
+    ]
+    if stale:
+        st.warning(f"⏳ Sin actualizar, se muestra el último dato bueno: {', '.join(stale)}")
+    
+    st.markdown("---")
+    
+    # Mapa visual alternativo
+    with telemetry.timer('render', 'map'):
+        create_world_map_alternative(market_data, view.market_status, map_html=view.map_html)
+
+def render_market_table():
+    """Sección de la tabla detallada"""
+    view = get_market_view(get_current_snapshot())
+    
+    st.markdown("### 📋 Análisis Detallado por Mercado")
+    with get_telemetry().timer('render', 'table'):
+        create_detailed_table(view.market_data, view.market_status, table=view.table)
+
+@st.cache_resource
+def get_metrics_server():
+    """Endpoint de métricas Prometheus del proceso (None si está desactivado o el puerto está ocupado)"""
+    return start_metrics_server()
+
+def create_telemetry_summary():
+    """Tiempos por etapa, uso de la caché y latencia del proveedor de este proceso"""
+    telemetry = get_telemetry()
+    counters = telemetry.counters()
+    
+    stages = telemetry.stages()
+    if stages:
+        st.markdown("**⏱️ Tiempo por etapa (ms):**")
+        st.dataframe(
+            pd.DataFrame([
+                {'Etapa': stage, 'Paso': step, 'Llamadas': values['count'],
+                 'Media': values['mean'] * 1000, 'Máximo': values['max'] * 1000,
+                 'Última': values['last'] * 1000}
+                for (stage, step), values in stages.items()
+            ]).round(2),
+            hide_index=True
+        )
+    
+    cache = telemetry.cache_ratios()
+    if cache:
+        st.markdown("**🗄️ Caché compartida:**")
+        st.dataframe(
+            pd.DataFrame([
+                {'Espacio': namespace, 'Aciertos': values['hit'], 'Stale': values['stale'],
+                 'Negativos': values['negative'], 'Fallos': values['miss'],
+                 '% servido de caché': round(values['hit_ratio'] * 100, 1)}
+                for namespace, values in cache.items()
+            ]),
+            hide_index=True
+        )
+    
+    slowest = ", ".join(
+        f"{MARKETS_CONFIG.get(symbol, {}).get('name', symbol)} ({mean * 1000:.0f} ms)"
+        for symbol, mean, _ in telemetry.slowest_symbols()
+    )
+    open_circuits = ", ".join(
+        MARKETS_CONFIG.get(symbol, {}).get('name', symbol) for symbol in get_fetch_scheduler().breaker.open_symbols()
+    )
+    server = get_metrics_server()
+    st.markdown(f"""
+    **📡 Proveedor de datos:**
+    - Peticiones: {counters['upstream_requests']} ({counters['upstream_errors']} fallidas)
+    - Circuitos abiertos: {open_circuits or "ninguno"}
+    - Datos recibidos: {counters['upstream_bytes'] / 1024:,.0f} KB
+    - Mayor latencia media: {slowest or "—"}
+    - Métricas Prometheus: {f"`http://{METRICS_HOST}:{METRICS_PORT}/metrics`" if server else "desactivadas"}
+    """)
+
+def live_section(render_fn, interval=None):
+    """Envuelve una sección como fragmento que se vuelve a ejecutar cada `interval` segundos
+    
+    Sin intervalo (o con una versión de Streamlit sin fragmentos) se pinta una sola vez.
+    """
+    if interval and LIVE_FRAGMENT is not None:
+        return LIVE_FRAGMENT(render_fn, run_every=interval)
+    return render_fn
+
 def main():
     """Función principal de la aplicación"""
     
+    # Los datos se refrescan en segundo plano; la página solo lee el último snapshot
+    scheduler = get_snapshot_scheduler()
+    get_metrics_server()
+    
     # Título principal
     st.title("🌍 Mapa Financiero Mundial")
     st.markdown("### Tu radar bursátil global en tiempo real")
@@ -459,16 +586,60 @@ def main():
         st.markdown("---")
         st.info("💡 **Versión Estable**: Funciona completamente con dependencias mínimas.")
         
+        # Modo en vivo: solo las secciones con datos se vuelven a ejecutar
+        live_mode = st.toggle(
+            "⚡ Modo en vivo",
+            value=False,
+            disabled=LIVE_FRAGMENT is None,
+            help="Actualiza resumen, mapa y tabla sin recargar la página" if LIVE_FRAGMENT
+                 else "Requiere Streamlit 1.37 o superior"
+        )
+        live_interval = st.slider(
+            "⏱️ Intervalo de refresco (s)",
+            min_value=10, max_value=300, value=LIVE_REFRESH_INTERVAL, step=10,
+            disabled=not live_mode
+        )
+        live_interval = live_interval if live_mode else None
+        
+        # Modo intradía: barras de 1 minuto de la sesión en curso para los mercados abiertos
+        st.toggle(
+            "📉 Modo intradía (1 minuto)",
+            key='intraday_mode',
+            help="Precio y cambio desde la última barra de 1 minuto, con sparkline de la sesión"
+        )
+        
         # Botón de actualización
         if st.button("🔄 Actualizar Datos", type="primary"):
-            st.cache_data.clear()
+            # Solo se invalidan los mercados que no se han refrescado recientemente; la
+            # reconstrucción la hace el hilo de refresco (una sola aunque pulsen varias sesiones)
+            # y la página solo espera a que termine
+            with st.spinner("🔄 Actualizando mercados..."):
+                if invalidate_markets(MARKETS_CONFIG.keys()):
+                    scheduler.request_refresh(wait=REFRESH_BUTTON_TIMEOUT)
             st.rerun()
         
-        st.markdown(f"**⏰ Última actualización:**  \n{datetime.now().strftime('%H:%M:%S')}")
+        snapshot = scheduler.latest()
+        last_update = snapshot.created_at if snapshot else datetime.now()
+        st.markdown(f"**⏰ Última actualización:**  \n{last_update.strftime('%H:%M:%S')}")
+    
+    # Arranque en frío sin nada guardado: única situación en la que la página espera a
+    # la descarga, que hace el hilo de refresco (la página nunca carga el proveedor de datos)
+    if snapshot is None:
+        with st.spinner("📡 Conectando con mercados financieros globales..."):
+            snapshot = scheduler.wait(COLD_START_TIMEOUT)
+    
+    if snapshot is None:
+        st.error("❌ No se pudieron obtener datos de mercado. Intenta nuevamente en unos minutos.")
+        st.info("💡 Esto puede deberse a limitaciones de la API o problemas de conectividad.")
+        return
     
-    # Mostrar mensaje de carga
-    with st.spinner("📡 Conectando con mercados financieros globales..."):
-        market_data = get_market_data()
+    st.session_state['snapshot'] = snapshot
+    market_data = snapshot.market_data
+    
+    # Arranque desde un snapshot guardado (hasta recibir datos en vivo) o modo intradía (barras
+    # que llegan en segundo plano): las secciones se refrescan solas aunque no esté el modo en vivo
+    waiting = snapshot.source != 'live' or st.session_state.get('intraday_mode')
+    section_interval = live_interval or (HANDOVER_INTERVAL if waiting else None)
     
     # Verificar si hay datos
     valid_data_count = sum(1 for data in market_data.values() if data)
@@ -478,14 +649,8 @@ def main():
         st.info("💡 Esto puede deberse a limitaciones de la API o problemas de conectividad.")
         return
     
-    # Tarjetas resumen
-    st.markdown("### 📊 Resumen Global")
-    create_summary_cards(market_data)
-    
-    st.markdown("---")
-    
-    # Mapa visual alternativo
-    create_world_map_alternative(market_data)
+    # Resumen y mapa (fragmento independiente en modo en vivo)
+    live_section(render_summary_and_map, section_interval)()
     
     # Leyenda explicativa
     st.markdown("---")
@@ -499,9 +664,8 @@ def main():
     
     st.markdown("---")
     
-    # Tabla detallada
-    st.markdown("### 📋 Análisis Detallado por Mercado")
-    create_detailed_table(market_data)
+    # Tabla detallada (fragmento independiente en modo en vivo)
+    live_section(render_market_table, section_interval)()
     
     # Footer informativo
     st.markdown("---")
@@ -521,14 +685,18 @@ def main():
         - Mercados configurados: {len(MARKETS_CONFIG)}
         - Datos obtenidos exitosamente: {valid_data_count}
         - Tasa de éxito: {valid_data_count/len(MARKETS_CONFIG)*100:.1f}%
-        - Última actualización: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+        - Última actualización: {snapshot.created_at.strftime('%Y-%m-%d %H:%M:%S')}
+        - Versión del snapshot: {snapshot.version}
+        - Modo en vivo: {f"cada {live_interval} s" if live_interval else "desactivado"}
         
         **🔧 Características técnicas:**
-        - Cache inteligente de 5 minutos
+        - Caché compartida con caducidad según la sesión: cada {OPEN_MARKET_TTL} s con el mercado abierto, hasta la próxima apertura si está cerrado
         - Manejo robusto de errores
         - Interfaz responsive
         - Sin dependencias problemáticas
         """)
+        
+        create_telemetry_summary()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,403 @@
+"""Benchmark de las etapas de descarga, cálculo y render sobre universos sintéticos
+
+Cada tamaño de universo se mide en un proceso aparte: el registro de
+instrumentos y la configuración de mercados se leen al importar los módulos,
+así que el proceso hijo apunta antes las variables de entorno a un
+instruments.csv sintético y a un proveedor de reproducción (sin red).
+
+    python benchmark.py                          # 15, 500 y 5000 instrumentos
+    python benchmark.py --sizes 15,500 --repeat 3
+    python benchmark.py --compare benchmarks/anterior.json
+"""
+import argparse
+import csv
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Tamaños de universo y repeticiones por etapa por defecto
+DEFAULT_SIZES = (15, 500, 5000)
+DEFAULT_REPEAT = 5
+
+# Dónde se guardan los resultados y los ficheros sintéticos (reutilizados entre
+# ejecuciones, fuera del repositorio)
+RESULTS_DIR = os.environ.get(
+    'MAPA_BENCHMARK_RESULTS',
+    os.path.join(tempfile.gettempdir(), 'mapa_benchmark_results')
+)
+FIXTURES_DIR = os.environ.get(
+    'MAPA_BENCHMARK_FIXTURES',
+    os.path.join(tempfile.gettempdir(), 'mapa_benchmark_fixtures')
+)
+
+# Histórico sintético: un año de sesiones hasta el último día hábil (la ventana
+# de históricos se cuenta desde hoy, así que cada día se reescriben en el mismo sitio)
+SYNTHETIC_SESSIONS = 260
+SYNTHETIC_SEED = 42
+
+# Percentiles que se informan y empeoramiento de la mediana que se marca como regresión
+PERCENTILES = (50, 90, 99)
+REGRESSION_THRESHOLD = 1.2
+
+
+def percentiles(samples):
+    """p50/p90/p99 y media en milisegundos"""
+    values = np.asarray(samples, dtype=float) * 1000
+    result = {f'p{p}': float(np.percentile(values, p)) for p in PERCENTILES}
+    result['mean'] = float(values.mean())
+    result['samples'] = len(values)
+    return result
+
+
+def synthetic_symbol(index):
+    return f'SYN{index:05d}'
+
+
+def write_instruments(size, path):
+    """instruments.csv sintético: repite husos y sesiones de los mercados reales"""
+    with open(os.path.join(ROOT, 'instruments.csv'), newline='', encoding='utf-8') as handle:
+        reader = csv.DictReader(handle)
+        fieldnames = reader.fieldnames
+        templates = list(reader)
+
+    with open(path, 'w', newline='', encoding='utf-8') as handle:
+        writer = csv.DictWriter(handle, fieldnames=fieldnames)
+        writer.writeheader()
+        for index in range(size):
+            row = dict(templates[index % len(templates)])
+            row['symbol'] = synthetic_symbol(index)
+            row['name'] = f"{row['name'].split('(')[0].strip()} #{index}"
+            writer.writerow(row)
+
+
+def synthetic_end():
+    """Último día hábil anterior a hoy"""
+    return (pd.Timestamp.today().normalize() - pd.offsets.BDay(1)).date()
+
+
+def synthetic_history(index, seed=SYNTHETIC_SEED, end=None):
+    """Paseo aleatorio OHLCV de un año para un símbolo"""
+    rng = np.random.default_rng((seed, index))
+    dates = pd.bdate_range(end=end or synthetic_end(), periods=SYNTHETIC_SESSIONS)
+    close = 100 * np.exp(np.cumsum(rng.normal(0.0003, 0.012, len(dates))))
+    spread = np.abs(rng.normal(0, 0.006, len(dates))) * close
+
+    return pd.DataFrame({
+        'Open': close * (1 + rng.normal(0, 0.003, len(dates))),
+        'High': close + spread,
+        'Low': close - spread,
+        'Close': close,
+        'Volume': rng.integers(10 ** 5, 10 ** 7, len(dates)).astype(float)
+    }, index=dates)
+
+
+def fixtures_path(seed=SYNTHETIC_SEED):
+    """Directorio de los ficheros sintéticos de una semilla"""
+    return os.path.join(FIXTURES_DIR, f'seed-{seed}')
+
+
+def fixtures_end(path):
+    """Último día de los ficheros sintéticos de un directorio (None si no consta)"""
+    try:
+        with open(os.path.join(path, 'end.txt'), encoding='utf-8') as handle:
+            return handle.read().strip()
+    except OSError:
+        return None
+
+
+def ensure_fixtures(size, path, seed=SYNTHETIC_SEED):
+    """Genera (una vez al día) los ficheros de reproducción de los `size` primeros símbolos
+
+    El último día de los ficheros se apunta en `end.txt`: si ya no es el de hoy
+    se borran y se vuelven a generar en el mismo directorio.
+    """
+    from data_providers import fixture_name
+
+    end = synthetic_end()
+    if os.path.exists(path) and fixtures_end(path) != end.isoformat():
+        shutil.rmtree(path)
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, 'end.txt'), 'w', encoding='utf-8') as handle:
+        handle.write(end.isoformat())
+
+    try:
+        import pyarrow  # noqa: F401
+        extension = '.parquet'
+    except ImportError:
+        extension = '.csv'
+
+    for index in range(size):
+        base = os.path.join(path, fixture_name(synthetic_symbol(index)))
+        if os.path.exists(base + '.parquet') or os.path.exists(base + '.csv'):
+            continue
+        frame = synthetic_history(index, seed, end)
+        if extension == '.parquet':
+            frame.to_parquet(base + extension)
+        else:
+            frame.to_csv(base + extension)
+
+    return path
+
+
+class StageTimer:
+    """Tiempos por etapa y pico de memoria (tracemalloc) en una pasada aparte"""
+
+    def __init__(self, repeat):
+        self.repeat = repeat
+        self.results = {}
+
+    def run(self, name, fn, setup=None, repeat=None):
+        samples = []
+        for _ in range(repeat or self.repeat):
+            if setup:
+                setup()
+            start = time.perf_counter()
+            fn()
+            samples.append(time.perf_counter() - start)
+
+        # tracemalloc ralentiza la ejecución: la memoria se mide sin cronometrar
+        if setup:
+            setup()
+        tracemalloc.start()
+        try:
+            fn()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        self.results[name] = {**percentiles(samples), 'peak_kb': peak / 1024}
+        return self.results[name]
+
+
+def run_child(size, repeat, latency, failure_rate, output):
+    """Mide todas las etapas para un universo de `size` instrumentos (proceso hijo)
+
+    Los ficheros de la medición (instrumentos y almacenes SQLite) van a un
+    directorio temporal que se borra al terminar, aunque la medición falle.
+    """
+    with tempfile.TemporaryDirectory(prefix='mapa_benchmark_', ignore_cleanup_errors=True) as workdir:
+        measure(size, repeat, latency, failure_rate, output, workdir)
+
+
+def measure(size, repeat, latency, failure_rate, output, workdir):
+    """Etapas del proceso hijo sobre un directorio de trabajo ya creado"""
+    instruments_path = os.path.join(workdir, 'instruments.csv')
+    write_instruments(size, instruments_path)
+
+    # Antes de importar los módulos del proyecto: leen la configuración al importarse
+    replay_path = fixtures_path()
+    os.environ.update({
+        'MAPA_INSTRUMENTS_PATH': instruments_path,
+        'MAPA_DATA_PROVIDER': 'replay',
+        'MAPA_REPLAY_PATH': replay_path,
+        'MAPA_REPLAY_LATENCY': str(latency),
+        'MAPA_REPLAY_FAILURE_RATE': str(failure_rate),
+        'MAPA_REPLAY_SEED': str(SYNTHETIC_SEED),
+        'MAPA_HISTORY_DB': os.path.join(workdir, 'history.sqlite'),
+        'MAPA_CACHE_BACKEND': 'memory',
+    })
+
+    ensure_fixtures(size, replay_path)
+
+    import resource
+    import app
+    import data_utils_module
+    from cache_backend import MemoryCacheBackend, set_cache_backend
+    from data_providers import ReplayProvider, set_data_provider
+    from history_store import HistoryStore, set_history_store
+    from market_breadth import history_breadth
+    from market_correlation import CorrelationTracker, CORRELATION_WINDOWS
+    from market_metrics import build_close_matrix
+
+    symbols = list(data_utils_module.MARKETS_CONFIG.keys())
+    timer = StageTimer(repeat)
+    runs = iter(range(10 ** 6))
+
+    def cold_caches():
+        """Caché, almacén de históricos y proveedor vacíos: primera carga del proceso"""
+        set_cache_backend(MemoryCacheBackend())
+        set_history_store(HistoryStore(os.path.join(workdir, f'history-{next(runs)}.sqlite')))
+        set_data_provider(ReplayProvider())
+
+    # El calendario de sesiones se construye una vez por proceso
+    timer.run('calendar_build', lambda: data_utils_module.get_market_statuses(symbols), repeat=1)
+
+    # Descarga: en frío (todo vacío) y en caliente (snapshot servido desde la caché)
+    timer.run('fetch_cold', lambda: data_utils_module.load_market_snapshot(), setup=cold_caches)
+    market_data = data_utils_module.load_market_snapshot()
+    timer.run('fetch_warm', lambda: data_utils_module.load_market_snapshot())
+
+    histories = {symbol: data_utils_module.get_history_store().load_window(symbol) for symbol in symbols}
+
+    # Cálculo de métricas sobre los históricos ya guardados
+    timer.run('metrics', lambda: data_utils_module.summarize_histories(histories))
+    timer.run('breadth_history', lambda: history_breadth(build_close_matrix(histories)))
+
+    # Correlación: construcción de todas las ventanas, una sesión nueva (incremental) y lectura en caché
+    close = build_close_matrix(histories)
+    tracker = None
+
+    def previous_session():
+        nonlocal tracker
+        tracker = CorrelationTracker(close.iloc[:-1], symbols)
+        for window in CORRELATION_WINDOWS:
+            tracker.correlation(window)
+
+    def correlations():
+        for window in CORRELATION_WINDOWS:
+            tracker.correlation(window)
+
+    timer.run('correlation_build', lambda: previous_session())
+    timer.run('correlation_update', lambda: (tracker.update(close.iloc[-1:]), correlations()),
+              setup=previous_session)
+    timer.run('correlation_warm', correlations)
+    timer.run('market_status', lambda: data_utils_module.get_market_statuses(symbols))
+    market_status = data_utils_module.get_market_statuses(symbols)
+
+    # Render (modo sin servidor de Streamlit: se mide la construcción de los elementos)
+    renderer = app.get_map_renderer()
+    timer.run('render_cards', lambda: app.create_summary_cards(market_data, market_status))
+    timer.run('render_map_cold', lambda: app.create_world_map_alternative(market_data, market_status),
+              setup=renderer.clear)
+    timer.run('render_map_warm', lambda: app.create_world_map_alternative(market_data, market_status))
+    timer.run('render_table', lambda: app.create_detailed_table(market_data, market_status))
+
+    result = {
+        'size': size,
+        'markets_with_data': sum(1 for data in market_data.values() if data),
+        'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'stages': timer.results
+    }
+
+    with open(output, 'w', encoding='utf-8') as handle:
+        json.dump(result, handle)
+
+
+def run_size(size, args):
+    """Lanza el proceso hijo de un tamaño y devuelve sus resultados"""
+    with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as handle:
+        output = handle.name
+
+    command = [
+        sys.executable, os.path.abspath(__file__), '--child',
+        '--size', str(size), '--repeat', str(args.repeat),
+        '--latency', str(args.latency), '--failure-rate', str(args.failure_rate),
+        '--child-output', output
+    ]
+    try:
+        # Sin servidor, Streamlit avisa de cada elemento: la salida solo se muestra si el hijo falla
+        completed = subprocess.run(command, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        if completed.returncode != 0:
+            sys.stderr.write(completed.stderr)
+            raise RuntimeError(f"El benchmark de {size} instrumentos ha fallado")
+
+        with open(output, encoding='utf-8') as handle:
+            return json.load(handle)
+    finally:
+        os.unlink(output)
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results):
+    print(f"{'tamaño':>7} {'etapa':<16} {'p50 ms':>10} {'p90 ms':>10} {'p99 ms':>10} {'pico KB':>10}")
+    for entry in results['runs']:
+        for stage, stats in entry['stages'].items():
+            print(f"{entry['size']:>7} {stage:<16} {stats['p50']:>10.2f} {stats['p90']:>10.2f} "
+                  f"{stats['p99']:>10.2f} {stats['peak_kb']:>10.0f}")
+        print(f"{entry['size']:>7} {'max RSS (KB)':<16} {entry['max_rss_kb']:>10}")
+
+
+def compare(results, baseline_path, threshold=REGRESSION_THRESHOLD):
+    """Compara la mediana de cada etapa con una ejecución anterior; devuelve las regresiones"""
+    with open(baseline_path, encoding='utf-8') as handle:
+        baseline = {entry['size']: entry['stages'] for entry in json.load(handle)['runs']}
+
+    regressions = []
+    print(f"\nComparación con {baseline_path} (p50, regresión si x{threshold:.2f} o más)")
+    for entry in results['runs']:
+        previous = baseline.get(entry['size'], {})
+        for stage, stats in entry['stages'].items():
+            if stage not in previous or not previous[stage]['p50']:
+                continue
+            ratio = stats['p50'] / previous[stage]['p50']
+            flag = '  <-- regresión' if ratio >= threshold else ''
+            print(f"{entry['size']:>7} {stage:<16} {previous[stage]['p50']:>10.2f} -> "
+                  f"{stats['p50']:>10.2f} ms  x{ratio:.2f}{flag}")
+            if ratio >= threshold:
+                regressions.append((entry['size'], stage, ratio))
+
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)),
+                        help='Tamaños de universo separados por comas')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help='Repeticiones por etapa')
+    parser.add_argument('--latency', type=float, default=0.0, help='Latencia por petición (segundos)')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='Probabilidad de fallo por petición')
+    parser.add_argument('--output', help=f'Fichero JSON de resultados (por defecto en {RESULTS_DIR})')
+    parser.add_argument('--compare', help='Resultados anteriores con los que comparar')
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD,
+                        help='Empeoramiento de p50 que cuenta como regresión')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--size', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--child-output', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        run_child(args.size, args.repeat, args.latency, args.failure_rate, args.child_output)
+        return 0
+
+    sizes = [int(size) for size in args.sizes.split(',') if size.strip()]
+    results = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'git_revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'repeat': args.repeat,
+        'latency': args.latency,
+        'failure_rate': args.failure_rate,
+        'runs': []
+    }
+
+    for size in sizes:
+        print(f"Midiendo {size} instrumentos...", file=sys.stderr)
+        results['runs'].append(run_size(size, args))
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"benchmark-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as handle:
+        json.dump(results, handle, indent=2)
+
+    print_results(results)
+    print(f"\nResultados guardados en {output}")
+
+    if args.compare and compare(results, args.compare, args.threshold):
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,497 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import uuid
+from collections import namedtuple
+from functools import wraps
+
+from telemetry import get_telemetry
+
+# Ubicación de la caché compartida por todos los procesos del host
+DEFAULT_CACHE_PATH = os.environ.get(
+    'MAPA_CACHE_DB',
+    os.path.join('.cache', 'mapa_bursatil', 'cache.sqlite')
+)
+
+# Backend por defecto: "sqlite" (compartido entre procesos) o "memory" (solo este proceso)
+DEFAULT_CACHE_BACKEND = os.environ.get('MAPA_CACHE_BACKEND', 'sqlite')
+
+# Tiempos por defecto (segundos)
+CACHE_TTL = 300          # Valor fresco: se sirve sin más
+CACHE_STALE_TTL = 3600   # Valor caducado que aún se sirve mientras se refresca
+LOCK_LEASE = 60          # Duración máxima del bloqueo de refresco de una clave
+LOCK_POLL_INTERVAL = 0.2
+MIN_REFRESH_INTERVAL = 30  # Un valor más reciente que esto no se invalida (evita refrescos en cascada)
+NEGATIVE_TTL = 30          # Tras un fallo no se vuelve a pedir la clave durante este tiempo
+
+# Las entradas negativas (fallos recientes) se guardan aparte de los datos buenos
+NEGATIVE_PREFIX = 'negative:'
+
+# Snapshot de todos los mercados en la caché compartida (lo escribe la aplicación y lo lee snapshot_api)
+SNAPSHOT_KEY_PREFIX = 'data_utils.market_snapshot'
+
+CacheEntry = namedtuple('CacheEntry', ['value', 'created_at', 'expires_at', 'stale_until'])
+
+
+class CacheBackend:
+    """Interfaz de un backend de caché con TTL, periodo stale y bloqueo por clave"""
+
+    def get(self, key):
+        """Devuelve la CacheEntry de una clave o None"""
+        raise NotImplementedError
+
+    def set(self, key, value, ttl=CACHE_TTL, stale_ttl=CACHE_STALE_TTL):
+        """Guarda un valor fresco durante ttl y utilizable como stale durante stale_ttl"""
+        raise NotImplementedError
+
+    def delete(self, key):
+        """Elimina una clave"""
+        raise NotImplementedError
+
+    def clear(self):
+        """Elimina todas las claves"""
+        raise NotImplementedError
+
+    def expire(self, key, min_age=0):
+        """Marca una clave como caducada (sigue sirviéndose como stale)
+
+        Si el valor tiene menos de min_age segundos se respeta y devuelve False;
+        en otro caso devuelve True (también si la clave no existe).
+        """
+        raise NotImplementedError
+
+    def expire_prefix(self, prefix, min_age=0):
+        """Marca como caducadas las claves que empiezan por prefix; devuelve cuántas"""
+        raise NotImplementedError
+
+    def acquire_lock(self, key, owner, lease=LOCK_LEASE):
+        """Intenta tomar el bloqueo de refresco de una clave; True si se consigue"""
+        raise NotImplementedError
+
+    def release_lock(self, key, owner):
+        """Libera el bloqueo de refresco si pertenece a owner"""
+        raise NotImplementedError
+
+
+class MemoryCacheBackend(CacheBackend):
+    """Caché en memoria del proceso (útil con una sola réplica)"""
+
+    def __init__(self):
+        self._entries = {}
+        self._locks = {}
+        self._mutex = threading.Lock()
+
+    def get(self, key):
+        with self._mutex:
+            return self._entries.get(key)
+
+    def set(self, key, value, ttl=CACHE_TTL, stale_ttl=CACHE_STALE_TTL):
+        now = time.time()
+        with self._mutex:
+            self._entries[key] = CacheEntry(value, now, now + ttl, now + ttl + stale_ttl)
+
+    def delete(self, key):
+        with self._mutex:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._mutex:
+            self._entries.clear()
+
+    def expire(self, key, min_age=0):
+        now = time.time()
+        with self._mutex:
+            entry = self._entries.get(key)
+            if entry is None:
+                return True
+            if now - entry.created_at < min_age:
+                return False
+            if entry.expires_at > now:
+                self._entries[key] = entry._replace(expires_at=now)
+            return True
+
+    def expire_prefix(self, prefix, min_age=0):
+        now = time.time()
+        expired = 0
+        with self._mutex:
+            for key, entry in list(self._entries.items()):
+                if key.startswith(prefix) and now - entry.created_at >= min_age and entry.expires_at > now:
+                    self._entries[key] = entry._replace(expires_at=now)
+                    expired += 1
+        return expired
+
+    def acquire_lock(self, key, owner, lease=LOCK_LEASE):
+        now = time.time()
+        with self._mutex:
+            current = self._locks.get(key)
+            if current and current[1] > now:
+                return False
+            self._locks[key] = (owner, now + lease)
+            return True
+
+    def release_lock(self, key, owner):
+        with self._mutex:
+            if key in self._locks and self._locks[key][0] == owner:
+                del self._locks[key]
+
+
+class SQLiteCacheBackend(CacheBackend):
+    """Caché en un fichero SQLite compartido por todos los procesos del host"""
+
+    def __init__(self, path=DEFAULT_CACHE_PATH):
+        self.path = path
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS cache (
+                    key TEXT PRIMARY KEY,
+                    value BLOB NOT NULL,
+                    created_at REAL NOT NULL,
+                    expires_at REAL NOT NULL,
+                    stale_until REAL NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS locks (
+                    key TEXT PRIMARY KEY,
+                    owner TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            """)
+
+    def _connect(self):
+        """Abre una conexión nueva (una por operación, válida entre hilos)"""
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get(self, key):
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT value, created_at, expires_at, stale_until FROM cache WHERE key = ?",
+                (key,)
+            ).fetchone()
+
+        if row is None:
+            return None
+
+        return CacheEntry(pickle.loads(row[0]), row[1], row[2], row[3])
+
+    def set(self, key, value, ttl=CACHE_TTL, stale_ttl=CACHE_STALE_TTL):
+        now = time.time()
+        payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?)",
+                (key, payload, now, now + ttl, now + ttl + stale_ttl)
+            )
+
+    def delete(self, key):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM cache")
+
+    def expire(self, key, min_age=0):
+        now = time.time()
+
+        with self._connect() as conn:
+            row = conn.execute("SELECT created_at FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return True
+            if now - row[0] < min_age:
+                return False
+            conn.execute(
+                "UPDATE cache SET expires_at = ? WHERE key = ? AND expires_at > ?",
+                (now, key, now)
+            )
+            return True
+
+    def expire_prefix(self, prefix, min_age=0):
+        now = time.time()
+
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE cache SET expires_at = ? "
+                "WHERE substr(key, 1, ?) = ? AND created_at <= ? AND expires_at > ?",
+                (now, len(prefix), prefix, now - min_age, now)
+            )
+            return cursor.rowcount
+
+    def acquire_lock(self, key, owner, lease=LOCK_LEASE):
+        now = time.time()
+
+        with self._connect() as conn:
+            # Un bloqueo caducado (proceso caído) se puede reclamar
+            conn.execute("DELETE FROM locks WHERE key = ? AND expires_at <= ?", (key, now))
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO locks VALUES (?, ?, ?)",
+                (key, owner, now + lease)
+            )
+            return cursor.rowcount == 1
+
+    def release_lock(self, key, owner):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM locks WHERE key = ? AND owner = ?", (key, owner))
+
+
+class SingleFlight:
+    """Agrupa las llamadas concurrentes con la misma clave en una sola ejecución
+
+    La primera llamada ejecuta la función; las que llegan mientras tanto esperan
+    y reciben el mismo resultado (o la misma excepción).
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = {'done': threading.Event(), 'value': None, 'error': None}
+
+        if not leader:
+            call['done'].wait()
+            if call['error'] is not None:
+                raise call['error']
+            return call['value']
+
+        try:
+            call['value'] = fn()
+        except BaseException as e:
+            call['error'] = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call['done'].set()
+
+        return call['value']
+
+
+_backend = None
+_backend_lock = threading.Lock()
+_single_flight = SingleFlight()
+
+
+def get_cache_backend():
+    """Devuelve el backend de caché configurado (uno por proceso)"""
+    global _backend
+
+    with _backend_lock:
+        if _backend is None:
+            if DEFAULT_CACHE_BACKEND == 'memory':
+                _backend = MemoryCacheBackend()
+            else:
+                _backend = SQLiteCacheBackend()
+
+    return _backend
+
+
+def set_cache_backend(backend):
+    """Sustituye el backend del proceso (p. ej. una caché vacía en un benchmark)"""
+    global _backend
+
+    with _backend_lock:
+        _backend = backend
+
+    return backend
+
+
+def snapshot_cache_key(batch=True):
+    """Clave del snapshot de todos los mercados en la caché compartida"""
+    return f'{SNAPSHOT_KEY_PREFIX}:{batch}'
+
+
+def _negative_key(key):
+    return f'{NEGATIVE_PREFIX}{key}'
+
+
+def _refresh(backend, key, owner, loader, ttl, stale_ttl, negative_ttl=NEGATIVE_TTL):
+    """Carga un valor y lo publica; siempre libera el bloqueo
+
+    Un resultado None es un fallo: no sustituye al último valor bueno, solo deja
+    una entrada negativa corta para no volver a pedir la clave enseguida. ttl
+    puede ser una función que recibe el valor cargado y devuelve su validez.
+    """
+    try:
+        value = loader()
+        if value is None:
+            backend.set(_negative_key(key), True, ttl=negative_ttl, stale_ttl=0)
+        else:
+            backend.set(key, value, ttl=ttl(value) if callable(ttl) else ttl, stale_ttl=stale_ttl)
+        return value
+    finally:
+        backend.release_lock(key, owner)
+
+
+def _last_good(entry, mark_stale=None):
+    """Último valor bueno de una entrada (marcado como desactualizado si se indica cómo)"""
+    if entry is None:
+        return None
+    return mark_stale(entry.value, entry.created_at) if mark_stale else entry.value
+
+
+def get_or_refresh(key, loader, ttl=CACHE_TTL, stale_ttl=CACHE_STALE_TTL,
+                   backend=None, background_loader=None,
+                   negative_ttl=NEGATIVE_TTL, mark_stale=None):
+    """Lee una clave con semántica stale-while-revalidate
+
+    - Valor fresco: se devuelve directamente.
+    - Valor caducado dentro del periodo stale: se devuelve y un único proceso
+      (el que consigue el bloqueo) lo refresca en segundo plano.
+    - Sin valor utilizable: el que consigue el bloqueo carga el valor; el resto
+      espera a que se publique mientras dure el bloqueo. Dentro del proceso las
+      peticiones simultáneas de la misma clave comparten una única carga.
+
+    Si el loader devuelve None (fallo) se sirve el último valor bueno, aunque haya
+    pasado el periodo stale, pasado por mark_stale(value, created_at) para que la
+    interfaz pueda avisar; durante negative_ttl no se vuelve a intentar la carga.
+
+    ttl puede ser un número o una función que recibe el valor cargado y devuelve
+    los segundos de validez (p. ej. más corta si el valor está incompleto).
+    background_loader permite refrescar en segundo plano sin tocar la interfaz.
+    """
+    backend = backend or get_cache_backend()
+    telemetry = get_telemetry()
+    owner = uuid.uuid4().hex
+    entry = backend.get(key)
+    now = time.time()
+
+    if entry is not None and now < entry.expires_at:
+        telemetry.record_cache(key, 'hit')
+        return entry.value
+
+    # Fallo reciente: no se vuelve a pedir hasta que caduque la entrada negativa
+    negative = backend.get(_negative_key(key))
+    if negative is not None and now < negative.expires_at:
+        telemetry.record_cache(key, 'negative')
+        return _last_good(entry, mark_stale)
+
+    if entry is not None and now < entry.stale_until:
+        telemetry.record_cache(key, 'stale')
+        if backend.acquire_lock(key, owner):
+            threading.Thread(
+                target=_refresh,
+                args=(backend, key, owner, background_loader or loader, ttl, stale_ttl, negative_ttl),
+                name=f'cache-refresh-{key}',
+                daemon=True
+            ).start()
+        return entry.value
+
+    telemetry.record_cache(key, 'miss')
+    value = _single_flight.do(
+        key, lambda: _load(backend, key, owner, loader, ttl, stale_ttl, negative_ttl, now)
+    )
+
+    return _last_good(entry, mark_stale) if value is None else value
+
+
+def _load(backend, key, owner, loader, ttl, stale_ttl, negative_ttl, now):
+    """Carga en frío: la hace quien consigue el bloqueo; el resto espera su resultado"""
+    if backend.acquire_lock(key, owner):
+        return _refresh(backend, key, owner, loader, ttl, stale_ttl, negative_ttl)
+
+    # Otro proceso está cargando esta clave: esperar a que publique el resultado
+    deadline = now + LOCK_LEASE
+    while time.time() < deadline:
+        time.sleep(LOCK_POLL_INTERVAL)
+        entry = backend.get(key)
+        if entry is not None and entry.created_at >= now:
+            return entry.value
+        negative = backend.get(_negative_key(key))
+        if negative is not None and negative.created_at >= now:
+            return None
+        if backend.acquire_lock(key, owner):
+            return _refresh(backend, key, owner, loader, ttl, stale_ttl, negative_ttl)
+
+    return loader()
+
+
+def invalidate(key, min_age=MIN_REFRESH_INTERVAL, backend=None):
+    """Caduca una clave salvo que se haya refrescado hace menos de min_age segundos
+
+    Devuelve True si la clave necesita refrescarse. El valor anterior se sigue
+    sirviendo como stale mientras se recarga.
+    """
+    backend = backend or get_cache_backend()
+    return backend.expire(key, min_age=min_age)
+
+
+def get_fresh(key, backend=None):
+    """Devuelve el valor de una clave solo si sigue fresco (None en otro caso)"""
+    backend = backend or get_cache_backend()
+    entry = backend.get(key)
+
+    if entry is not None and time.time() < entry.expires_at:
+        get_telemetry().record_cache(key, 'hit')
+        return entry.value
+
+    get_telemetry().record_cache(key, 'miss')
+    return None
+
+
+def shared_cache(ttl=CACHE_TTL, stale_ttl=CACHE_STALE_TTL, namespace=None,
+                 negative_ttl=NEGATIVE_TTL, mark_stale=None):
+    """Decorador equivalente a st.cache_data pero compartido entre procesos
+
+    ttl puede ser un número o una función que recibe los mismos argumentos que
+    la función decorada y devuelve los segundos de validez de ese resultado.
+    Si la función devuelve None no se cachea como dato bueno: se sirve el último
+    valor bueno (marcado con mark_stale) y se espera negative_ttl antes de reintentar.
+    La función decorada expone además cache_key(*args), fresh(*args) para leer
+    sin descargar, store(value, *args) para publicar un valor obtenido por otra vía,
+    invalidate(*args, min_age=...) para caducar una sola entrada e
+    invalidate_all(min_age=...) para caducar todas las de la función.
+    """
+    def decorator(func):
+        prefix = namespace or f'{func.__module__}.{func.__qualname__}'
+
+        def cache_key(*args):
+            return f'{prefix}:{args!r}'
+
+        def ttl_for(*args):
+            return ttl(*args) if callable(ttl) else ttl
+
+        @wraps(func)
+        def wrapper(*args):
+            return get_or_refresh(
+                cache_key(*args), lambda: func(*args),
+                ttl=ttl_for(*args), stale_ttl=stale_ttl,
+                negative_ttl=negative_ttl, mark_stale=mark_stale
+            )
+
+        def fresh(*args):
+            return get_fresh(cache_key(*args))
+
+        def store(value, *args):
+            if value is None:
+                return
+            get_cache_backend().set(cache_key(*args), value, ttl=ttl_for(*args), stale_ttl=stale_ttl)
+
+        def invalidate_entry(*args, min_age=MIN_REFRESH_INTERVAL):
+            return invalidate(cache_key(*args), min_age=min_age)
+
+        def invalidate_all(min_age=MIN_REFRESH_INTERVAL):
+            return get_cache_backend().expire_prefix(f'{prefix}:', min_age=min_age)
+
+        wrapper.cache_key = cache_key
+        wrapper.fresh = fresh
+        wrapper.store = store
+        wrapper.invalidate = invalidate_entry
+        wrapper.invalidate_all = invalidate_all
+
+        return wrapper
+
+    return decorator
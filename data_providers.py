@@ -0,0 +1,290 @@
+"""Proveedores de datos intercambiables: Yahoo Finance (red) o reproducción desde ficheros
+
+    python data_providers.py                        # Graba todos los instrumentos en fixtures/replay
+    python data_providers.py --symbols ^GSPC ^N225 --period 2y --output /ruta/replay
+
+La grabación guarda como CSV los históricos actuales de Yahoo Finance para
+ejecutar después sin red con MAPA_DATA_PROVIDER=replay.
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+
+import pandas as pd
+
+# Proveedor de datos: "yahoo" (red) o "replay" (ficheros locales, sin red)
+DEFAULT_PROVIDER = os.environ.get('MAPA_DATA_PROVIDER', 'yahoo')
+
+# Configuración del proveedor de reproducción
+REPLAY_PATH = os.environ.get('MAPA_REPLAY_PATH', os.path.join('fixtures', 'replay'))
+REPLAY_LATENCY = float(os.environ.get('MAPA_REPLAY_LATENCY', '0'))            # Segundos por petición
+REPLAY_FAILURE_RATE = float(os.environ.get('MAPA_REPLAY_FAILURE_RATE', '0'))  # Probabilidad de fallo (0-1)
+REPLAY_SEED = os.environ.get('MAPA_REPLAY_SEED')
+
+OHLCV_FIELDS = ['Open', 'High', 'Low', 'Close', 'Volume']
+
+# Días que abarca cada periodo de yfinance
+PERIOD_UNITS = {'d': 1, 'wk': 7, 'mo': 31, 'y': 366}
+
+
+class ProviderError(Exception):
+    """Error del proveedor de datos (incluidos los fallos inyectados en reproducción)"""
+
+
+def period_days(period):
+    """'1y' -> 366, '5d' -> 5, '3mo' -> 93"""
+    for unit, days in sorted(PERIOD_UNITS.items(), key=lambda item: -len(item[0])):
+        if period.endswith(unit):
+            return int(period[:-len(unit)] or 1) * days
+    raise ValueError(f"Periodo no soportado: {period}")
+
+
+def as_panel(frames):
+    """Une históricos por símbolo en un panel con columnas (símbolo, campo)"""
+    frames = {symbol: frame for symbol, frame in frames.items() if frame is not None and not frame.empty}
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, axis=1).sort_index()
+
+
+class DataProvider:
+    """Interfaz de un proveedor de históricos OHLCV
+
+    history() devuelve el histórico de un símbolo (columnas OHLCV indexadas por
+    fecha) y download() el de varios en un panel con columnas (símbolo, campo).
+    Se pide un periodo ('1y', '1d'...) o una fecha de inicio.
+    """
+
+    name = 'base'
+
+    def history(self, symbol, period='1y', start=None, interval='1d'):
+        raise NotImplementedError
+
+    def download(self, symbols, period='1y', start=None, interval='1d'):
+        """Por defecto, una petición de history() por símbolo"""
+        return as_panel({
+            symbol: self.history(symbol, period=period, start=start, interval=interval)
+            for symbol in symbols
+        })
+
+
+class YahooProvider(DataProvider):
+    """Datos de Yahoo Finance a través de yfinance
+
+    yfinance (y toda su pila de red) se importa en la primera petición, que se
+    hace desde el hilo de refresco: ni la aplicación ni el snapshot lo cargan al
+    arrancar.
+    """
+
+    name = 'yahoo'
+
+    def history(self, symbol, period='1y', start=None, interval='1d'):
+        import yfinance as yf
+
+        ticker = yf.Ticker(symbol)
+        if start is not None:
+            return ticker.history(start=start, interval=interval)
+        return ticker.history(period=period, interval=interval)
+
+    def download(self, symbols, period='1y', start=None, interval='1d'):
+        import yfinance as yf
+
+        symbols = list(symbols)
+        range_args = {'start': start} if start is not None else {'period': period}
+
+        panel = yf.download(
+            tickers=symbols,
+            interval=interval,
+            group_by='ticker',
+            auto_adjust=True,
+            threads=True,
+            progress=False,
+            **range_args
+        )
+
+        if panel is None or panel.empty:
+            return pd.DataFrame()
+
+        # Con un solo símbolo algunas versiones de yfinance no devuelven columnas multinivel
+        if not isinstance(panel.columns, pd.MultiIndex):
+            panel = pd.concat({symbols[0]: panel}, axis=1)
+
+        return panel.sort_index()
+
+
+def fixture_name(symbol, interval='1d'):
+    """Nombre base del fichero de un símbolo ('^GSPC' -> '_GSPC.1d')"""
+    safe = ''.join(char if char.isalnum() or char in '.-' else '_' for char in symbol)
+    return f'{safe}.{interval}'
+
+
+class ReplayProvider(DataProvider):
+    """Sirve históricos desde ficheros Parquet/CSV locales, sin red
+
+    Cada símbolo e intervalo vive en `<path>/<fixture_name>.parquet` o `.csv`.
+    Los periodos se cuentan desde la última fecha del fichero, así que una misma
+    reproducción da siempre los mismos datos. latency añade una espera por
+    petición y failure_rate la probabilidad de que una petición falle.
+    """
+
+    name = 'replay'
+
+    def __init__(self, path=REPLAY_PATH, latency=REPLAY_LATENCY,
+                 failure_rate=REPLAY_FAILURE_RATE, seed=REPLAY_SEED):
+        self.path = path
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)
+        self._frames = {}
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.failures = 0
+
+    def _simulate_request(self, label):
+        """Latencia y fallos inyectados de una petición"""
+        with self._lock:
+            self.requests += 1
+            fail = self._random.random() < self.failure_rate
+
+        if self.latency:
+            time.sleep(self.latency)
+
+        if fail:
+            with self._lock:
+                self.failures += 1
+            raise ProviderError(f"Fallo inyectado en la reproducción de {label}")
+
+    def _load(self, symbol, interval):
+        """Fichero completo de un símbolo (se lee una vez y queda en memoria)"""
+        key = (symbol, interval)
+
+        with self._lock:
+            if key in self._frames:
+                return self._frames[key]
+
+        base = os.path.join(self.path, fixture_name(symbol, interval))
+
+        if os.path.exists(base + '.parquet'):
+            try:
+                frame = pd.read_parquet(base + '.parquet')
+            except ImportError as e:
+                raise ProviderError(f"Leer Parquet requiere pyarrow: {e}")
+        elif os.path.exists(base + '.csv'):
+            frame = pd.read_csv(base + '.csv', index_col=0, parse_dates=True)
+        else:
+            frame = pd.DataFrame(columns=OHLCV_FIELDS)
+
+        frame = frame.sort_index()
+
+        with self._lock:
+            self._frames[key] = frame
+
+        return frame
+
+    def _slice(self, frame, period, start):
+        if frame.empty:
+            return frame
+
+        if start is not None:
+            start = pd.Timestamp(start)
+            if frame.index.tz is not None and start.tz is None:
+                start = start.tz_localize(frame.index.tz)
+            return frame[frame.index >= start]
+
+        # El periodo se mide desde el último dato del fichero (reproducible)
+        last = frame.index[-1].normalize()
+        return frame[frame.index > last - pd.Timedelta(days=period_days(period))]
+
+    def history(self, symbol, period='1y', start=None, interval='1d'):
+        self._simulate_request(symbol)
+        return self._slice(self._load(symbol, interval), period, start).copy()
+
+    def download(self, symbols, period='1y', start=None, interval='1d'):
+        # Una descarga conjunta es una sola petición (una latencia y un posible fallo)
+        self._simulate_request(', '.join(symbols))
+        return as_panel({
+            symbol: self._slice(self._load(symbol, interval), period, start)
+            for symbol in symbols
+        })
+
+
+def record_fixtures(symbols, path=REPLAY_PATH, provider=None, period='1y', interval='1d'):
+    """Guarda como CSV los históricos de un proveedor para reproducirlos sin red"""
+    provider = provider or YahooProvider()
+    os.makedirs(path, exist_ok=True)
+
+    written = []
+    for symbol in symbols:
+        try:
+            frame = provider.history(symbol, period=period, interval=interval)
+        except Exception as e:
+            print(f"Error grabando {symbol}: {e}")
+            continue
+        if frame is None or frame.empty:
+            continue
+        columns = [column for column in OHLCV_FIELDS if column in frame]
+        frame[columns].to_csv(os.path.join(path, fixture_name(symbol, interval) + '.csv'))
+        written.append(symbol)
+
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--symbols', nargs='+', help='Símbolos a grabar (por defecto, todos los del registro)')
+    parser.add_argument('--output', default=REPLAY_PATH, help='Directorio de los ficheros de reproducción')
+    parser.add_argument('--period', default='1y', help='Periodo de yfinance (1y, 6mo, 5d...)')
+    parser.add_argument('--interval', default='1d', help='Intervalo de las barras (1d, 1m...)')
+    args = parser.parse_args(argv)
+
+    symbols = args.symbols
+    if not symbols:
+        from instrument_registry import get_registry
+        symbols = list(get_registry().symbols)
+
+    written = record_fixtures(symbols, path=args.output, period=args.period, interval=args.interval)
+    missing = [symbol for symbol in symbols if symbol not in written]
+
+    print(f"{len(written)}/{len(symbols)} históricos grabados en {args.output}")
+    if missing:
+        print(f"Sin datos: {', '.join(missing)}")
+    return 0 if written else 1
+
+
+PROVIDERS = {
+    'yahoo': YahooProvider,
+    'replay': ReplayProvider,
+}
+
+_provider = None
+_provider_lock = threading.Lock()
+
+
+def get_data_provider():
+    """Proveedor configurado (MAPA_DATA_PROVIDER), uno por proceso"""
+    global _provider
+
+    with _provider_lock:
+        if _provider is None:
+            if DEFAULT_PROVIDER not in PROVIDERS:
+                raise ValueError(f"Proveedor de datos desconocido: {DEFAULT_PROVIDER}")
+            _provider = PROVIDERS[DEFAULT_PROVIDER]()
+
+    return _provider
+
+
+def set_data_provider(provider):
+    """Sustituye el proveedor del proceso (p. ej. una reproducción en un benchmark)"""
+    global _provider
+
+    with _provider_lock:
+        _provider = provider
+
+    return provider
+
+
+if __name__ == '__main__':
+    sys.exit(main())
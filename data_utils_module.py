@@ -1,200 +1,519 @@
-import yfinance as yf
+import threading
+import time as time_module
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import pandas as pd
-from datetime import datetime, timezone, time
-import pytz
+from datetime import datetime, timezone, timedelta
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 
-# Configuración de mercados principales
-MARKETS_CONFIG = {
-    '^GSPC': {  # S&P 500
-        'name': 'S&P 500 (NYSE)',
-        'country': 'United States',
-        'timezone': 'America/New_York',
-        'lat': 40.7128,
-        'lon': -74.0060,
-        'open_time': time(9, 30),
-        'close_time': time(16, 0)
-    },
-    '^IXIC': {  # NASDAQ
-        'name': 'NASDAQ',
-        'country': 'United States',
-        'timezone': 'America/New_York',
-        'lat': 40.7589,
-        'lon': -73.9851,
-        'open_time': time(9, 30),
-        'close_time': time(16, 0)
-    },
-    '^FTSE': {  # FTSE 100
-        'name': 'FTSE 100 (Londres)',
-        'country': 'United Kingdom',
-        'timezone': 'Europe/London',
-        'lat': 51.5074,
-        'lon': -0.1278,
-        'open_time': time(8, 0),
-        'close_time': time(16, 30)
-    },
-    '^GDAXI': {  # DAX
-        'name': 'DAX (Frankfurt)',
-        'country': 'Germany',
-        'timezone': 'Europe/Berlin',
-        'lat': 50.1109,
-        'lon': 8.6821,
-        'open_time': time(9, 0),
-        'close_time': time(17, 30)
-    },
-    '^FCHI': {  # CAC 40
-        'name': 'CAC 40 (París)',
-        'country': 'France',
-        'timezone': 'Europe/Paris',
-        'lat': 48.8566,
-        'lon': 2.3522,
-        'open_time': time(9, 0),
-        'close_time': time(17, 30)
-    },
-    '^IBEX': {  # IBEX 35
-        'name': 'IBEX 35 (Madrid)',
-        'country': 'Spain',
-        'timezone': 'Europe/Madrid',
-        'lat': 40.4168,
-        'lon': -3.7038,
-        'open_time': time(9, 0),
-        'close_time': time(17, 30)
-    },
-    '^N225': {  # Nikkei 225
-        'name': 'Nikkei 225 (Tokio)',
-        'country': 'Japan',
-        'timezone': 'Asia/Tokyo',
-        'lat': 35.6762,
-        'lon': 139.6503,
-        'open_time': time(9, 0),
-        'close_time': time(15, 0)
-    },
-    '000001.SS': {  # Shanghai Composite
-        'name': 'Shanghai Composite',
-        'country': 'China',
-        'timezone': 'Asia/Shanghai',
-        'lat': 31.2304,
-        'lon': 121.4737,
-        'open_time': time(9, 30),
-        'close_time': time(15, 0)
-    },
-    '^HSI': {  # Hang Seng
-        'name': 'Hang Seng (Hong Kong)',
-        'country': 'Hong Kong',
-        'timezone': 'Asia/Hong_Kong',
-        'lat': 22.3193,
-        'lon': 114.1694,
-        'open_time': time(9, 30),
-        'close_time': time(16, 0)
-    },
-    '^BVSP': {  # Bovespa
-        'name': 'Bovespa (São Paulo)',
-        'country': 'Brazil',
-        'timezone': 'America/Sao_Paulo',
-        'lat': -23.5505,
-        'lon': -46.6333,
-        'open_time': time(10, 0),
-        'close_time': time(17, 0)
-    },
-    '^GSPTSE': {  # TSX
-        'name': 'TSX (Toronto)',
-        'country': 'Canada',
-        'timezone': 'America/Toronto',
-        'lat': 43.6532,
-        'lon': -79.3832,
-        'open_time': time(9, 30),
-        'close_time': time(16, 0)
-    },
-    '^AXJO': {  # ASX 200
-        'name': 'ASX 200 (Sídney)',
-        'country': 'Australia',
-        'timezone': 'Australia/Sydney',
-        'lat': -33.8688,
-        'lon': 151.2093,
-        'open_time': time(10, 0),
-        'close_time': time(16, 0)
-    },
-    '^KS11': {  # KOSPI
-        'name': 'KOSPI (Seúl)',
-        'country': 'South Korea',
-        'timezone': 'Asia/Seoul',
-        'lat': 37.5665,
-        'lon': 126.9780,
-        'open_time': time(9, 0),
-        'close_time': time(15, 30)
-    },
-    '^TWII': {  # Taiwan Weighted
-        'name': 'TWII (Taipéi)',
-        'country': 'Taiwan',
-        'timezone': 'Asia/Taipei',
-        'lat': 25.0330,
-        'lon': 121.5654,
-        'open_time': time(9, 0),
-        'close_time': time(13, 30)
-    },
-    '^NSEI': {  # Nifty 50
-        'name': 'Nifty 50 (Mumbai)',
-        'country': 'India',
-        'timezone': 'Asia/Kolkata',
-        'lat': 19.0760,
-        'lon': 72.8777,
-        'open_time': time(9, 15),
-        'close_time': time(15, 30)
-    }
+from cache_backend import (
+    shared_cache, get_or_refresh, get_cache_backend, snapshot_cache_key, SingleFlight, MIN_REFRESH_INTERVAL
+)
+from market_calendar import get_market_calendar
+from instrument_registry import get_registry
+from history_store import get_history_store, fetch_start
+from technical_indicators import IndicatorState, INDICATOR_COLUMNS, compute_indicators, indicator_fields
+from market_metrics import build_close_matrix, build_field_matrices, compute_panel_metrics, TREND_UP, TREND_DOWN, TREND_NO_DATA
+from market_breadth import snapshot_breadth, history_breadth
+from market_correlation import CorrelationTracker, CORRELATION_HISTORY_DAYS
+from fetch_scheduler import get_fetch_scheduler, CircuitOpenError
+from intraday import get_intraday_store
+from data_providers import get_data_provider
+from telemetry import get_telemetry
+
+# Descargas concurrentes: tamaño del pool y plazo máximo por símbolo (segundos)
+FETCH_MAX_WORKERS = 8
+FETCH_TIMEOUT = 15
+
+# Caché según la sesión de cada mercado
+OPEN_MARKET_TTL = 120                 # Mercado abierto: refresco frecuente (segundos)
+CLOSE_SETTLE_MINUTES = 30             # Tras el cierre se sigue refrescando hasta fijar el último precio
+MAX_CLOSED_MARKET_TTL = 4 * 24 * 3600  # Tope de caché para un mercado cerrado (segundos)
+
+# Modo intradía: cada cuánto se piden las barras de 1 minuto (segundos)
+INTRADAY_REFRESH = 60
+
+# Estado cuando no se puede calcular la sesión de un mercado
+UNKNOWN_STATUS = {
+    'is_open': False,
+    'status': 'Estado desconocido',
+    'next_action': 'Verificar zona horaria'
 }
 
-@st.cache_data(ttl=300)  # Cache por 5 minutos
+# Configuración de mercados (vista del registro de instrumentos, instruments.csv)
+MARKETS_CONFIG = get_registry().as_config()
+
+# Etiquetas de tendencia MA200
+TREND_LABELS = {
+    TREND_UP: "📈 Alcista",
+    TREND_DOWN: "📉 Bajista",
+    TREND_NO_DATA: "📊 Sin datos"
+}
+
+def get_market_statuses(symbols=None, now=None):
+    """Estado de sesión de varios mercados calculado de una vez sobre el calendario
+    
+    Devuelve símbolo -> {'is_open', 'status', 'next_action', 'next_event', ...}.
+    Conviene llamarla una sola vez por render y reutilizar el resultado.
+    """
+    calendar = get_market_calendar(MARKETS_CONFIG, now)
+    
+    if symbols is None:
+        return calendar.status_all(now)
+    
+    symbols = list(symbols)
+    statuses = calendar.status_all(now, symbols=symbols)
+    
+    return {symbol: statuses.get(symbol, UNKNOWN_STATUS) for symbol in symbols}
+
+def get_cache_ttl(symbol, now=None):
+    """Segundos que pueden cachearse los datos de un mercado según su sesión
+    
+    Un mercado abierto (o recién cerrado) se refresca cada OPEN_MARKET_TTL; uno
+    cerrado (fin de semana, festivo, pausa o fuera de horario) se mantiene en
+    caché hasta su próximo evento de sesión.
+    """
+    if symbol not in MARKETS_CONFIG:
+        return OPEN_MARKET_TTL
+    
+    now = now or datetime.now(timezone.utc)
+    return status_cache_ttl(get_market_statuses([symbol], now)[symbol], now)
+
+def status_cache_ttl(status, now):
+    """TTL correspondiente a un estado de sesión ya calculado"""
+    if status['is_open'] or status.get('seconds_to_next_event') is None:
+        return OPEN_MARKET_TTL
+    
+    # Justo después del cierre se sigue refrescando hasta fijar el último precio
+    previous_event = status.get('previous_event')
+    if previous_event and now - previous_event < timedelta(minutes=CLOSE_SETTLE_MINUTES):
+        return OPEN_MARKET_TTL
+    
+    seconds_to_open = status['seconds_to_next_event']
+    return int(min(max(seconds_to_open, OPEN_MARKET_TTL), MAX_CLOSED_MARKET_TTL))
+
+def get_symbols_cache_ttl(symbols, now=None):
+    """TTL de un resultado que agrupa varios mercados: el del que antes caduca
+    
+    El estado de todos se calcula en una sola búsqueda sobre el calendario.
+    """
+    now = now or datetime.now(timezone.utc)
+    known = [symbol for symbol in symbols if symbol in MARKETS_CONFIG]
+    ttls = [status_cache_ttl(status, now) for status in get_market_statuses(known, now).values()]
+    
+    if len(known) < len(symbols):
+        ttls.append(OPEN_MARKET_TTL)
+    
+    return min(ttls, default=OPEN_MARKET_TTL)
+
+def panel_indicators(matrices, indicators=None):
+    """Indicadores técnicos de varios mercados (DataFrame indexado por símbolo, en el orden de los cierres)
+    
+    matrices son las de build_field_matrices (cierres y, si están, máximos y
+    mínimos). indicators, si se indica, trae los valores ya calculados de forma
+    incremental (símbolo -> dict); si no, se calculan sobre todo el panel de una vez.
+    """
+    close = matrices['Close']
+    if indicators is not None:
+        return pd.DataFrame.from_dict(
+            {symbol: indicators.get(symbol) or {} for symbol in close.columns}, orient='index'
+        ).reindex(columns=INDICATOR_COLUMNS).astype(float)
+    
+    with get_telemetry().timer('compute', 'indicators'):
+        return compute_indicators(close, high=matrices.get('High'), low=matrices.get('Low'))
+
+def summarize_histories(histories, indicators=None):
+    """Calcula precio, cambio, volumen, tendencia MA200 e indicadores técnicos de varios mercados a la vez"""
+    histories = {symbol: hist for symbol, hist in histories.items() if hist is not None and not hist.empty}
+    
+    if not histories:
+        return {}
+    
+    # Todas las matrices con una sola alineación de fechas (máximos y mínimos solo si
+    # los indicadores se calculan aquí)
+    fields = ('Close', 'Volume') if indicators is not None else ('Close', 'High', 'Low', 'Volume')
+    matrices = build_field_matrices(histories, fields)
+    technical = panel_indicators(matrices, indicators)
+    
+    # Métricas de todos los mercados en una sola pasada sobre la matriz de cierres
+    # (la MA200 del motor de indicadores no se vuelve a calcular)
+    with get_telemetry().timer('compute', 'metrics'):
+        metrics = compute_panel_metrics(
+            matrices['Close'],
+            volume=matrices['Volume'],
+            ma=technical['ma200'].to_numpy()
+        )
+    technical_fields = technical.to_dict('index')
+    last_update = datetime.now().strftime('%H:%M:%S')
+    
+    return {
+        symbol: {
+            'price': float(row.price),
+            'change_percent': float(row.change_percent),
+            'ma200_trend': TREND_LABELS[row.trend],
+            'trend': int(row.trend),
+            'volume': float(row.volume),
+            **indicator_fields(technical_fields[symbol]),
+            'last_update': last_update
+        }
+        for symbol, row in zip(metrics.index, metrics.itertuples(index=False))
+    }
+
+def summarize_history(hist, indicators=None):
+    """Calcula precio, cambio, tendencia MA200 e indicadores a partir del histórico de un mercado"""
+    indicators = None if indicators is None else {'symbol': indicators}
+    return summarize_histories({'symbol': hist}, indicators=indicators).get('symbol')
+
+def mark_stale_market(data, as_of):
+    """Último dato bueno de un mercado, marcado como desactualizado (la descarga falló)"""
+    return {**data, 'stale': True, 'as_of': datetime.fromtimestamp(as_of).strftime('%H:%M:%S')}
+
+def payload_bytes(frame):
+    """Tamaño en memoria de los datos recibidos del proveedor"""
+    if frame is None or not hasattr(frame, 'memory_usage'):
+        return 0
+    return int(frame.memory_usage(index=True).sum())
+
+def call_provider(symbols, request, step='single'):
+    """Petición al proveedor con límite de ritmo, reintentos y circuitos
+    
+    Cada intento se mide: su latencia se apunta a los símbolos que trae junto
+    con el volumen de datos recibido.
+    """
+    telemetry = get_telemetry()
+    
+    def timed_request():
+        start = time_module.perf_counter()
+        try:
+            result = request()
+        except Exception:
+            telemetry.record_upstream_error()
+            raise
+        telemetry.record_upstream(symbols, time_module.perf_counter() - start, payload_bytes(result), step)
+        return result
+    
+    return get_fetch_scheduler().call(symbols, timed_request)
+
+def get_symbol_history(symbol, store=None):
+    """Actualiza el histórico local de un símbolo y devuelve su último año
+    
+    Tras la primera carga solo se piden las barras posteriores a la última guardada.
+    """
+    store = store or get_history_store()
+    start = fetch_start(store.last_timestamp(symbol))
+    
+    provider = get_data_provider()
+    
+    def fetch():
+        if start is None:
+            return provider.history(symbol, period="1y")  # Carga inicial completa
+        return provider.history(symbol, start=start)  # Solo barras nuevas
+    
+    try:
+        # Límite de ritmo, reintentos con espera y circuito por símbolo
+        hist = call_provider([symbol], fetch)
+        with get_telemetry().timer('parse', 'store'):
+            store.append(symbol, hist)
+    except Exception as e:
+        if start is None:
+            raise
+        # Sin conexión: se sirve lo que ya hay en disco
+        print(f"Error actualizando histórico de {symbol}, se usan datos locales: {e}")
+    
+    with get_telemetry().timer('parse', 'load'):
+        return store.load_window(symbol)
+
+def load_indicator_state(symbol, store=None):
+    """Estado incremental de indicadores guardado de un símbolo (None si no hay o es ilegible)"""
+    store = store or get_history_store()
+    payload = store.load_state(symbol, 'indicators')
+    
+    try:
+        return IndicatorState.from_json(payload) if payload else None
+    except (KeyError, TypeError, ValueError):
+        return None  # Estado de otra versión: se reconstruye
+
+def get_indicator_state(symbol, hist, store=None):
+    """Actualiza y guarda el estado incremental de indicadores técnicos de un símbolo"""
+    store = store or get_history_store()
+    state = load_indicator_state(symbol, store) or IndicatorState()
+    
+    # Solo se procesan las barras posteriores a la última ya incorporada
+    with get_telemetry().timer('compute', 'indicator_state'):
+        state.sync(hist)
+    store.save_state(symbol, 'indicators', state.to_json())
+    
+    return state
+
+@shared_cache(ttl=get_cache_ttl, namespace='data_utils.single_market', mark_stale=mark_stale_market)  # Caducidad según la sesión del mercado
 def get_single_market_data(symbol):
     """Obtiene datos de un mercado específico"""
     try:
-        ticker = yf.Ticker(symbol)
-        
-        # Obtener datos históricos (2 años para MA200)
-        hist = ticker.history(period="1y")
+        # Histórico de 1 año servido desde el almacén local
+        hist = get_symbol_history(symbol)
         
-        if hist.empty:
-            return None
+        # Indicadores mantenidos de forma incremental (solo se procesan las barras nuevas)
+        state = get_indicator_state(symbol, hist)
         
-        # Datos actuales
-        current_price = hist['Close'].iloc[-1]
-        previous_close = hist['Close'].iloc[-2] if len(hist) > 1 else current_price
+        return summarize_history(hist, indicators=state.values())
         
-        # Calcular cambio porcentual
-        change_percent = ((current_price - previous_close) / previous_close) * 100
-        
-        # Calcular MA200 si hay suficientes datos
-        if len(hist) >= 200:
-            ma200 = hist['Close'].rolling(window=200).mean().iloc[-1]
-            ma200_trend = "Alcista" if current_price > ma200 else "Bajista"
-        else:
-            ma200_trend = "Insuficientes datos"
+    except Exception as e:
+        print(f"Error obteniendo datos para {symbol}: {e}")
+        return None
+
+def download_market_panel(symbols, period="1y", start=None):
+    """Descarga en una sola petición el histórico OHLCV de varios mercados
+    
+    Devuelve un panel alineado por fecha con columnas (símbolo, campo).
+    """
+    symbols = list(symbols)
+    provider = get_data_provider()
+    
+    panel = call_provider(
+        symbols, lambda: provider.download(symbols, period=period, start=start), step='batch'
+    )
+    
+    if panel is None or panel.empty:
+        return pd.DataFrame()
+    
+    return panel.sort_index()
+
+def split_market_panel(panel, symbols):
+    """Separa el panel multi-mercado en un histórico por símbolo"""
+    histories = {}
+    
+    if panel is None or panel.empty:
+        return histories
+    
+    available = set(panel.columns.get_level_values(0))
+    
+    for symbol in symbols:
+        if symbol not in available:
+            continue
         
-        return {
-            'price': float(current_price),
-            'change_percent': float(change_percent),
-            'ma200_trend': ma200_trend,
-            'last_update': datetime.now().strftime('%H:%M:%S')
-        }
+        # Quitar las fechas en las que este mercado no cotizó (festivos locales)
+        hist = panel[symbol].dropna(subset=['Close'])
+        if not hist.empty:
+            histories[symbol] = hist
+    
+    return histories
+
+def update_histories(symbols, store=None):
+    """Actualiza el histórico local de varios mercados con descargas conjuntas
+    
+    Los símbolos sin datos guardados se descargan completos (1 año) y el resto
+    solo desde su última barra. Devuelve el último año de cada símbolo leído de disco.
+    """
+    store = store or get_history_store()
+    last = store.last_timestamps(symbols)
+    
+    # Los símbolos con el circuito abierto no se piden (se sirve lo que hay en disco)
+    available = get_fetch_scheduler().available(symbols)
+    cold = [symbol for symbol in available if last[symbol] is None]
+    warm = [symbol for symbol in available if last[symbol] is not None]
+    
+    downloads = []
+    if cold:
+        downloads.append((cold, None))
+    if warm:
+        downloads.append((warm, fetch_start(min(last[symbol] for symbol in warm))))
+    
+    for group, start in downloads:
+        try:
+            panel = download_market_panel(group, start=start)
+        except CircuitOpenError as e:
+            print(e)
+            continue
+        except Exception as e:
+            print(f"Error en la descarga conjunta de mercados: {e}")
+            continue
         
+        with get_telemetry().timer('parse', 'store'):
+            for symbol, hist in split_market_panel(panel, group).items():
+                store.append(symbol, hist)
+    
+    histories = {}
+    with get_telemetry().timer('parse', 'load'):
+        for symbol in symbols:
+            hist = store.load_window(symbol)
+            if not hist.empty:
+                histories[symbol] = hist
+    
+    return histories
+
+@shared_cache(ttl=get_symbols_cache_ttl, namespace='data_utils.batch_market')  # Caduca con el primer mercado que lo haga
+def get_batch_market_data(symbols):
+    """Obtiene datos de varios mercados con una única descarga"""
+    try:
+        histories = update_histories(symbols)
     except Exception as e:
-        print(f"Error obteniendo datos para {symbol}: {e}")
+        print(f"Error en la descarga conjunta de mercados: {e}")
         return None
+    
+    # Sin ningún dato es un fallo: no se cachea como resultado bueno
+    return summarize_histories(histories) or None
+
+def fetch_concurrently(symbols, fetch_fn, max_workers=FETCH_MAX_WORKERS,
+                       timeout=FETCH_TIMEOUT, on_result=None):
+    """Ejecuta fetch_fn(symbol) en un pool acotado de hilos
+    
+    Cada símbolo tiene su propio plazo, contado desde que empieza su descarga:
+    si lo supera se devuelve como None sin bloquear al resto. on_result(symbol,
+    data, completed, total) se invoca en el hilo llamante en orden de llegada.
+    """
+    symbols = list(symbols)
+    results = {}
+    started = {}
+    total = len(symbols)
+    
+    if not symbols:
+        return results
+    
+    # Los hilos heredan el contexto de Streamlit para poder usar st.* dentro de ellos
+    ctx = get_script_run_ctx()
+    
+    def attach_context():
+        if ctx is not None:
+            add_script_run_ctx(threading.current_thread(), ctx)
+    
+    def run(symbol):
+        started[symbol] = time_module.monotonic()
+        return fetch_fn(symbol)
+    
+    def deliver(symbol, data):
+        results[symbol] = data
+        if on_result:
+            on_result(symbol, data, len(results), total)
+    
+    executor = ThreadPoolExecutor(
+        max_workers=min(max_workers, total),
+        thread_name_prefix='market-fetch',
+        initializer=attach_context
+    )
+    
+    try:
+        pending = {executor.submit(run, symbol): symbol for symbol in symbols}
+        
+        while pending:
+            now = time_module.monotonic()
+            
+            # Descartar los símbolos que han agotado su plazo
+            for future, symbol in list(pending.items()):
+                if symbol in started and now - started[symbol] >= timeout:
+                    del pending[future]
+                    future.cancel()
+                    print(f"Tiempo agotado obteniendo datos para {symbol}")
+                    deliver(symbol, None)
+            
+            if not pending:
+                break
+            
+            deadlines = [started[symbol] + timeout for symbol in pending.values() if symbol in started]
+            wait_time = max(0, min(deadlines) - now) if deadlines else timeout
+            
+            done, _ = wait(pending, timeout=wait_time, return_when=FIRST_COMPLETED)
+            
+            for future in done:
+                symbol = pending.pop(future)
+                try:
+                    data = future.result()
+                except Exception as e:
+                    print(f"Error obteniendo datos para {symbol}: {e}")
+                    data = None
+                deliver(symbol, data)
+    finally:
+        # No esperar a los hilos rezagados: terminarán en segundo plano
+        executor.shutdown(wait=False, cancel_futures=True)
+    
+    return results
 
-def get_market_data():
-    """Obtiene datos de todos los mercados configurados"""
+def build_market_snapshot(batch=True, progress=None):
+    """Obtiene los datos de todos los mercados configurados (sin interfaz)
+    
+    progress(fraction, message), si se indica, recibe el avance de la descarga.
+    Devuelve None si no se ha obtenido ningún mercado.
+    """
     market_data = {}
+    total_markets = len(MARKETS_CONFIG)
+    
+    def report(fraction, message):
+        if progress:
+            progress(fraction, message)
+    
+    # Los mercados cuya caché sigue vigente (p. ej. cerrados hasta su apertura) no se piden
+    for symbol in MARKETS_CONFIG.keys():
+        cached = get_single_market_data.fresh(symbol)
+        if cached:
+            market_data[symbol] = cached
+    
+    expired = tuple(symbol for symbol in MARKETS_CONFIG.keys() if symbol not in market_data)
+    
+    # Descarga conjunta: una sola petición para los mercados caducados
+    if batch and expired:
+        report(0, '📡 Descargando datos de todos los mercados...')
+        batch_data = get_batch_market_data(expired) or {}
+        
+        for symbol in expired:
+            if batch_data.get(symbol):
+                market_data[symbol] = batch_data[symbol]
+                # Cada mercado queda en caché con la caducidad de su propia sesión
+                get_single_market_data.store(batch_data[symbol], symbol)
+    
+    def on_result(symbol, data, completed, total):
+        report(
+            (total_markets - total + completed) / total_markets,
+            f'📡 Recibidos datos de {MARKETS_CONFIG[symbol]["name"]}...'
+        )
+    
+    # Los símbolos que faltan en el panel se piden en paralelo, cada uno con su plazo
+    missing = [symbol for symbol in MARKETS_CONFIG.keys() if symbol not in market_data]
+    market_data.update(fetch_concurrently(missing, get_single_market_data, on_result=on_result))
+    
+    # Mantener el orden de MARKETS_CONFIG
+    snapshot = {symbol: market_data.get(symbol) for symbol in MARKETS_CONFIG.keys()}
+    
+    # Sin ningún mercado es un fallo: no se cachea como resultado bueno
+    return snapshot if any(snapshot.values()) else None
+
+def snapshot_ttl(market_data, now=None):
+    """Segundos que puede cachearse un snapshot: los del mercado que antes caduca
+    
+    Si falta algún mercado (su descarga falló) se guarda como mucho
+    OPEN_MARKET_TTL, para reintentarlo pronto aunque el resto esté cerrado hasta
+    su próxima apertura.
+    """
+    ttl = get_symbols_cache_ttl(MARKETS_CONFIG.keys(), now)
+    if any(not data for data in market_data.values()):
+        return min(ttl, OPEN_MARKET_TTL)
+    return ttl
+
+def load_market_snapshot(batch=True, progress=None):
+    """Lee los datos de todos los mercados de la caché compartida (descarga si hace falta)
+    
+    Devuelve None si no hay ningún mercado con datos ni snapshot bueno anterior.
+    Es el cargador del hilo de refresco de la aplicación y lo que guardan
+    snapshot_file.py y el benchmark: todos comparten la misma entrada de caché.
+    """
+    return get_or_refresh(
+        snapshot_cache_key(batch),
+        loader=lambda: build_market_snapshot(batch, progress=progress),
+        ttl=snapshot_ttl,
+        background_loader=lambda: build_market_snapshot(batch)
+    )
+
+def get_market_data(batch=True):
+    """Obtiene datos de todos los mercados configurados mostrando el avance de la descarga"""
     
     # Usar progress bar
     progress_bar = st.progress(0)
     status_text = st.empty()
     
-    total_markets = len(MARKETS_CONFIG)
+    def show_progress(fraction, message):
+        status_text.text(message)
+        progress_bar.progress(fraction)
     
-    for i, symbol in enumerate(MARKETS_CONFIG.keys()):
-        status_text.text(f'Obteniendo datos de {MARKETS_CONFIG[symbol]["name"]}...')
-        progress_bar.progress((i + 1) / total_markets)
-        
-        market_data[symbol] = get_single_market_data(symbol)
+    # Snapshot compartido entre réplicas: solo se descarga si no hay uno utilizable
+    market_data = load_market_snapshot(batch, progress=show_progress)
     
     # Limpiar elementos de progreso
     progress_bar.empty()
@@ -202,89 +521,219 @@ def get_market_data():
     
     return market_data
 
-def get_market_status(timezone_str):
-    """Determina si un mercado está abierto o cerrado"""
+def invalidate_markets(symbols, min_age=MIN_REFRESH_INTERVAL):
+    """Caduca los datos de unos mercados concretos y los agregados que los incluyen
+    
+    Los mercados refrescados hace menos de min_age segundos se respetan. Devuelve
+    los símbolos invalidados (lista vacía si no hace falta refrescar nada).
+    """
+    invalidated = [symbol for symbol in symbols if get_single_market_data.invalidate(symbol, min_age=min_age)]
+    
+    if invalidated:
+        # Las descargas conjuntas y el snapshot agregan varios mercados: se recalculan
+        get_batch_market_data.invalidate_all(min_age=0)
+        backend = get_cache_backend()
+        for batch in (True, False):
+            backend.delete(snapshot_cache_key(batch))
+    
+    return invalidated
+
+def download_intraday_panel(symbols):
+    """Descarga en una sola petición las barras de 1 minuto de la sesión actual"""
+    symbols = list(symbols)
+    provider = get_data_provider()
+    
+    panel = call_provider(
+        symbols, lambda: provider.download(symbols, period='1d', interval='1m'), step='intraday'
+    )
+    
+    if panel is None or panel.empty:
+        return pd.DataFrame()
+    
+    return panel.sort_index()
+
+def get_intraday_reference(symbol, session, store=None):
+    """Cierre diario anterior a la sesión y MA200 de partida de un símbolo"""
+    store = store or get_history_store()
+    
+    hist = store.load_window(symbol)
+    before = hist[hist.index.date < session] if not hist.empty else hist
+    previous_close = float(before['Close'].iloc[-1]) if not before.empty else None
+    
+    state = load_indicator_state(symbol, store)
+    ma200 = state.mean(200) if state is not None else None
+    
+    return {'previous_close': previous_close, 'ma200': ma200}
+
+def market_session_date(symbol, timestamp):
+    """Fecha de la sesión de un mercado para una marca de tiempo (sin zona se toma como UTC)
+    
+    Se usa la zona horaria del mercado: en UTC, una barra de Tokio a primera hora
+    o de Nueva York a última caería en otro día.
+    """
+    timestamp = pd.Timestamp(timestamp)
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.tz_localize('UTC')
+    
+    config = MARKETS_CONFIG.get(symbol)
+    if config is not None:
+        timestamp = timestamp.tz_convert(config['timezone'])
+    
+    return timestamp.date()
+
+def update_intraday(symbols, intraday=None):
+    """Añade a los buffers intradía las barras de 1 minuto nuevas de varios mercados"""
+    intraday = intraday or get_intraday_store()
+    intraday.last_fetch = time_module.time()
+    
+    symbols = get_fetch_scheduler().available(symbols)
+    if not symbols:
+        return 0
+    
     try:
-        # Zona horaria del mercado
-        market_tz = pytz.timezone(timezone_str)
-        now_market = datetime.now(market_tz)
-        
-        # Obtener día de la semana (0=lunes, 6=domingo)
-        weekday = now_market.weekday()
-        
-        # Mercados cerrados en fin de semana
-        if weekday >= 5:  # Sábado o domingo
-            next_monday = now_market.replace(hour=9, minute=0, second=0, microsecond=0)
-            while next_monday.weekday() != 0:  # Buscar próximo lunes
-                next_monday = next_monday.replace(day=next_monday.day + 1)
-            
-            return {
-                'is_open': False,
-                'status': 'Cerrado (Fin de semana)',
-                'next_action': f'Abre el lunes a las 09:00'
-            }
-        
-        # Horarios de apertura y cierre (simplificado)
-        market_open = now_market.replace(hour=9, minute=0, second=0, microsecond=0)
-        market_close = now_market.replace(hour=17, minute=0, second=0, microsecond=0)
-        
-        current_time = now_market.time()
-        
-        if market_open.time() <= current_time <= market_close.time():
-            return {
-                'is_open': True,
-                'status': 'Abierto',
-                'next_action': f'Cierra a las {market_close.strftime("%H:%M")}'
-            }
-        elif current_time < market_open.time():
-            return {
-                'is_open': False,
-                'status': 'Pre-mercado',
-                'next_action': f'Abre a las {market_open.strftime("%H:%M")}'
-            }
-        else:
-            return {
-                'is_open': False,
-                'status': 'Post-mercado',
-                'next_action': f'Abre mañana a las {market_open.strftime("%H:%M")}'
-            }
-            
+        panel = download_intraday_panel(symbols)
     except Exception as e:
-        return {
-            'is_open': False,
-            'status': 'Estado desconocido',
-            'next_action': 'Verificar zona horaria'
-        }
+        print(f"Error en la descarga intradía: {e}")
+        return 0
+    
+    written = 0
+    with get_telemetry().timer('parse', 'intraday'):
+        for symbol, frame in split_market_panel(panel, symbols).items():
+            # La sesión es la fecha local (del mercado) de la última barra; al cambiar se vacía el buffer
+            session = market_session_date(symbol, frame.index[-1])
+            reference = None
+            if intraday.needs_reset(symbol, session):
+                reference = get_intraday_reference(symbol, session)
+            written += intraday.update(symbol, frame, session, reference)
+    
+    return written
 
-def get_global_sentiment():
-    """Calcula el sentimiento global del mercado"""
-    market_data = get_market_data()
+_intraday_flight = SingleFlight()
+
+def refresh_intraday(intraday=None):
+    """Descarga las barras de 1 minuto de los símbolos que piden las sesiones
+    
+    Pensada para el hilo de refresco: como mucho una descarga cada
+    INTRADAY_REFRESH segundos (una sola aunque se llame desde varios hilos),
+    salvo que alguna sesión acabe de pedir símbolos nuevos, y ninguna si ninguna
+    sesión está en modo intradía. Devuelve las barras escritas.
+    """
+    intraday = intraday or get_intraday_store()
+    symbols = intraday.wanted()
+    pending = intraday.take_pending()
+    
+    if not symbols or (intraday.age() < INTRADAY_REFRESH and not pending):
+        return 0
     
+    return _intraday_flight.do('intraday', lambda: update_intraday(symbols, intraday))
+
+def get_intraday_market_data(symbols, labels=TREND_LABELS):
+    """Datos de los mercados calculados desde su última barra de 1 minuto
+    
+    Solo lee los buffers en memoria (nunca descarga): los símbolos se piden con
+    IntradayStore.request() y los descarga refresh_intraday en segundo plano.
+    """
+    intraday = get_intraday_store()
+    
+    market_data = {}
+    for symbol in symbols:
+        metrics = intraday.metrics(symbol)
+        if metrics is None:
+            continue
+        market_data[symbol] = {
+            'price': metrics['price'],
+            'change_percent': metrics['change_percent'],
+            'ma200_trend': labels[metrics['trend']],
+            'trend': metrics['trend'],
+            'sparkline': metrics['sparkline'],
+            'last_update': datetime.fromtimestamp(metrics['last_minute'] * 60).strftime('%H:%M'),
+            'intraday': True
+        }
+    
+    return market_data
+
+def get_market_status(symbol, now=None):
+    """Determina si un mercado está abierto o cerrado"""
+    try:
+        return get_market_statuses([symbol], now)[symbol]
+    except Exception as e:
+        print(f"Error calculando el estado de {symbol}: {e}")
+        return UNKNOWN_STATUS
+
+def get_cached_market_data(batch=True):
+    """Último snapshot guardado en la caché compartida, aunque esté caducado (sin descargar)"""
+    entry = get_cache_backend().get(snapshot_cache_key(batch))
+    return entry.value if entry is not None else None
+
+def get_global_sentiment(market_data=None):
+    """Calcula el sentimiento global del mercado sobre un snapshot ya obtenido
+
+    Sin market_data se usa el último snapshot de la caché; nunca se descarga.
+    """
+    if market_data is None:
+        market_data = get_cached_market_data()
+
     if not market_data:
         return "Neutral"
+
+    return snapshot_breadth(market_data)['sentiment']
+
+@shared_cache(ttl=get_symbols_cache_ttl, namespace='data_utils.breadth_history')  # Cambia con la última barra guardada
+def get_breadth_history(symbols):
+    """Serie diaria de amplitud y sentimiento a partir del histórico guardado en disco"""
+    store = get_history_store()
+
+    histories = {}
+    with get_telemetry().timer('parse', 'load'):
+        for symbol in symbols:
+            hist = store.load_window(symbol)
+            if not hist.empty:
+                histories[symbol] = hist
+
+    with get_telemetry().timer('compute', 'breadth'):
+        return history_breadth(build_close_matrix(histories))
+
+def load_close_matrix(symbols, start):
+    """Matriz de cierres (fechas × símbolos) del histórico guardado en disco desde una fecha"""
+    store = get_history_store()
     
-    # Contar mercados por tendencia
-    positive = sum(1 for data in market_data.values() 
-                  if data and data['change_percent'] > 0)
-    negative = sum(1 for data in market_data.values() 
-                  if data and data['change_percent'] < 0)
-    total = len([d for d in market_data.values() if d])
+    histories = {}
+    with get_telemetry().timer('parse', 'load'):
+        for symbol in symbols:
+            hist = store.load(symbol, start=start)
+            if not hist.empty:
+                histories[symbol] = hist
     
-    if total == 0:
-        return "Sin datos"
+    return build_close_matrix(histories)
+
+# Correlación entre mercados: estado incremental compartido por todas las sesiones del proceso
+_correlation_tracker = None
+_correlation_lock = threading.Lock()
+
+def get_correlation_matrix(symbols, window, version=None):
+    """Correlación móvil de las rentabilidades diarias de varios mercados sobre `window` sesiones
     
-    positive_ratio = positive / total
+    version identifica los datos (p. ej. la versión del snapshot publicado): con
+    la misma versión se devuelve la matriz en caché sin leer el disco; con otra
+    solo se releen los últimos días de cada símbolo y se actualiza la covarianza
+    de forma incremental. La matriz devuelta es compartida: no se debe modificar.
+    """
+    global _correlation_tracker
+    symbols = tuple(symbols)
+    telemetry = get_telemetry()
     
-    if positive_ratio > 0.7:
-        return "Muy optimista"
-    elif positive_ratio > 0.6:
-        return "Optimista"
-    elif positive_ratio > 0.4:
-        return "Neutral"
-    elif positive_ratio > 0.3:
-        return "Pesimista"
-    else:
-        return "Muy pesimista"
+    with _correlation_lock:
+        tracker = _correlation_tracker
+        if tracker is None or tracker.symbols != symbols:
+            close = load_close_matrix(symbols, datetime.now() - timedelta(days=CORRELATION_HISTORY_DAYS))
+            tracker = _correlation_tracker = CorrelationTracker(close, symbols, version)
+        elif version is None or version != tracker.version:
+            close = load_close_matrix(symbols, tracker.revision_start(datetime.now()))
+            with telemetry.timer('compute', 'correlation_update'):
+                tracker.update(close, version)
+        
+        with telemetry.timer('compute', 'correlation'):
+            return tracker.correlation(window)
 
 def format_currency(value, symbol="$"):
     """Formatea valores monetarios"""
@@ -301,12 +750,14 @@ def get_market_hours_info():
     """Información sobre horarios de mercados"""
     info = {}
     
+    # Estado de todos los mercados con una sola consulta al calendario
+    statuses = get_market_statuses()
+    
     for symbol, config in MARKETS_CONFIG.items():
-        market_status = get_market_status(config['timezone'])
         info[symbol] = {
             'name': config['name'],
             'timezone': config['timezone'],
-            'status': market_status
+            'status': statuses[symbol]
         }
     
     return info
\ No newline at end of file
@@ -0,0 +1,189 @@
+import random
+import threading
+import time
+
+from telemetry import get_telemetry
+
+# Ritmo sostenido y ráfaga máxima de peticiones al proveedor de datos
+FETCH_RATE = 2.0    # Peticiones por segundo
+FETCH_BURST = 5
+
+# Reintentos con espera exponencial y jitter completo (segundos)
+FETCH_RETRIES = 3
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 8.0
+
+# Circuito por símbolo: fallos seguidos para abrirlo y segundos hasta volver a probar
+BREAKER_THRESHOLD = 3
+BREAKER_RESET = 120
+
+
+class CircuitOpenError(Exception):
+    """El circuito de los símbolos pedidos está abierto: no se llama al proveedor"""
+
+
+class TokenBucket:
+    """Limitador de ritmo: `rate` fichas por segundo con hasta `capacity` acumuladas"""
+
+    def __init__(self, rate=FETCH_RATE, capacity=FETCH_BURST):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self):
+        """Toma una ficha si la hay; si no, devuelve los segundos que faltan"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self, timeout=None):
+        """Espera a tener una ficha; False si se agota el plazo"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        while True:
+            wait_time = self._reserve()
+            if wait_time == 0:
+                return True
+            if deadline is not None and time.monotonic() + wait_time > deadline:
+                return False
+            time.sleep(wait_time)
+
+
+class CircuitBreaker:
+    """Circuito por símbolo: tras varios fallos seguidos deja de pedirse un tiempo
+
+    Pasado reset_timeout el circuito queda medio abierto: se permite una sola
+    prueba (la primera llamada a allow) y un acierto lo cierra; un fallo lo
+    vuelve a abrir. Una prueba sin resultado en reset_timeout se da por perdida.
+    """
+
+    def __init__(self, threshold=BREAKER_THRESHOLD, reset_timeout=BREAKER_RESET):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self._failures = {}
+        self._opened_at = {}
+        self._probing = {}  # Símbolo -> inicio de la prueba en curso (circuito medio abierto)
+        self._lock = threading.Lock()
+
+    def _can_probe(self, symbol, now):
+        """True si el circuito está cerrado o admite ahora la prueba de medio abierto"""
+        opened_at = self._opened_at.get(symbol)
+        if opened_at is None:
+            return True
+        if now - opened_at < self.reset_timeout:
+            return False
+        probing = self._probing.get(symbol)
+        return probing is None or now - probing >= self.reset_timeout
+
+    def available(self, symbol):
+        """True si se podría pedir el símbolo (sin reservar la prueba de medio abierto)"""
+        with self._lock:
+            return self._can_probe(symbol, time.monotonic())
+
+    def allow(self, symbol):
+        """True si se puede pedir el símbolo; con el circuito medio abierto reserva la única prueba"""
+        now = time.monotonic()
+        with self._lock:
+            if not self._can_probe(symbol, now):
+                return False
+            if symbol in self._opened_at:
+                self._probing[symbol] = now
+            return True
+
+    def record_success(self, symbol):
+        with self._lock:
+            self._failures.pop(symbol, None)
+            self._opened_at.pop(symbol, None)
+            self._probing.pop(symbol, None)
+
+    def record_failure(self, symbol):
+        with self._lock:
+            failures = self._failures.get(symbol, 0) + 1
+            self._failures[symbol] = failures
+            self._probing.pop(symbol, None)
+            if failures >= self.threshold:
+                self._opened_at[symbol] = time.monotonic()
+
+    def open_symbols(self):
+        """Símbolos con el circuito abierto ahora mismo"""
+        now = time.monotonic()
+        with self._lock:
+            return [symbol for symbol, opened_at in self._opened_at.items()
+                    if now - opened_at < self.reset_timeout]
+
+
+def backoff_delay(attempt, base=BACKOFF_BASE, cap=BACKOFF_MAX):
+    """Espera antes del reintento `attempt` (0, 1, ...) con jitter completo"""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class FetchScheduler:
+    """Canaliza las peticiones al proveedor con límite de ritmo, reintentos y circuitos"""
+
+    def __init__(self, bucket=None, breaker=None, retries=FETCH_RETRIES):
+        self.bucket = bucket or TokenBucket()
+        self.breaker = breaker or CircuitBreaker()
+        self.retries = retries
+
+    def available(self, symbols):
+        """Símbolos cuyo circuito permite pedirlos (no reserva ninguna prueba)"""
+        return [symbol for symbol in symbols if self.breaker.available(symbol)]
+
+    def call(self, symbols, fn):
+        """Ejecuta fn() para los símbolos dados respetando ritmo, reintentos y circuitos
+
+        Se llama al proveedor si el circuito de algún símbolo lo permite (con el
+        circuito medio abierto, solo la llamada que reserva la prueba). Un acierto
+        cierra el circuito de todos los símbolos; si se agotan los reintentos se
+        apunta un fallo a los permitidos y se relanza el último error.
+        """
+        symbols = list(symbols)
+        allowed = [symbol for symbol in symbols if self.breaker.allow(symbol)]
+        if not allowed:
+            raise CircuitOpenError(f"Circuito abierto para {', '.join(symbols)}")
+
+        for attempt in range(self.retries):
+            self.bucket.acquire()
+            try:
+                result = fn()
+            except Exception as e:
+                error = e
+                if attempt + 1 < self.retries:
+                    time.sleep(backoff_delay(attempt))
+                continue
+
+            for symbol in symbols:
+                self.breaker.record_success(symbol)
+            return result
+
+        # Solo cuentan como fallo los símbolos cuyo circuito permitía esta llamada
+        for symbol in allowed:
+            self.breaker.record_failure(symbol)
+        raise error
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_fetch_scheduler():
+    """Planificador de peticiones compartido por todo el proceso"""
+    global _scheduler
+
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = FetchScheduler()
+            get_telemetry().register_gauge(
+                'open_circuits', 'Símbolos con el circuito abierto.',
+                lambda: len(get_fetch_scheduler().breaker.open_symbols())
+            )
+
+    return _scheduler
@@ -0,0 +1,166 @@
+import os
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+import pandas as pd
+
+# Ubicación del almacén local de históricos (configurable por variable de entorno)
+DEFAULT_HISTORY_PATH = os.environ.get(
+    'MAPA_HISTORY_DB',
+    os.path.join('.cache', 'mapa_bursatil', 'history.sqlite')
+)
+
+# Columnas OHLCV que se guardan por barra
+OHLCV_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+
+# Días que se vuelven a pedir al actualizar (la última barra puede estar incompleta)
+HISTORY_OVERLAP_DAYS = 3
+
+# Ventana de histórico que se sirve a la aplicación
+HISTORY_WINDOW_DAYS = 365
+
+
+class HistoryStore:
+    """Almacén local de barras diarias OHLCV por símbolo sobre SQLite"""
+
+    def __init__(self, path=DEFAULT_HISTORY_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS ohlcv (
+                    symbol TEXT NOT NULL,
+                    date TEXT NOT NULL,
+                    open REAL,
+                    high REAL,
+                    low REAL,
+                    close REAL,
+                    volume REAL,
+                    PRIMARY KEY (symbol, date)
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS indicator_state (
+                    symbol TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    PRIMARY KEY (symbol, name)
+                )
+            """)
+
+    def _connect(self):
+        """Abre una conexión nueva (una por operación, válida entre hilos)"""
+        return sqlite3.connect(self.path, timeout=30)
+
+    def last_timestamp(self, symbol):
+        """Fecha de la última barra guardada de un símbolo, o None si no hay datos"""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT MAX(date) FROM ohlcv WHERE symbol = ?", (symbol,)
+            ).fetchone()
+
+        return pd.Timestamp(row[0]) if row and row[0] else None
+
+    def last_timestamps(self, symbols):
+        """Fecha de la última barra guardada de cada símbolo"""
+        return {symbol: self.last_timestamp(symbol) for symbol in symbols}
+
+    def append(self, symbol, hist):
+        """Guarda (o reemplaza) las barras de un histórico descargado"""
+        if hist is None or hist.empty:
+            return 0
+
+        frame = hist.reindex(columns=OHLCV_COLUMNS).dropna(subset=['Close'])
+        dates = frame.index.strftime('%Y-%m-%d')
+
+        rows = [
+            (symbol, date, *(None if pd.isna(value) else float(value) for value in values))
+            for date, values in zip(dates, frame.itertuples(index=False, name=None))
+        ]
+
+        with self._lock, self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO ohlcv VALUES (?, ?, ?, ?, ?, ?, ?)", rows
+            )
+
+        return len(rows)
+
+    def load(self, symbol, start=None):
+        """Lee el histórico de un símbolo desde disco, opcionalmente desde una fecha"""
+        query = "SELECT date, open, high, low, close, volume FROM ohlcv WHERE symbol = ?"
+        params = [symbol]
+
+        if start is not None:
+            query += " AND date >= ?"
+            params.append(pd.Timestamp(start).strftime('%Y-%m-%d'))
+
+        query += " ORDER BY date"
+
+        with self._connect() as conn:
+            rows = conn.execute(query, params).fetchall()
+
+        hist = pd.DataFrame(rows, columns=['Date'] + OHLCV_COLUMNS)
+        hist['Date'] = pd.to_datetime(hist['Date'])
+
+        return hist.set_index('Date')
+
+    def load_window(self, symbol, days=HISTORY_WINDOW_DAYS):
+        """Lee la ventana reciente (por defecto 1 año) de un símbolo"""
+        return self.load(symbol, start=datetime.now() - timedelta(days=days))
+
+    def save_state(self, symbol, name, payload):
+        """Guarda el estado serializado (texto) de un indicador incremental"""
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO indicator_state VALUES (?, ?, ?)",
+                (symbol, name, payload)
+            )
+
+    def load_state(self, symbol, name):
+        """Lee el estado serializado de un indicador, o None si no existe"""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT payload FROM indicator_state WHERE symbol = ? AND name = ?",
+                (symbol, name)
+            ).fetchone()
+
+        return row[0] if row else None
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_history_store():
+    """Devuelve el almacén compartido por todo el proceso"""
+    global _store
+
+    with _store_lock:
+        if _store is None:
+            _store = HistoryStore()
+
+    return _store
+
+
+def set_history_store(store):
+    """Sustituye el almacén del proceso (p. ej. uno vacío en un benchmark)"""
+    global _store
+
+    with _store_lock:
+        _store = store
+
+    return store
+
+
+def fetch_start(last_timestamp):
+    """Fecha desde la que hay que pedir barras nuevas dado lo ya guardado"""
+    if last_timestamp is None:
+        return None
+
+    return (last_timestamp - timedelta(days=HISTORY_OVERLAP_DAYS)).strftime('%Y-%m-%d')
@@ -0,0 +1,147 @@
+import csv
+import os
+import threading
+from datetime import datetime
+
+# Fichero de instrumentos (una fila por símbolo); revisar al añadir mercados
+INSTRUMENTS_PATH = os.environ.get(
+    'MAPA_INSTRUMENTS_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instruments.csv')
+)
+
+# Columnas del fichero y cómo se convierten al cargarlo
+TEXT_COLUMNS = ('symbol', 'name', 'country', 'timezone', 'region', 'map_region', 'calendar')
+FLOAT_COLUMNS = ('lat', 'lon')
+TIME_COLUMNS = ('open_time', 'close_time', 'break_start', 'break_end')
+COLUMNS = TEXT_COLUMNS + FLOAT_COLUMNS + TIME_COLUMNS
+
+# Índices precomputados: nombre -> columnas que forman la clave
+INDEXES = {
+    'region': ('region',),
+    'map_region': ('map_region',),
+    'timezone': ('timezone',),
+    'country': ('country',),
+    'calendar': ('calendar',),
+    'session': ('timezone', 'open_time', 'close_time', 'break_start', 'break_end'),
+}
+
+
+def _parse_time(value):
+    """'HH:MM' -> time; vacío -> None"""
+    value = (value or '').strip()
+    return datetime.strptime(value, '%H:%M').time() if value else None
+
+
+def _parse_value(column, value):
+    if column in FLOAT_COLUMNS:
+        return float(value)
+    if column in TIME_COLUMNS:
+        return _parse_time(value)
+    return (value or '').strip() or None
+
+
+class InstrumentRegistry:
+    """Registro de instrumentos en columnas con índices por región, zona, país y sesión
+
+    Cada columna es una lista alineada por posición; los índices guardan las
+    posiciones de cada grupo, así que buscar un símbolo es O(1) y listar un
+    grupo es O(k) en el tamaño del grupo, sin recorrer todo el registro.
+    """
+
+    def __init__(self, columns):
+        self.columns = {column: list(columns.get(column, ())) for column in COLUMNS}
+        self.symbols = self.columns['symbol']
+        self._positions = {}
+
+        for position, symbol in enumerate(self.symbols):
+            if symbol in self._positions:
+                raise ValueError(f"Símbolo duplicado en el registro: {symbol}")
+            self._positions[symbol] = position
+
+        # Posiciones de cada grupo, en el orden del fichero
+        self._indexes = {}
+        for name, key_columns in INDEXES.items():
+            groups = {}
+            key_values = zip(*(self.columns[column] for column in key_columns))
+            for position, key in enumerate(key_values):
+                key = key[0] if len(key_columns) == 1 else key
+                groups.setdefault(key, []).append(position)
+            self._indexes[name] = groups
+
+    @classmethod
+    def from_csv(cls, path=INSTRUMENTS_PATH):
+        """Carga el registro desde un CSV con las columnas de COLUMNS"""
+        columns = {column: [] for column in COLUMNS}
+
+        with open(path, encoding='utf-8', newline='') as f:
+            for row in csv.DictReader(f):
+                for column in COLUMNS:
+                    columns[column].append(_parse_value(column, row.get(column)))
+
+        return cls(columns)
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def __contains__(self, symbol):
+        return symbol in self._positions
+
+    def position(self, symbol):
+        """Posición de un símbolo en las columnas (KeyError si no existe)"""
+        return self._positions[symbol]
+
+    def column(self, name):
+        """Lista completa de una columna"""
+        return self.columns[name]
+
+    def value(self, symbol, column):
+        """Valor de una columna para un símbolo"""
+        return self.columns[column][self._positions[symbol]]
+
+    def get(self, symbol):
+        """Fila de un símbolo como dict (None si no existe)"""
+        position = self._positions.get(symbol)
+        if position is None:
+            return None
+        return {column: values[position] for column, values in self.columns.items()}
+
+    def keys(self, index):
+        """Claves de un índice en orden de primera aparición"""
+        return list(self._indexes[index])
+
+    def groups(self, index, symbols=None):
+        """Grupos de un índice como clave -> símbolos
+
+        Si se indica `symbols` solo se incluyen esos símbolos (y se omiten los grupos vacíos).
+        """
+        wanted = None if symbols is None else set(symbols)
+        groups = {}
+
+        for key, positions in self._indexes[index].items():
+            members = [self.symbols[position] for position in positions]
+            if wanted is not None:
+                members = [symbol for symbol in members if symbol in wanted]
+            if members:
+                groups[key] = members
+
+        return groups
+
+    def as_config(self, symbols=None):
+        """Vista símbolo -> dict con el formato del antiguo MARKETS_CONFIG"""
+        symbols = self.symbols if symbols is None else symbols
+        return {symbol: self.get(symbol) for symbol in symbols if symbol in self}
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    """Registro de instrumentos compartido (se carga una vez por proceso)"""
+    global _registry
+
+    with _registry_lock:
+        if _registry is None:
+            _registry = InstrumentRegistry.from_csv()
+
+    return _registry
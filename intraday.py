@@ -0,0 +1,261 @@
+import threading
+import time
+
+import numpy as np
+
+from market_metrics import TREND_UP, TREND_DOWN, TREND_NO_DATA
+from telemetry import get_telemetry
+
+# Minutos guardados por símbolo: cubre la sesión más larga (8h30) con margen.
+# Cada minuto ocupa 12 bytes (minuto int32, cierre y volumen float32): ~7 KB por símbolo.
+INTRADAY_CAPACITY = 600
+
+# Puntos de la sparkline de cada tarjeta
+SPARKLINE_POINTS = 48
+
+# Sin ninguna sesión que pida barras intradía en este tiempo se dejan de descargar (segundos)
+INTRADAY_IDLE = 300
+
+NANOSECONDS_PER_MINUTE = 60 * 10 ** 9
+
+
+class MinuteRingBuffer:
+    """Barras de 1 minuto de la sesión actual en arrays de tamaño fijo
+
+    Los minutos (epoch UTC) se guardan como int32 y cierre y volumen como
+    float32 en buffers circulares: la memoria no crece con la sesión y añadir
+    barras nuevas no copia las anteriores.
+    """
+
+    __slots__ = ('capacity', 'session', 'reference', '_minutes', '_close', '_volume', '_head', '_size')
+
+    def __init__(self, capacity=INTRADAY_CAPACITY):
+        self.capacity = capacity
+        self._minutes = np.zeros(capacity, dtype=np.int32)
+        self._close = np.zeros(capacity, dtype=np.float32)
+        self._volume = np.zeros(capacity, dtype=np.float32)
+        self.reset()
+
+    def reset(self, session=None, reference=None):
+        """Vacía el buffer para una sesión nueva
+
+        reference guarda los datos diarios de partida (previous_close, ma200).
+        """
+        self.session = session
+        self.reference = reference or {}
+        self._head = 0
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def nbytes(self):
+        return self._minutes.nbytes + self._close.nbytes + self._volume.nbytes
+
+    def _ordered(self, values):
+        """Vista en orden cronológico (sin copia mientras no se haya dado la vuelta)"""
+        if self._size < self.capacity:
+            return values[:self._size]
+        return np.concatenate((values[self._head:], values[:self._head]))
+
+    def minutes(self):
+        return self._ordered(self._minutes)
+
+    def closes(self):
+        return self._ordered(self._close)
+
+    def volumes(self):
+        return self._ordered(self._volume)
+
+    def last_minute(self):
+        return int(self._minutes[(self._head - 1) % self.capacity]) if self._size else None
+
+    def last_close(self):
+        return float(self._close[(self._head - 1) % self.capacity]) if self._size else None
+
+    def first_close(self):
+        if not self._size:
+            return None
+        return float(self._close[self._head if self._size == self.capacity else 0])
+
+    def extend(self, minutes, closes, volumes):
+        """Añade barras ordenadas; la barra del último minuto se sustituye (sigue formándose)
+
+        Devuelve el número de barras escritas.
+        """
+        minutes = np.asarray(minutes, dtype=np.int32)
+        closes = np.asarray(closes, dtype=np.float32)
+        volumes = np.asarray(volumes, dtype=np.float32)
+
+        last = self.last_minute()
+        written = 0
+
+        if last is not None:
+            # Actualizar la barra en curso si vuelve a llegar
+            same = np.flatnonzero(minutes == last)
+            if same.size:
+                position = (self._head - 1) % self.capacity
+                self._close[position] = closes[same[-1]]
+                self._volume[position] = volumes[same[-1]]
+                written += 1
+
+            newer = minutes > last
+            minutes, closes, volumes = minutes[newer], closes[newer], volumes[newer]
+
+        # Solo caben las últimas `capacity` barras
+        minutes, closes, volumes = minutes[-self.capacity:], closes[-self.capacity:], volumes[-self.capacity:]
+        count = minutes.size
+        if count:
+            positions = (self._head + np.arange(count)) % self.capacity
+            self._minutes[positions] = minutes
+            self._close[positions] = closes
+            self._volume[positions] = volumes
+            self._head = (self._head + count) % self.capacity
+            self._size = min(self._size + count, self.capacity)
+            written += count
+
+        return written
+
+    def sparkline(self, points=SPARKLINE_POINTS):
+        """Cierres de la sesión reducidos a `points` valores equiespaciados"""
+        closes = self.closes()
+        if closes.size < 2:
+            return ()
+        if closes.size > points:
+            closes = closes[np.linspace(0, closes.size - 1, points).astype(int)]
+        return tuple(round(float(value), 4) for value in closes)
+
+    def metrics(self):
+        """Precio, cambio y tendencia MA200 a partir de la última barra"""
+        price = self.last_close()
+        if price is None:
+            return None
+
+        previous_close = self.reference.get('previous_close')
+        ma200 = self.reference.get('ma200')
+
+        # Sin cierre anterior se mide desde la primera barra guardada de la sesión
+        base = previous_close or self.first_close()
+        change_percent = (price - base) / base * 100 if base else 0.0
+
+        if ma200 is None or np.isnan(ma200):
+            trend = TREND_NO_DATA
+        else:
+            trend = TREND_UP if price > ma200 else TREND_DOWN
+
+        return {
+            'price': price,
+            'change_percent': change_percent,
+            'trend': trend,
+            'sparkline': self.sparkline(),
+            'bars': self._size,
+            'last_minute': self.last_minute()
+        }
+
+
+class IntradayStore:
+    """Buffers intradía de todos los símbolos del proceso
+
+    version aumenta cada vez que entra alguna barra, para que la interfaz sepa
+    si hay algo nuevo que pintar. Las sesiones solo leen los buffers y apuntan
+    con request() qué símbolos quieren; la descarga la hace un hilo en segundo plano.
+    """
+
+    def __init__(self, capacity=INTRADAY_CAPACITY):
+        self.capacity = capacity
+        self.version = 0
+        self.last_fetch = 0.0
+        self._buffers = {}
+        self._wanted = {}   # Símbolo -> última vez que alguna sesión lo pidió
+        self._pending = set()   # Pedidos de nuevo y aún sin descargar
+        self._lock = threading.Lock()
+
+    def request(self, symbols):
+        """Apunta que una sesión quiere las barras de estos símbolos
+
+        Devuelve True si alguno no se estaba pidiendo ya (hay que descargarlo pronto).
+        """
+        now = time.time()
+        with self._lock:
+            new = {symbol for symbol in symbols if now - self._wanted.get(symbol, 0.0) >= INTRADAY_IDLE}
+            self._wanted.update(dict.fromkeys(symbols, now))
+            self._pending |= new
+        return bool(new)
+
+    def take_pending(self):
+        """Símbolos pedidos de nuevo desde la última llamada (y los olvida)"""
+        with self._lock:
+            pending, self._pending = self._pending, set()
+        return pending
+
+    def wanted(self, idle=INTRADAY_IDLE):
+        """Símbolos que alguna sesión ha pedido en los últimos `idle` segundos"""
+        now = time.time()
+        with self._lock:
+            return [symbol for symbol, requested_at in self._wanted.items() if now - requested_at < idle]
+
+    def buffer(self, symbol):
+        with self._lock:
+            buffer = self._buffers.get(symbol)
+            if buffer is None:
+                buffer = self._buffers[symbol] = MinuteRingBuffer(self.capacity)
+            return buffer
+
+    def needs_reset(self, symbol, session):
+        """True si el símbolo aún no tiene barras de esa sesión"""
+        buffer = self._buffers.get(symbol)
+        return buffer is None or buffer.session != session
+
+    def update(self, symbol, frame, session, reference=None):
+        """Incorpora las barras de 1 minuto de un DataFrame (índice temporal, Close y Volume)"""
+        buffer = self.buffer(symbol)
+
+        with self._lock:
+            if buffer.session != session:
+                buffer.reset(session, reference)
+
+            minutes = (frame.index.asi8 // NANOSECONDS_PER_MINUTE).astype(np.int32)
+            volume = frame['Volume'].to_numpy(dtype=np.float32) if 'Volume' in frame else np.zeros(len(frame))
+            written = buffer.extend(minutes, frame['Close'].to_numpy(dtype=np.float32), volume)
+
+            if written:
+                self.version += 1
+
+        return written
+
+    def metrics(self, symbol):
+        """Métricas intradía de un símbolo (None si no tiene barras)"""
+        buffer = self._buffers.get(symbol)
+        if buffer is None:
+            return None
+        with self._lock:
+            return buffer.metrics()
+
+    def age(self):
+        """Segundos desde la última descarga intradía"""
+        return time.time() - self.last_fetch
+
+    @property
+    def nbytes(self):
+        with self._lock:
+            return sum(buffer.nbytes for buffer in self._buffers.values())
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_intraday_store():
+    """Buffers intradía compartidos por todas las sesiones del proceso"""
+    global _store
+
+    with _store_lock:
+        if _store is None:
+            _store = IntradayStore()
+            get_telemetry().register_gauge(
+                'intraday_bytes', 'Memoria de los buffers intradía (bytes).',
+                lambda: get_intraday_store().nbytes
+            )
+
+    return _store
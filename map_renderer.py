@@ -0,0 +1,170 @@
+import html
+import threading
+from collections import OrderedDict
+from string import Template
+
+# Tarjetas en caché como máximo (de sobra para cientos de instrumentos por región)
+MAX_CACHED_CARDS = 5000
+
+# Tamaño de la sparkline intradía de cada tarjeta (píxeles)
+SPARKLINE_WIDTH = 110
+SPARKLINE_HEIGHT = 24
+
+# Plantillas compiladas una sola vez al importar el módulo
+MAP_TEMPLATE = Template("""
+    <div style="background: linear-gradient(180deg, #e3f2fd 0%, #bbdefb 100%);
+                border-radius: 15px; padding: 30px; margin: 20px 0;">
+        <h3 style="text-align: center; color: #1976d2; margin-bottom: 30px;">
+            🌍 Estado Global de Mercados Bursátiles
+        </h3>
+    $regions</div>""")
+
+REGION_TEMPLATE = Template("""
+        <div style="margin: 20px 0; padding: 20px; background: rgba(255,255,255,0.7);
+                    border-radius: 10px; border-left: 5px solid #1976d2;">
+            <h4 style="color: #1976d2; margin-bottom: 15px;">$name</h4>
+            <div style="display: flex; flex-wrap: wrap; gap: 15px; justify-content: center;">
+        $cards
+            </div>
+        </div>
+        """)
+
+CARD_TEMPLATE = Template("""
+                <div style="background: white; border-radius: 8px; padding: 15px;
+                           min-width: 140px; text-align: center; border: 2px solid $color;
+                           box-shadow: 0 2px 4px rgba(0,0,0,0.1); cursor: pointer;
+                           transition: transform 0.2s;"
+                           onmouseover="this.style.transform='scale(1.05)'"
+                           onmouseout="this.style.transform='scale(1)'">
+                    <div style="font-size: 28px; margin-bottom: 5px;">$emoji</div>
+                    <div style="font-weight: bold; font-size: 12px; color: #333; margin-bottom: 5px;">
+                        $name
+                    </div>
+                    <div style="color: $color; font-weight: bold; font-size: 16px; margin-bottom: 5px;">
+                        $change%
+                    </div>
+                    <div style="font-size: 12px; color: #666; margin-bottom: 3px;">
+                        $$$price
+                    </div>
+                    <div style="font-size: 10px; color: #888;">
+                        $status_emoji $status
+                    </div>$sparkline
+                </div>
+                """)
+
+SPARKLINE_TEMPLATE = Template("""
+                    <svg width="$width" height="$height" viewBox="0 0 $width $height" style="margin-top: 6px;">
+                        <polyline fill="none" stroke="$color" stroke-width="1.5" points="$points"/>
+                    </svg>""")
+
+
+def sparkline_svg(values, color, width=SPARKLINE_WIDTH, height=SPARKLINE_HEIGHT):
+    """Sparkline SVG de una serie de cierres (cadena vacía si no hay serie)"""
+    if not values or len(values) < 2:
+        return ''
+
+    low, high = min(values), max(values)
+    span = (high - low) or 1.0
+    step = width / (len(values) - 1)
+
+    points = ' '.join(
+        f"{index * step:.1f},{height - 1 - (value - low) / span * (height - 2):.1f}"
+        for index, value in enumerate(values)
+    )
+
+    return SPARKLINE_TEMPLATE.substitute(width=width, height=height, color=color, points=points)
+
+
+def card_key(symbol, data, status, color, emoji):
+    """Clave de la tarjeta: solo lo que se ve (precio y cambio redondeados, estado, sparkline)
+
+    color y emoji se calculan sobre el cambio sin redondear: cerca de los umbrales
+    el cambio redondeado caería en otra clase que la de la tabla.
+    """
+    return (
+        symbol,
+        round(data['price']),
+        round(data['change_percent'], 2),
+        color,
+        emoji,
+        bool(status['is_open']),
+        status['status'][:8],
+        tuple(data.get('sparkline') or ())
+    )
+
+
+class MapRenderer:
+    """Genera el HTML del mapa reutilizando el fragmento de cada tarjeta
+
+    Cada tarjeta se guarda en una caché LRU acotada con la clave de card_key; en
+    cada render solo se rellenan las plantillas de las tarjetas cuyo precio,
+    cambio o estado visibles han cambiado, el resto se reutiliza tal cual.
+    """
+
+    def __init__(self, emoji_fn, color_fn, max_cards=MAX_CACHED_CARDS):
+        self.emoji_fn = emoji_fn
+        self.color_fn = color_fn
+        self.max_cards = max_cards
+        self._cards = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _build_card(self, key, name):
+        symbol, price, change_pct, color, emoji, is_open, status, sparkline = key
+        return CARD_TEMPLATE.substitute(
+            color=color,
+            emoji=emoji,
+            name=html.escape(name.split('(')[0].strip()[:10]),
+            change=f"{change_pct:+.2f}",
+            price=f"{price:,.0f}",
+            status_emoji="🟢" if is_open else "🔴",
+            status=html.escape(status),
+            sparkline=sparkline_svg(sparkline, color)
+        )
+
+    def card(self, symbol, name, data, status):
+        """Fragmento HTML de una tarjeta (de la caché si no ha cambiado)"""
+        change_pct = data['change_percent']
+        key = card_key(symbol, data, status, self.color_fn(change_pct), self.emoji_fn(change_pct))
+
+        with self._lock:
+            fragment = self._cards.get(key)
+            if fragment is not None:
+                self._cards.move_to_end(key)
+                self.hits += 1
+                return fragment
+
+        fragment = self._build_card(key, name)
+
+        with self._lock:
+            self.misses += 1
+            self._cards[key] = fragment
+            while len(self._cards) > self.max_cards:
+                self._cards.popitem(last=False)
+
+        return fragment
+
+    def render(self, regions, market_data, market_status, names):
+        """HTML completo del mapa
+
+        regions: nombre de región -> símbolos; names: símbolo -> nombre del mercado.
+        Las regiones sin datos se muestran vacías, igual que antes.
+        """
+        region_fragments = []
+
+        for region_name, symbols in regions.items():
+            cards = [
+                self.card(symbol, names[symbol], market_data[symbol], market_status[symbol])
+                for symbol in symbols if market_data.get(symbol)
+            ]
+            region_fragments.append(
+                REGION_TEMPLATE.substitute(name=html.escape(region_name), cards=''.join(cards))
+            )
+
+        return MAP_TEMPLATE.substitute(regions=''.join(region_fragments))
+
+    def clear(self):
+        """Vacía la caché de tarjetas"""
+        with self._lock:
+            self._cards.clear()
@@ -0,0 +1,124 @@
+import numpy as np
+import pandas as pd
+
+from market_metrics import MA_WINDOW, TREND_UP, TREND_NO_DATA
+
+# Umbrales de sentimiento sobre la proporción de mercados al alza (de mayor a menor)
+SENTIMENT_LEVELS = (
+    (0.7, 'Muy optimista'),
+    (0.6, 'Optimista'),
+    (0.4, 'Neutral'),
+    (0.3, 'Pesimista'),
+)
+SENTIMENT_FLOOR = 'Muy pesimista'
+NO_DATA_LABEL = 'Sin datos'
+
+
+def sentiment_labels(positive_ratio):
+    """Etiqueta de sentimiento de cada proporción de mercados al alza (vectorizado)"""
+    ratios = np.asarray(positive_ratio, dtype=float)
+    conditions = [np.isnan(ratios)] + [ratios > threshold for threshold, _ in SENTIMENT_LEVELS]
+    choices = [NO_DATA_LABEL] + [label for _, label in SENTIMENT_LEVELS]
+    return np.select(conditions, choices, default=SENTIMENT_FLOOR)
+
+
+def sentiment_label(positive_ratio):
+    """Etiqueta de sentimiento para una proporción de mercados al alza"""
+    return str(sentiment_labels([positive_ratio])[0])
+
+
+def snapshot_breadth(market_data):
+    """Amplitud del mercado a partir de un snapshot ya calculado (sin E/S)
+
+    Devuelve avances, descensos, ratio A/D, proporción de mercados al alza,
+    mercados por encima de su MA200 y la etiqueta de sentimiento.
+    """
+    rows = [data for data in market_data.values() if data] if market_data else []
+
+    change = np.array([data['change_percent'] for data in rows], dtype=float)
+    trend = np.array([data.get('trend', TREND_NO_DATA) for data in rows], dtype=int)
+
+    advancing = int((change > 0).sum())
+    declining = int((change < 0).sum())
+    total = len(rows)
+    with_ma = int((trend != TREND_NO_DATA).sum())
+    above_ma = int((trend == TREND_UP).sum())
+
+    positive_ratio = advancing / total if total else float('nan')
+
+    return {
+        'advancing': advancing,
+        'declining': declining,
+        'unchanged': total - advancing - declining,
+        'total': total,
+        'ad_ratio': advancing / declining if declining else float('nan'),
+        'positive_ratio': positive_ratio,
+        'above_ma200': above_ma,
+        'above_ma200_ratio': above_ma / with_ma if with_ma else float('nan'),
+        'sentiment': sentiment_label(positive_ratio)
+    }
+
+
+def _moving_average_matrix(values, valid, window):
+    """Media de las últimas `window` observaciones válidas en cada celda (NaN si no hay)
+
+    Usa sumas acumuladas indexadas por rango de observación, de modo que los huecos
+    por festivos no cuentan como sesiones y todo el panel se calcula de una vez.
+    """
+    rank = np.cumsum(valid, axis=0)
+    cumulative = np.cumsum(np.where(valid, values, 0.0), axis=0)
+
+    # Suma acumulada tras la r-ésima observación de cada columna (fila 0: nada sumado)
+    by_rank = np.zeros((values.shape[0] + 1, values.shape[1]))
+    rows, cols = np.nonzero(valid)
+    by_rank[rank[rows, cols], cols] = cumulative[rows, cols]
+
+    start = (rank - window).clip(0)
+    window_sum = cumulative - np.take_along_axis(by_rank, start, axis=0)
+
+    return np.where(valid & (rank >= window), window_sum / window, np.nan)
+
+
+def history_breadth(close, ma_window=MA_WINDOW):
+    """Serie diaria de amplitud y sentimiento sobre la matriz de cierres (fechas × símbolos)
+
+    Cada mercado solo cuenta en las fechas en que cotizó; el cambio diario se mide
+    respecto a su cierre anterior aunque haya festivos en medio.
+    """
+    if close is None or close.empty:
+        return pd.DataFrame(columns=[
+            'advancing', 'declining', 'reporting', 'ad_ratio', 'ad_line',
+            'positive_ratio', 'above_ma200_ratio', 'sentiment'
+        ])
+
+    values = close.to_numpy(dtype=float)
+    valid = ~np.isnan(values)
+
+    previous = close.ffill().shift(1).to_numpy(dtype=float)
+    change = values - previous
+    reporting_mask = valid & ~np.isnan(previous)
+
+    advancing = (reporting_mask & (change > 0)).sum(axis=1)
+    declining = (reporting_mask & (change < 0)).sum(axis=1)
+    reporting = reporting_mask.sum(axis=1)
+
+    ma = _moving_average_matrix(values, valid, ma_window)
+    with_ma = ~np.isnan(ma)
+    above_ma = (with_ma & (values > ma)).sum(axis=1)
+    ma_count = with_ma.sum(axis=1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ad_ratio = np.where(declining > 0, advancing / declining, np.nan)
+        positive_ratio = np.where(reporting > 0, advancing / reporting, np.nan)
+        above_ratio = np.where(ma_count > 0, above_ma / ma_count, np.nan)
+
+    return pd.DataFrame({
+        'advancing': advancing,
+        'declining': declining,
+        'reporting': reporting,
+        'ad_ratio': ad_ratio,
+        'ad_line': np.cumsum(advancing - declining),
+        'positive_ratio': positive_ratio,
+        'above_ma200_ratio': above_ratio,
+        'sentiment': sentiment_labels(positive_ratio)
+    }, index=close.index)
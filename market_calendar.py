@@ -0,0 +1,216 @@
+import json
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+import numpy as np
+import pytz
+
+# Festivos por mercado (códigos MIC); revisar cada año con los calendarios oficiales
+HOLIDAYS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'market_holidays.json')
+
+# Días precomputados hacia atrás y hacia delante
+CALENDAR_PAST_DAYS = 7
+CALENDAR_FUTURE_DAYS = 45
+
+# Separación entre mercados en el índice plano (segundos, mayor que cualquier rango de fechas)
+MARKET_OFFSET = 10 ** 10
+
+WEEKDAYS_ES = ['lunes', 'martes', 'miércoles', 'jueves', 'viernes', 'sábado', 'domingo']
+
+# Tipos de evento en el índice de cada mercado
+EVENT_OPEN = 0
+EVENT_CLOSE = 1
+EVENT_BREAK = 2    # Inicio de la pausa de mediodía
+EVENT_RESUME = 3   # Fin de la pausa de mediodía
+
+
+def load_holidays(path=HOLIDAYS_PATH):
+    """Lee los festivos por calendario como conjuntos de fechas"""
+    try:
+        with open(path, encoding='utf-8') as f:
+            raw = json.load(f)
+    except FileNotFoundError:
+        return {}
+
+    return {
+        code: {datetime.strptime(day, '%Y-%m-%d').date() for day in days}
+        for code, days in raw.items()
+    }
+
+
+class MarketCalendar:
+    """Calendario precomputado de sesiones de todos los mercados en UTC
+
+    Para cada mercado guarda la lista ordenada de instantes de apertura, cierre
+    y pausas de mediodía. Todas las listas se concatenan en un único índice
+    desplazado por mercado, de modo que el estado de todos los mercados se
+    resuelve con una sola búsqueda binaria vectorizada (np.searchsorted).
+    """
+
+    def __init__(self, markets, holidays=None, start=None,
+                 past_days=CALENDAR_PAST_DAYS, future_days=CALENDAR_FUTURE_DAYS):
+        holidays = load_holidays() if holidays is None else holidays
+        start = start or datetime.now(timezone.utc)
+
+        self.symbols = list(markets)
+        self._index = {symbol: position for position, symbol in enumerate(self.symbols)}
+        self.valid_from = start - timedelta(days=past_days - 1)
+        self.valid_until = start + timedelta(days=future_days - 1)
+
+        self._timezones = {}
+        self._holidays = {}
+        times, kinds, counts = [], [], []
+
+        for position, symbol in enumerate(self.symbols):
+            config = markets[symbol]
+            market_tz = pytz.timezone(config['timezone'])
+            market_holidays = holidays.get(config.get('calendar'), set())
+
+            self._timezones[symbol] = market_tz
+            self._holidays[symbol] = market_holidays
+
+            events = self._build_events(config, market_tz, market_holidays, start, past_days, future_days)
+            times.extend(instant + position * MARKET_OFFSET for instant, _ in events)
+            kinds.extend(kind for _, kind in events)
+            counts.append(len(events))
+
+        self._times = np.asarray(times, dtype=np.int64)
+        self._kinds = np.asarray(kinds, dtype=np.int8)
+        self._counts = np.asarray(counts, dtype=np.int64)
+        self._starts = np.concatenate(([0], np.cumsum(self._counts)[:-1])).astype(np.int64)
+        self._offsets = np.arange(len(self.symbols), dtype=np.int64) * MARKET_OFFSET
+
+    @staticmethod
+    def _build_events(config, market_tz, market_holidays, start, past_days, future_days):
+        """Instantes (epoch UTC, tipo) de las sesiones de un mercado"""
+        events = []
+        first_day = start.astimezone(market_tz).date() - timedelta(days=past_days)
+
+        def instant(day, moment):
+            return int(market_tz.localize(datetime.combine(day, moment)).timestamp())
+
+        for offset in range(past_days + future_days):
+            day = first_day + timedelta(days=offset)
+            if day.weekday() >= 5 or day in market_holidays:
+                continue
+
+            events.append((instant(day, config['open_time']), EVENT_OPEN))
+            if config.get('break_start') and config.get('break_end'):
+                events.append((instant(day, config['break_start']), EVENT_BREAK))
+                events.append((instant(day, config['break_end']), EVENT_RESUME))
+            events.append((instant(day, config['close_time']), EVENT_CLOSE))
+
+        return events
+
+    def covers(self, now):
+        """True si el instante está dentro del rango precomputado"""
+        return self.valid_from <= now <= self.valid_until
+
+    def positions(self, now=None):
+        """Posición de `now` en el índice de cada mercado (una búsqueda para todos)"""
+        now = now or datetime.now(timezone.utc)
+        targets = int(now.timestamp()) + self._offsets
+        return np.searchsorted(self._times, targets, side='right') - self._starts
+
+    def status_all(self, now=None, symbols=None):
+        """Estado abierto/cerrado y próximo evento de todos los mercados a la vez
+
+        Si se indica `symbols` solo se buscan y describen esos mercados, así que
+        pedir el estado de uno solo no recorre todo el universo.
+        """
+        now = now or datetime.now(timezone.utc)
+
+        if symbols is None:
+            indexes = np.arange(len(self.symbols))
+            positions = self.positions(now)
+        else:
+            indexes = np.asarray([self._index[symbol] for symbol in symbols if symbol in self._index],
+                                 dtype=np.int64)
+            targets = int(now.timestamp()) + self._offsets[indexes]
+            positions = np.searchsorted(self._times, targets, side='right') - self._starts[indexes]
+
+        return {
+            self.symbols[index]: self._describe(index, self.symbols[index], int(position), now)
+            for index, position in zip(indexes.tolist(), positions.tolist())
+        }
+
+    def _event(self, index, position):
+        """(instante UTC, tipo) del evento `position` del mercado `index`"""
+        if position < 0 or position >= self._counts[index]:
+            return None, None
+
+        flat = self._starts[index] + position
+        instant = datetime.fromtimestamp(int(self._times[flat] - self._offsets[index]), timezone.utc)
+        return instant, int(self._kinds[flat])
+
+    def _describe(self, index, symbol, position, now):
+        """Traduce la posición en el índice a la descripción de estado de la app"""
+        market_tz = self._timezones[symbol]
+        now_market = now.astimezone(market_tz)
+
+        previous_event, previous_kind = self._event(index, position - 1)
+        next_event, next_kind = self._event(index, position)
+
+        status = {
+            'is_open': previous_kind in (EVENT_OPEN, EVENT_RESUME),
+            'previous_event': previous_event,
+            'next_event': next_event,
+            'seconds_to_next_event': (next_event - now).total_seconds() if next_event else None
+        }
+
+        if next_event is None:
+            status.update({'status': 'Estado desconocido', 'next_action': 'Calendario no disponible'})
+            return status
+
+        next_local = next_event.astimezone(market_tz)
+
+        if status['is_open']:
+            action = 'Pausa a las' if next_kind == EVENT_BREAK else 'Cierra a las'
+            status.update({'status': 'Abierto', 'next_action': f'{action} {next_local.strftime("%H:%M")}'})
+            return status
+
+        if previous_kind == EVENT_BREAK:
+            status.update({
+                'status': 'Pausa de mediodía',
+                'next_action': f'Reanuda a las {next_local.strftime("%H:%M")}'
+            })
+            return status
+
+        if now_market.weekday() >= 5:
+            label = 'Cerrado (Fin de semana)'
+        elif now_market.date() in self._holidays[symbol]:
+            label = 'Cerrado (Festivo)'
+        elif next_local.date() == now_market.date():
+            label = 'Pre-mercado'
+        else:
+            label = 'Post-mercado'
+
+        days_ahead = (next_local.date() - now_market.date()).days
+        if days_ahead == 0:
+            action = f'Abre a las {next_local.strftime("%H:%M")}'
+        elif days_ahead == 1:
+            action = f'Abre mañana a las {next_local.strftime("%H:%M")}'
+        else:
+            weekday = WEEKDAYS_ES[next_local.weekday()]
+            action = f'Abre el {weekday} {next_local.strftime("%d/%m")} a las {next_local.strftime("%H:%M")}'
+
+        status.update({'status': label, 'next_action': action})
+        return status
+
+
+_calendars = {}
+_calendar_lock = threading.Lock()
+
+
+def get_market_calendar(markets, now=None):
+    """Calendario compartido para un conjunto de mercados; se regenera al salir de rango"""
+    now = now or datetime.now(timezone.utc)
+    key = tuple(markets)
+
+    with _calendar_lock:
+        calendar = _calendars.get(key)
+        if calendar is None or not calendar.covers(now):
+            calendar = MarketCalendar(markets, start=now)
+            _calendars[key] = calendar
+
+    return calendar
@@ -0,0 +1,281 @@
+import numpy as np
+import pandas as pd
+
+# Ventanas de la correlación móvil entre mercados (sesiones)
+CORRELATION_WINDOWS = (30, 90, 250)
+
+# Histórico que se lee al construir el estado: cubre la ventana más larga (días naturales)
+CORRELATION_HISTORY_DAYS = 400
+
+# En cada actualización se vuelven a leer los últimos días para recoger barras
+# corregidas o que llegan tarde (días naturales)
+CORRELATION_REVISION_DAYS = 10
+
+# Por debajo de esta varianza un símbolo se considera sin movimiento (sin correlación)
+MIN_VARIANCE = 1e-12
+
+
+def daily_returns(close, previous=None):
+    """Rentabilidades logarítmicas diarias sobre la matriz de cierres (fechas × símbolos)
+
+    En las fechas en que un mercado no cotizó se arrastra su último cierre
+    (rentabilidad 0), para alinear mercados con calendarios distintos; antes del
+    primer cierre de un símbolo la rentabilidad es NaN. previous es la fila de
+    cierres (ya arrastrados) anterior a la primera fecha de close, para calcular
+    solo las últimas fechas sin volver a recorrer el histórico.
+    """
+    return _returns_and_filled(close, previous)[0]
+
+
+def _returns_and_filled(close, previous=None):
+    """Rentabilidades (DataFrame) y cierres arrastrados (array) de daily_returns"""
+    values = close.to_numpy(dtype=float)
+    if previous is not None:
+        values = np.vstack([previous, values])
+
+    filled = pd.DataFrame(values).ffill().to_numpy()
+    returns = np.full(filled.shape, np.nan)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        returns[1:] = np.log(filled[1:] / filled[:-1])
+
+    if previous is not None:
+        filled, returns = filled[1:], returns[1:]
+
+    return pd.DataFrame(returns, index=close.index, columns=close.columns), filled
+
+
+class RollingCorrelation:
+    """Matriz de correlación de las últimas `window` rentabilidades con actualización O(N²)
+
+    Guarda las últimas `window` sesiones en un buffer circular y mantiene la
+    suma de cada símbolo y la matriz de productos cruzados: añadir una sesión
+    suma su producto exterior y resta el de la que sale, sin recorrer la
+    ventana (O(N²) en lugar de O(N²·T)). Un símbolo solo tiene correlación
+    cuando tiene las `window` rentabilidades de la ventana.
+    """
+
+    def __init__(self, symbols, window):
+        self.symbols = tuple(symbols)
+        self.window = window
+        size = len(self.symbols)
+        self._buffer = np.zeros((window, size))        # Rentabilidades (0 donde no hay dato)
+        self._valid = np.zeros((window, size), dtype=bool)
+        self._dates = [None] * window
+        self._next = 0      # Posición donde se escribirá la próxima sesión
+        self._count = 0     # Sesiones en el buffer (máximo window)
+        self._sum = np.zeros(size)
+        self._cross = np.zeros((size, size))
+        self._valid_count = np.zeros(size, dtype=np.int64)
+        self._pushes = 0    # Para recalcular las sumas y evitar deriva numérica
+        self._matrix = None
+
+    @classmethod
+    def from_returns(cls, returns, window):
+        """Estado con las últimas `window` filas de la matriz de rentabilidades (fechas × símbolos)"""
+        state = cls(returns.columns, window)
+        tail = returns.iloc[-window:]
+
+        values = tail.to_numpy(dtype=float)
+        valid = ~np.isnan(values)
+        rows = len(values)
+
+        state._buffer[:rows] = np.where(valid, values, 0.0)
+        state._valid[:rows] = valid
+        state._dates[:rows] = list(tail.index)
+        state._count = rows
+        state._next = rows % window
+        state._recompute()
+
+        return state
+
+    @property
+    def last_date(self):
+        """Fecha de la última sesión incorporada (None si está vacío)"""
+        return self._dates[(self._next - 1) % self.window] if self._count else None
+
+    @property
+    def first_date(self):
+        """Fecha de la sesión más antigua de la ventana (None si está vacío)"""
+        return self._dates[(self._next - self._count) % self.window] if self._count else None
+
+    def push(self, date, returns):
+        """Añade la sesión más reciente; si la ventana está llena sale la más antigua"""
+        values, valid = self._row(returns)
+
+        if self._count == self.window:
+            self._remove(self._next)
+        else:
+            self._count += 1
+
+        self._add(self._next, date, values, valid)
+        self._next = (self._next + 1) % self.window
+
+        # Cada ventana completa se recalculan las sumas exactas (coste amortizado O(N²))
+        self._pushes += 1
+        if self._pushes % self.window == 0:
+            self._recompute()
+
+    def replace(self, date, returns):
+        """Sustituye una sesión de la ventana (barra corregida); False si no cambia nada"""
+        position = self._dates.index(date)
+        values, valid = self._row(returns)
+
+        if np.array_equal(valid, self._valid[position]) and np.array_equal(values, self._buffer[position]):
+            return False
+
+        self._remove(position)
+        self._add(position, date, values, valid)
+        return True
+
+    def update(self, returns):
+        """Incorpora filas de rentabilidades nuevas o corregidas (fechas × símbolos)
+
+        Las fechas posteriores a la última se añaden, las que ya están en la
+        ventana se sustituyen y las anteriores a la ventana se ignoran. Lanza
+        ValueError si aparece una fecha nueva dentro de la ventana (hay que
+        reconstruir el estado). Devuelve las sesiones que han cambiado.
+        """
+        changed = 0
+        window_dates = {date for date in self._dates if date is not None}
+
+        for date, row in zip(returns.index, returns.to_numpy(dtype=float)):
+            if self._count == 0 or date > self.last_date:
+                self.push(date, row)
+                changed += 1
+            elif date in window_dates:
+                changed += self.replace(date, row)
+            elif date > self.first_date:
+                raise ValueError(f"Fecha nueva dentro de la ventana: {date}")
+
+        return changed
+
+    def matrix(self):
+        """Correlación (símbolos × símbolos) de la ventana actual; NaN sin datos suficientes
+
+        La matriz se guarda hasta que cambie alguna sesión: no se debe modificar.
+        """
+        if self._matrix is None:
+            self._matrix = pd.DataFrame(self._correlation(), index=self.symbols, columns=self.symbols)
+        return self._matrix
+
+    def _correlation(self):
+        mean = self._sum / self.window
+        covariance = self._cross / self.window - np.outer(mean, mean)
+        variance = np.diag(covariance).copy()
+
+        ready = (self._valid_count == self.window) & (variance > MIN_VARIANCE)
+        std = np.sqrt(np.where(ready, variance, np.nan))
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            correlation = covariance / np.outer(std, std)
+        np.clip(correlation, -1.0, 1.0, out=correlation)
+        np.fill_diagonal(correlation, np.where(ready, 1.0, np.nan))
+
+        return correlation
+
+    def _row(self, returns):
+        values = np.asarray(returns, dtype=float)
+        valid = ~np.isnan(values)
+        return np.where(valid, values, 0.0), valid
+
+    def _add(self, position, date, values, valid):
+        self._buffer[position] = values
+        self._valid[position] = valid
+        self._dates[position] = date
+        self._sum += values
+        self._cross += np.outer(values, values)
+        self._valid_count += valid
+        self._matrix = None
+
+    def _remove(self, position):
+        values = self._buffer[position]
+        self._sum -= values
+        self._cross -= np.outer(values, values)
+        self._valid_count -= self._valid[position]
+        self._matrix = None
+
+    def _recompute(self):
+        """Sumas exactas sobre el buffer (las posiciones vacías son ceros)"""
+        self._sum = self._buffer.sum(axis=0)
+        self._cross = self._buffer.T @ self._buffer
+        self._valid_count = self._valid.sum(axis=0)
+        self._matrix = None
+
+
+class CorrelationTracker:
+    """Cierres recientes y correlación móvil por ventana de un conjunto fijo de símbolos
+
+    Cada ventana se crea la primera vez que se pide y a partir de ahí solo
+    recibe las sesiones nuevas o corregidas; su matriz queda en caché hasta que
+    cambia alguna. version identifica los datos ya incorporados.
+    """
+
+    def __init__(self, close, symbols, version=None):
+        self.symbols = tuple(symbols)
+        self.version = version
+        self.close = close.reindex(columns=list(self.symbols)).sort_index()
+        self._returns, self._filled = _returns_and_filled(self.close)
+        self._windows = {}
+
+    def revision_start(self, now):
+        """Desde qué fecha hay que volver a leer los cierres en la próxima actualización"""
+        if self.close.empty:
+            return now - pd.Timedelta(days=CORRELATION_HISTORY_DAYS)
+        return self.close.index[-1] - pd.Timedelta(days=CORRELATION_REVISION_DAYS)
+
+    def correlation(self, window):
+        """Matriz de correlación de la ventana (se construye la primera vez que se pide)"""
+        state = self._windows.get(window)
+        if state is None:
+            state = self._windows[window] = RollingCorrelation.from_returns(self._returns, window)
+        return state.matrix()
+
+    def update(self, close, version=None):
+        """Incorpora los cierres recientes (sesiones nuevas o barras corregidas)
+
+        Solo se recalculan las rentabilidades desde la primera fecha recibida
+        (O(N·R) para R sesiones releídas, no todo el histórico) y cada ventana
+        recibe únicamente las filas que han cambiado. Devuelve cuántas fechas cambiaron.
+        """
+        self.version = version
+        close = close.reindex(columns=list(self.symbols)).sort_index()
+        if close.empty:
+            return 0
+
+        # Las fechas anteriores a los cierres recibidos no cambian
+        position = self.close.index.searchsorted(close.index[0])
+        stored = self.close.iloc[position:]
+
+        # Los cierres nuevos prevalecen sobre los guardados (en numpy: combine_first va columna a columna)
+        index = stored.index.union(close.index)
+        fresh = close.reindex(index=index).to_numpy(dtype=float)
+        kept = stored.reindex(index=index).to_numpy(dtype=float)
+        tail = pd.DataFrame(np.where(np.isnan(fresh), kept, fresh), index=index, columns=self.close.columns)
+
+        returns, filled = _returns_and_filled(tail, self._filled[position - 1] if position else None)
+        previous = self._returns.iloc[position:].reindex(index=index).to_numpy(dtype=float)
+        current = returns.to_numpy(dtype=float)
+        changed = ~((current == previous) | (np.isnan(current) & np.isnan(previous))).all(axis=1)
+        rows = returns[changed]
+
+        if position:
+            tail = pd.concat([self.close.iloc[:position], tail])
+            returns = pd.concat([self._returns.iloc[:position], returns])
+            filled = np.concatenate([self._filled[:position], filled])
+
+        # Solo se guarda el histórico que cubre la ventana más larga
+        first = tail.index.searchsorted(tail.index[-1] - pd.Timedelta(days=CORRELATION_HISTORY_DAYS))
+        self.close = tail.iloc[first:]
+        self._returns = returns.iloc[first:]
+        self._filled = filled[first:]
+        if rows.empty:
+            return 0
+
+        for window, state in list(self._windows.items()):
+            try:
+                state.update(rows)
+            except ValueError:
+                self._windows[window] = RollingCorrelation.from_returns(self._returns, window)
+
+        return len(rows)
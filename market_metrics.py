@@ -0,0 +1,124 @@
+import numpy as np
+import pandas as pd
+
+# Ventana de la media móvil de tendencia
+MA_WINDOW = 200
+
+# Códigos de tendencia respecto a la MA200
+TREND_UP = 1
+TREND_DOWN = -1
+TREND_NO_DATA = 0
+
+
+def build_close_matrix(histories, field='Close'):
+    """Construye la matriz alineada (fechas × símbolos) de un campo OHLCV"""
+    if not histories:
+        return pd.DataFrame()
+
+    matrix = pd.concat(
+        {symbol: hist[field] for symbol, hist in histories.items()},
+        axis=1
+    )
+
+    return matrix.sort_index()
+
+
+def build_field_matrices(histories, fields=('Close',)):
+    """Construye las matrices alineadas (fechas × símbolos) de varios campos OHLCV
+
+    Las fechas se unen una sola vez, con el primer campo (lo caro con muchos
+    símbolos); el resto se copian por posición sobre esas mismas fechas. Un
+    campo que falte en un histórico queda como NaN.
+    """
+    first, others = fields[0], fields[1:]
+    matrices = {first: build_close_matrix(histories, field=first)}
+    if not histories:
+        return {**matrices, **{field: pd.DataFrame() for field in others}}
+
+    index = matrices[first].index
+    stacked = np.full((len(others),) + matrices[first].shape, np.nan)
+    for column, hist in enumerate(histories.values()):
+        # Lo habitual es que el histórico ya tenga todas las fechas: copia directa
+        rows = slice(None) if hist.index.equals(index) else index.get_indexer(hist.index)
+        values = hist.to_numpy(dtype=float)
+        sources = {name: source for source, name in enumerate(hist.columns)}
+        for position, field in enumerate(others):
+            if field in sources:
+                stacked[position, rows, column] = values[:, sources[field]]
+
+    for field, values in zip(others, stacked):
+        matrices[field] = pd.DataFrame(values, index=index, columns=matrices[first].columns)
+
+    return matrices
+
+
+def _nth_valid_rows(valid, rank, n):
+    """Fila de la n-ésima observación válida de cada columna (-1 si no existe)"""
+    rows = np.argmax(valid & (rank == n), axis=0)
+    return np.where(n >= 1, rows, -1)
+
+
+def compute_panel_metrics(close, volume=None, ma_window=MA_WINDOW, ma=None):
+    """Calcula las métricas de todos los mercados en una sola pasada vectorizada
+
+    Recibe una matriz de cierres (fechas × símbolos) que puede tener huecos (NaN)
+    por festivos locales y devuelve un DataFrame columnar indexado por símbolo con
+    price, previous_close, change_percent, ma200, trend, volume y observations.
+    Si se pasa `ma` (una media por columna, p. ej. de un estado incremental) no se
+    recalcula la media móvil.
+    """
+    values = close.to_numpy(dtype=float)
+    if values.shape[0] == 0:
+        values = np.full((1, values.shape[1]), np.nan)
+
+    cols = np.arange(values.shape[1])
+
+    valid = ~np.isnan(values)
+    rank = np.cumsum(valid, axis=0)  # Posición (1..n) de cada observación válida
+    counts = rank[-1]
+
+    # Último y penúltimo cierre válido de cada columna
+    last_rows = _nth_valid_rows(valid, rank, counts)
+    prev_rows = _nth_valid_rows(valid, rank, counts - 1)
+
+    price = np.where(last_rows >= 0, values[last_rows.clip(0), cols], np.nan)
+    previous_close = np.where(prev_rows >= 0, values[prev_rows.clip(0), cols], price)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        change_percent = (price - previous_close) / previous_close * 100
+
+    if ma is None:
+        # MA200 sobre las últimas ma_window observaciones válidas mediante sumas acumuladas
+        cumulative = np.cumsum(np.where(valid, values, 0.0), axis=0)
+        cut = counts - ma_window
+        rows_before = (rank <= cut).sum(axis=0)
+        sum_before = np.where(rows_before > 0, cumulative[(rows_before - 1).clip(0), cols], 0.0)
+        total = cumulative[-1]
+
+        ma = np.where(counts >= ma_window, (total - sum_before) / ma_window, np.nan)
+    else:
+        ma = np.asarray(ma, dtype=float)
+
+    trend = np.where(
+        np.isnan(ma),
+        TREND_NO_DATA,
+        np.where(price > ma, TREND_UP, TREND_DOWN)
+    )
+
+    metrics = pd.DataFrame({
+        'price': price,
+        'previous_close': previous_close,
+        'change_percent': change_percent,
+        'ma200': ma,
+        'trend': trend,
+        'observations': counts
+    }, index=close.columns)
+
+    if volume is not None:
+        volume_values = volume.reindex(index=close.index, columns=close.columns).to_numpy(dtype=float)
+        if volume_values.shape[0] == 0:
+            volume_values = np.full(values.shape, np.nan)
+        last_volume = np.where(last_rows >= 0, volume_values[last_rows.clip(0), cols], np.nan)
+        metrics['volume'] = np.nan_to_num(last_volume)
+
+    return metrics
@@ -0,0 +1,182 @@
+import threading
+from collections import namedtuple
+from datetime import datetime
+from types import MappingProxyType
+
+from cache_backend import SingleFlight
+
+# Cada cuánto se refresca el snapshot en segundo plano (segundos)
+REFRESH_INTERVAL = 60
+
+MarketSnapshot = namedtuple('MarketSnapshot', ['version', 'created_at', 'market_data', 'source'],
+                            defaults=['live'])
+MarketSnapshot.__doc__ = """Foto inmutable de los datos de todos los mercados
+
+version crece con cada publicación con datos distintos; market_data es una vista
+de solo lectura símbolo -> datos (o None si no hay datos del mercado). source es
+'live', o el origen de los datos guardados que se publican al arrancar: 'file'
+(snapshot precalculado) o 'cache' (último snapshot de la caché compartida).
+"""
+
+
+def freeze_market_data(market_data):
+    """Devuelve una vista de solo lectura de los datos por mercado"""
+    return MappingProxyType({
+        symbol: MappingProxyType(dict(data)) if data else None
+        for symbol, data in market_data.items()
+    })
+
+
+class SnapshotScheduler:
+    """Refresca los datos de mercado en un hilo propio y publica snapshots inmutables
+
+    Las sesiones solo leen latest(); nunca esperan a una descarga salvo en el
+    arranque en frío, cuando todavía no se ha publicado ningún snapshot. tasks
+    son otras descargas que se hacen en el mismo hilo después de cada refresco
+    (p. ej. las barras intradía).
+    """
+
+    def __init__(self, build_fn, interval=REFRESH_INTERVAL, warmup=None, tasks=()):
+        self.build_fn = build_fn
+        self.interval = interval
+        self.warmup = warmup
+        self.tasks = tuple(tasks)
+        self._snapshot = None
+        self._version = 0
+        self._publish_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._published = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._single_flight = SingleFlight()
+        self._cycles = threading.Condition()
+        self._started = 0       # Construcciones empezadas (nunca hay dos a la vez)
+        self._finished = 0      # Construcciones terminadas, con o sin éxito
+
+    def start(self):
+        """Arranca el hilo de refresco (idempotente)"""
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(
+                target=self._run, name='snapshot-scheduler', daemon=True
+            )
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """Detiene el hilo de refresco"""
+        self._stop.set()
+        self._wake.set()
+
+    def _run(self):
+        # Preparación previa al primer refresco (p. ej. volcar un histórico precalculado)
+        if self.warmup is not None:
+            try:
+                self.warmup()
+            except Exception as e:
+                print(f"Error preparando el refresco de mercados: {e}")
+
+        while not self._stop.is_set():
+            self.refresh()
+            self._run_tasks()
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def _run_tasks(self):
+        for task in self.tasks:
+            try:
+                task()
+            except Exception as e:
+                print(f"Error en una tarea del refresco de mercados: {e}")
+
+    def refresh(self):
+        """Construye y publica un snapshot nuevo; conserva el anterior si falla
+
+        Si ya hay una construcción en curso (del hilo de refresco o de otra sesión)
+        se espera a ella y se devuelve su resultado en lugar de lanzar otra.
+        """
+        return self._single_flight.do('refresh', self._build_and_publish)
+
+    def _build_and_publish(self):
+        with self._cycles:
+            self._started += 1
+
+        try:
+            market_data = self.build_fn()
+        except Exception as e:
+            print(f"Error refrescando el snapshot de mercados: {e}")
+            return self._snapshot
+        finally:
+            with self._cycles:
+                self._finished += 1
+                self._cycles.notify_all()
+
+        # Sin ningún mercado (todas las descargas fallaron): se conserva el anterior
+        if market_data is None:
+            return self._snapshot
+
+        return self.publish(market_data)
+
+    def publish(self, market_data, created_at=None):
+        """Publica datos como snapshot; si no han cambiado se mantiene la versión
+
+        Un snapshot guardado publicado al arrancar siempre se sustituye, aunque
+        los datos coincidan, para que deje de mostrarse como tal.
+        """
+        with self._publish_lock:
+            current = self._snapshot
+            if current is not None and current.source == 'live' and dict(current.market_data) == market_data:
+                return current
+
+            self._version += 1
+            self._snapshot = MarketSnapshot(
+                version=self._version,
+                created_at=created_at or datetime.now(),
+                market_data=freeze_market_data(market_data)
+            )
+            self._published.set()
+            return self._snapshot
+
+    def seed(self, market_data, created_at, source='file'):
+        """Publica datos precalculados solo si aún no hay ningún snapshot
+
+        Sirve para pintar al arrancar mientras llega el primer refresco real, que
+        lo sustituye en cuanto se publica.
+        """
+        with self._publish_lock:
+            if self._snapshot is not None:
+                return self._snapshot
+
+            self._version += 1
+            self._snapshot = MarketSnapshot(
+                version=self._version,
+                created_at=created_at,
+                market_data=freeze_market_data(market_data),
+                source=source
+            )
+            self._published.set()
+            return self._snapshot
+
+    def latest(self):
+        """Último snapshot publicado, o None si aún no hay ninguno"""
+        return self._snapshot
+
+    def wait(self, timeout=None):
+        """Espera a que haya un snapshot publicado (None si se agota el plazo)"""
+        self._published.wait(timeout)
+        return self._snapshot
+
+    def request_refresh(self, wait=None):
+        """Adelanta el siguiente ciclo de refresco (y sus tareas)
+
+        Con wait se esperan hasta esos segundos a que termine una construcción
+        empezada después de la llamada (la descarga sigue en el hilo de refresco).
+        Devuelve el último snapshot publicado.
+        """
+        with self._cycles:
+            target = self._started + 1
+        self._wake.set()
+
+        if wait:
+            with self._cycles:
+                self._cycles.wait_for(lambda: self._finished >= target, wait)
+        return self._snapshot
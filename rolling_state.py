@@ -0,0 +1,81 @@
+class RollingMean:
+    """Media móvil de ventana fija con actualización O(1)
+
+    Guarda los últimos `window` cierres en un buffer circular y mantiene su suma,
+    de modo que añadir una barra o corregir la última no recorre la ventana.
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self._buffer = [0.0] * window
+        self._next = 0      # Posición donde se escribirá la próxima barra
+        self._count = 0     # Barras válidas en el buffer (máximo window)
+        self._sum = 0.0
+        self._pushes = 0    # Para recalcular la suma y evitar deriva numérica
+
+    def push(self, bar):
+        """Añade el cierre de una barra nueva"""
+        value = float(bar)
+
+        if self._count == self.window:
+            self._sum -= self._buffer[self._next]
+        else:
+            self._count += 1
+
+        self._buffer[self._next] = value
+        self._sum += value
+        self._next = (self._next + 1) % self.window
+
+        # Cada ventana completa se recalcula la suma exacta (coste amortizado O(1))
+        self._pushes += 1
+        if self._pushes % self.window == 0:
+            self._sum = sum(self._values())
+
+    def replace_last(self, bar):
+        """Sustituye el cierre de la última barra (barra actual aún en formación)"""
+        if self._count == 0:
+            self.push(bar)
+            return
+
+        last = (self._next - 1) % self.window
+        value = float(bar)
+
+        self._sum += value - self._buffer[last]
+        self._buffer[last] = value
+
+    def _values(self):
+        """Valores del buffer en orden cronológico"""
+        start = (self._next - self._count) % self.window
+        return [self._buffer[(start + i) % self.window] for i in range(self._count)]
+
+    @property
+    def ready(self):
+        """True cuando la ventana está completa"""
+        return self._count == self.window
+
+    @property
+    def last(self):
+        """Último cierre añadido"""
+        if self._count == 0:
+            return None
+        return self._buffer[(self._next - 1) % self.window]
+
+    @property
+    def value(self):
+        """Media actual, o None si aún no hay barras suficientes"""
+        if not self.ready:
+            return None
+        return self._sum / self.window
+
+    def to_dict(self):
+        """Representación serializable (valores en orden cronológico)"""
+        return {'window': self.window, 'values': self._values()}
+
+    @classmethod
+    def from_dict(cls, payload):
+        """Reconstruye el estado desde to_dict()"""
+        rolling = cls(payload['window'])
+        for value in payload['values'][-rolling.window:]:
+            rolling.push(value)
+        return rolling
+
@@ -0,0 +1,279 @@
+"""Endpoint HTTP de solo lectura con el snapshot de mercados de la caché compartida
+
+Sirve precio, cambio, tendencia MA200 y estado de sesión de cada mercado en JSON
+o Arrow sin cargar Streamlit ni descargar nada: solo lee el último snapshot que
+la aplicación dejó en la caché compartida (backend SQLite) y calcula el estado
+de sesión con el calendario precomputado.
+
+    python snapshot_api.py                    # http://127.0.0.1:8765/snapshot
+    python snapshot_api.py --once             # JSON por la salida estándar
+    python snapshot_api.py --once --format arrow --output snapshot.arrow
+"""
+import argparse
+import hashlib
+import io
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from cache_backend import get_cache_backend, snapshot_cache_key
+from instrument_registry import get_registry
+from market_calendar import get_market_calendar
+
+API_HOST = os.environ.get('MAPA_API_HOST', '127.0.0.1')
+API_PORT = int(os.environ.get('MAPA_API_PORT', '8765'))
+
+# Claves del snapshot en la caché compartida, por orden de preferencia
+SNAPSHOT_KEYS = (snapshot_cache_key(True), snapshot_cache_key(False))
+
+# Como mucho una lectura de la caché por intervalo, por muchas peticiones que lleguen (segundos)
+CACHE_CHECK_INTERVAL = 1.0
+
+# El estado de sesión se recalcula en cada evento de sesión y, como mucho, cada cuarto de hora
+# (los textos "Abre mañana..." cambian a medianoche local, que siempre cae en un cuarto de hora)
+STATUS_MAX_AGE_MINUTES = 15
+
+JSON_TYPE = 'application/json'
+ARROW_TYPE = 'application/vnd.apache.arrow.stream'
+
+
+def next_quarter_hour(now):
+    """Siguiente cuarto de hora en punto"""
+    minutes = STATUS_MAX_AGE_MINUTES - now.minute % STATUS_MAX_AGE_MINUTES
+    return now.replace(second=0, microsecond=0) + timedelta(minutes=minutes)
+
+
+class RenderedSnapshot:
+    """Snapshot serializado una vez y servido tal cual hasta que cambie
+
+    market_data guarda los datos originales para volver a calcular el estado de
+    sesión aunque la clave haya desaparecido de la caché.
+    """
+
+    def __init__(self, created_at, valid_until, payload, market_data):
+        self.created_at = created_at
+        self.valid_until = valid_until
+        self.payload = payload
+        self.market_data = market_data
+        self.json = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        self.etag = f'"{hashlib.sha1(self.json).hexdigest()[:20]}"'
+        self._arrow = None
+        self._lock = threading.Lock()
+
+    def body(self, content_type):
+        """(cuerpo, ETag) en el formato pedido"""
+        if content_type == JSON_TYPE:
+            return self.json, self.etag
+
+        with self._lock:
+            if self._arrow is None:
+                self._arrow = markets_to_arrow(self.payload)
+        return self._arrow, self.etag[:-1] + '-arrow"'
+
+
+def markets_to_arrow(payload):
+    """Mercados del snapshot como flujo Arrow IPC (metadatos del snapshot en el esquema)"""
+    import pyarrow as pa
+
+    table = pa.Table.from_pylist(payload['markets'])
+    table = table.replace_schema_metadata({'as_of': payload['as_of'] or ''})
+
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+
+class SnapshotReader:
+    """Lee el snapshot de la caché compartida sin disparar nunca una descarga
+
+    Varias peticiones simultáneas comparten la misma lectura y la misma
+    serialización; si la clave desaparece de la caché (p. ej. mientras la app la
+    regenera) se sigue sirviendo el último snapshot leído.
+    """
+
+    def __init__(self, backend=None, keys=SNAPSHOT_KEYS, check_interval=CACHE_CHECK_INTERVAL):
+        self.backend = backend or get_cache_backend()
+        self.keys = keys
+        self.check_interval = check_interval
+        self.registry = get_registry()
+        self.markets = self.registry.as_config()
+        self._rendered = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _entry(self):
+        for key in self.keys:
+            entry = self.backend.get(key)
+            if entry is not None:
+                return entry
+        return None
+
+    def current(self):
+        """Último RenderedSnapshot (None si la aplicación aún no ha guardado ninguno)"""
+        monotonic = time.monotonic()
+        rendered = self._rendered
+        if rendered is not None and monotonic - self._checked_at < self.check_interval \
+                and datetime.now(timezone.utc) < rendered.valid_until:
+            return rendered
+
+        with self._lock:
+            rendered = self._rendered
+            now = datetime.now(timezone.utc)
+            if rendered is not None and time.monotonic() - self._checked_at < self.check_interval \
+                    and now < rendered.valid_until:
+                return rendered
+
+            entry = self._entry()
+            self._checked_at = time.monotonic()
+
+            if entry is None:
+                # La app está regenerando el snapshot: se mantiene el anterior
+                if rendered is not None and now >= rendered.valid_until:
+                    rendered = self._render(rendered.market_data, rendered.created_at, now)
+            elif rendered is None or entry.created_at != rendered.created_at or now >= rendered.valid_until:
+                rendered = self._render(entry.value, entry.created_at, now)
+
+            self._rendered = rendered
+            return rendered
+
+    def _render(self, market_data, created_at, now):
+        statuses = get_market_calendar(self.markets, now).status_all(now)
+
+        markets = []
+        for symbol, config in self.markets.items():
+            data = market_data.get(symbol)
+            if not data:
+                continue
+            status = statuses.get(symbol, {})
+            markets.append({
+                'symbol': symbol,
+                'name': config['name'],
+                'region': config['region'],
+                'price': data['price'],
+                'change_percent': data['change_percent'],
+                'ma200_trend': data['ma200_trend'],
+                'trend': data.get('trend'),
+                'is_open': bool(status.get('is_open')),
+                'status': status.get('status'),
+                'next_action': status.get('next_action'),
+                'stale': bool(data.get('stale')),
+                'as_of': data.get('as_of')
+            })
+
+        # Válido hasta el próximo evento de sesión de cualquier mercado
+        next_events = [status['next_event'] for status in statuses.values() if status.get('next_event')]
+        valid_until = min(next_events + [next_quarter_hour(now)])
+
+        # Sin marcas de tiempo del propio render: el ETag solo cambia si cambian los datos
+        payload = {
+            'as_of': datetime.fromtimestamp(created_at, timezone.utc).isoformat() if created_at else None,
+            'markets': markets
+        }
+        return RenderedSnapshot(created_at, valid_until, payload, market_data)
+
+
+def wants_arrow(path, accept):
+    query = path.split('?', 1)[1] if '?' in path else ''
+    return path.split('?', 1)[0].endswith('.arrow') or 'format=arrow' in query or ARROW_TYPE in (accept or '')
+
+
+class SnapshotHandler(BaseHTTPRequestHandler):
+    """GET/HEAD /snapshot (JSON), /snapshot.arrow o ?format=arrow, y /healthz"""
+
+    reader = None
+    protocol_version = 'HTTP/1.1'
+
+    def do_HEAD(self):
+        self.do_GET(head=True)
+
+    def do_GET(self, head=False):
+        route = self.path.split('?', 1)[0]
+
+        if route == '/healthz':
+            return self._send(200, b'ok', 'text/plain', head=head)
+
+        if route not in ('/', '/snapshot', '/snapshot.json', '/snapshot.arrow'):
+            return self._send(404, b'{"error":"not found"}', JSON_TYPE, head=head)
+
+        rendered = self.reader.current()
+        if rendered is None:
+            return self._send(503, b'{"error":"snapshot no disponible"}', JSON_TYPE, head=head)
+
+        content_type = ARROW_TYPE if wants_arrow(self.path, self.headers.get('Accept')) else JSON_TYPE
+        try:
+            body, etag = rendered.body(content_type)
+        except ImportError:
+            return self._send(406, b'{"error":"Arrow requiere pyarrow"}', JSON_TYPE, head=head)
+
+        # Sondeos sin cambios: 304 sin cuerpo
+        if_none_match = self.headers.get('If-None-Match', '')
+        if etag in [tag.strip() for tag in if_none_match.split(',')] or if_none_match.strip() == '*':
+            return self._send(304, b'', content_type, etag=etag, head=True)
+
+        return self._send(200, body, content_type, etag=etag, head=head)
+
+    def _send(self, code, body, content_type, etag=None, head=False):
+        self.send_response(code)
+        self.send_header('Content-Type', content_type if content_type != JSON_TYPE else f'{JSON_TYPE}; charset=utf-8')
+        self.send_header('Content-Length', '0' if code == 304 else str(len(body)))
+        self.send_header('Cache-Control', 'no-cache')
+        if etag:
+            self.send_header('ETag', etag)
+        self.end_headers()
+        if not head:
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(host=API_HOST, port=API_PORT, reader=None):
+    """Arranca el servidor (bloquea hasta Ctrl+C)"""
+    handler = type('Handler', (SnapshotHandler,), {'reader': reader or SnapshotReader()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    print(f"Snapshot de mercados en http://{host}:{port}/snapshot")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default=API_HOST)
+    parser.add_argument('--port', type=int, default=API_PORT)
+    parser.add_argument('--once', action='store_true', help='Escribe el snapshot y termina')
+    parser.add_argument('--format', choices=('json', 'arrow'), default='json')
+    parser.add_argument('--output', help='Fichero de salida con --once (por defecto, salida estándar)')
+    args = parser.parse_args(argv)
+
+    if not args.once:
+        serve(args.host, args.port)
+        return 0
+
+    rendered = SnapshotReader().current()
+    if rendered is None:
+        print("No hay ningún snapshot en la caché compartida", file=sys.stderr)
+        return 1
+
+    body, _ = rendered.body(ARROW_TYPE if args.format == 'arrow' else JSON_TYPE)
+    if args.output:
+        with open(args.output, 'wb') as handle:
+            handle.write(body)
+    else:
+        sys.stdout.buffer.write(body)
+        if args.format == 'json':
+            sys.stdout.buffer.write(b'\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
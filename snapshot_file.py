@@ -0,0 +1,228 @@
+"""Snapshot precalculado en un fichero Arrow IPC para arrancar sin esperar a la red
+
+    python snapshot_file.py                     # .cache/mapa_bursatil/snapshot.arrow
+    python snapshot_file.py --output /ruta/snapshot.arrow
+
+El fichero guarda una fila por mercado con sus datos del snapshot y su
+histórico OHLCV recortado (columnas de listas). La aplicación lo abre como
+mapa de memoria al arrancar: lee solo las columnas del snapshot (sin copiar el
+histórico) y pinta en seguida; el histórico se vuelca al almacén local en
+segundo plano para que la primera descarga real sea incremental.
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+from history_store import HISTORY_WINDOW_DAYS, OHLCV_COLUMNS
+from technical_indicators import INDICATOR_COLUMNS
+
+# Ubicación del fichero (configurable por variable de entorno)
+SNAPSHOT_PATH = os.environ.get(
+    'MAPA_SNAPSHOT_FILE',
+    os.path.join('.cache', 'mapa_bursatil', 'snapshot.arrow')
+)
+
+# Versión del formato: un fichero de otra versión se ignora
+FORMAT_VERSION = '2'
+
+# Campos numéricos del snapshot de cada mercado (además de symbol, trend y last_update)
+MARKET_FIELDS = ('price', 'change_percent', 'volume') + INDICATOR_COLUMNS
+
+
+def history_column(column):
+    """Nombre de la columna de listas con el histórico de un campo OHLCV ('Close' -> 'close_history')"""
+    return f'{column.lower()}_history'
+
+
+def snapshot_schema():
+    import pyarrow as pa
+
+    history = pa.list_(pa.float64())
+    return pa.schema(
+        [('symbol', pa.string())]
+        + [(field, pa.float64()) for field in MARKET_FIELDS]
+        + [('trend', pa.int8()), ('last_update', pa.string()), ('dates', pa.list_(pa.date32()))]
+        + [(history_column(column), history) for column in OHLCV_COLUMNS]
+    )
+
+
+def write_snapshot_file(market_data, histories, path=SNAPSHOT_PATH, history_days=HISTORY_WINDOW_DAYS):
+    """Escribe el snapshot y el histórico recortado de cada mercado en un fichero Arrow IPC
+
+    Se escribe sin compresión (para poder mapearlo sin copias) y de forma
+    atómica: quien lo lea nunca ve un fichero a medias. Devuelve los bytes escritos.
+    """
+    import pyarrow as pa
+
+    since = datetime.now() - timedelta(days=history_days)
+    columns = {name: [] for name in snapshot_schema().names}
+
+    for symbol, data in market_data.items():
+        if not data:
+            continue
+        hist = histories.get(symbol)
+        hist = hist[hist.index >= since] if hist is not None and not hist.empty else None
+
+        columns['symbol'].append(symbol)
+        for field in MARKET_FIELDS:
+            columns[field].append(data.get(field))
+        columns['trend'].append(data.get('trend'))
+        columns['last_update'].append(data.get('last_update'))
+        columns['dates'].append(list(hist.index.date) if hist is not None else [])
+        for column in OHLCV_COLUMNS:
+            values = hist[column].astype(float).tolist() if hist is not None and column in hist else []
+            columns[history_column(column)].append(values)
+
+    schema = snapshot_schema().with_metadata({
+        'format_version': FORMAT_VERSION,
+        'created_at': repr(time.time())
+    })
+    table = pa.Table.from_pydict(columns, schema=schema)
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    partial = f'{path}.{os.getpid()}.tmp'
+    with pa.OSFile(partial, 'wb') as sink, pa.ipc.new_file(sink, schema) as writer:
+        writer.write_table(table)
+    os.replace(partial, path)
+
+    return os.path.getsize(path)
+
+
+class SnapshotFile:
+    """Fichero de snapshot abierto como mapa de memoria (sin copiar su contenido)"""
+
+    def __init__(self, table, created_at):
+        self.table = table
+        self.created_at = created_at
+
+    @classmethod
+    def open(cls, path=SNAPSHOT_PATH):
+        import pyarrow as pa
+
+        table = pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+        metadata = table.schema.metadata or {}
+
+        if metadata.get(b'format_version', b'').decode() != FORMAT_VERSION:
+            raise ValueError(f"Versión de formato no soportada en {path}")
+
+        return cls(table, float(metadata[b'created_at']))
+
+    def __len__(self):
+        return self.table.num_rows
+
+    def market_data(self, labels):
+        """símbolo -> datos del mercado, como los devuelve summarize_histories
+
+        labels traduce el código de tendencia a la etiqueta que muestra la interfaz.
+        Solo se leen las columnas del snapshot; el histórico no se toca.
+        """
+        columns = {
+            name: self.table.column(name).to_pylist()
+            for name in ('symbol', 'trend', 'last_update') + MARKET_FIELDS
+        }
+
+        market_data = {}
+        for position, symbol in enumerate(columns['symbol']):
+            data = {field: columns[field][position] for field in MARKET_FIELDS
+                    if columns[field][position] is not None}
+            data['trend'] = columns['trend'][position]
+            data['ma200_trend'] = labels[data['trend']]
+            data['last_update'] = columns['last_update'][position]
+            market_data[symbol] = data
+
+        return market_data
+
+    def histories(self, symbols=None):
+        """símbolo -> histórico OHLCV (DataFrame indexado por fecha)"""
+        import pandas as pd
+
+        wanted = None if symbols is None else set(symbols)
+        names = self.table.column('symbol').to_pylist()
+
+        histories = {}
+        for position, symbol in enumerate(names):
+            if wanted is not None and symbol not in wanted:
+                continue
+            dates = self.table.column('dates')[position].values.to_numpy(zero_copy_only=False)
+            if len(dates) == 0:
+                continue
+            histories[symbol] = pd.DataFrame(
+                {column: self.table.column(history_column(column))[position].values.to_numpy(zero_copy_only=False)
+                 for column in OHLCV_COLUMNS},
+                index=pd.DatetimeIndex(pd.to_datetime(dates), name='Date')
+            )
+
+        return histories
+
+    def seed_history_store(self, store):
+        """Vuelca el histórico a un almacén local en los símbolos que aún no tienen datos
+
+        Nunca sustituye barras ya guardadas. Devuelve los símbolos volcados.
+        """
+        names = self.table.column('symbol').to_pylist()
+        empty = [symbol for symbol, last in store.last_timestamps(names).items() if last is None]
+
+        seeded = self.histories(empty)
+        for symbol, hist in seeded.items():
+            store.append(symbol, hist)
+
+        return list(seeded)
+
+
+def open_snapshot_file(path=SNAPSHOT_PATH):
+    """Abre el fichero de snapshot si existe y es legible (None si no, o sin pyarrow)"""
+    if not path or not os.path.exists(path):
+        return None
+
+    try:
+        return SnapshotFile.open(path)
+    except ImportError:
+        return None
+    except Exception as e:
+        print(f"No se pudo leer el snapshot precalculado {path}: {e}")
+        return None
+
+
+def build_snapshot_file(path=SNAPSHOT_PATH):
+    """Descarga el snapshot completo y lo escribe junto con el histórico recortado
+
+    Si no se obtiene ningún mercado no se toca el fichero: devuelve (None, 0).
+    """
+    from data_utils_module import build_market_snapshot
+    from history_store import get_history_store
+
+    market_data = build_market_snapshot(batch=True)
+    if market_data is None:
+        return None, 0
+
+    store = get_history_store()
+    histories = {symbol: store.load_window(symbol) for symbol, data in market_data.items() if data}
+
+    return market_data, write_snapshot_file(market_data, histories, path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--output', default=SNAPSHOT_PATH, help='Fichero Arrow IPC de salida')
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    market_data, size = build_snapshot_file(args.output)
+    if market_data is None:
+        print(f"No se obtuvo ningún mercado; {args.output} no se ha modificado")
+        return 1
+
+    markets = sum(1 for data in market_data.values() if data)
+
+    print(f"Snapshot de {markets}/{len(market_data)} mercados escrito en {args.output} "
+          f"({size / 1024:,.0f} KB, {time.perf_counter() - start:.1f} s)")
+    return 0 if markets else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,138 @@
+"""Informe del coste de arranque: tiempo de importación desglosado por paquete
+
+Cada medición importa el módulo en un proceso nuevo con `python -X importtime`
+(arranque en frío real, sin nada en sys.modules) y agrupa el tiempo propio de
+cada import por paquete de primer nivel. Sale con código 1 si la mediana supera
+el presupuesto o si se importa algún módulo que debe cargarse solo al descargar.
+
+    python startup_profile.py                        # app.py, presupuesto de MAPA_STARTUP_BUDGET
+    python startup_profile.py --repeat 5 --budget 1.5 --output startup.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Presupuesto de importación del arranque en frío (segundos)
+STARTUP_BUDGET = float(os.environ.get('MAPA_STARTUP_BUDGET', '2.0'))
+
+# Módulos que solo debe cargar el hilo de refresco en la primera descarga
+DEFERRED_MODULES = ('yfinance', 'curl_cffi')
+
+DEFAULT_REPEAT = 3
+DEFAULT_TOP = 15
+
+# El proceso hijo mide también el tiempo de reloj del import completo
+CHILD_CODE = (
+    "import sys, time; start = time.perf_counter(); "
+    "__import__(sys.argv[1]); "
+    "print(time.perf_counter() - start)"
+)
+
+
+def parse_importtime(stderr):
+    """Líneas de -X importtime -> [(módulo, tiempo propio us, acumulado us, profundidad)]"""
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|', 2)
+        depth = (len(name) - len(name.lstrip(' ')) - 1) // 2
+        imports.append((name.strip(), int(own), int(cumulative), depth))
+    return imports
+
+
+def profile_once(module):
+    """Importa el módulo en un proceso nuevo; devuelve (segundos de reloj, imports)"""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', CHILD_CODE, module],
+        cwd=ROOT, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"No se pudo importar {module}:\n{result.stderr[-2000:]}")
+
+    return float(result.stdout.strip().splitlines()[-1]), parse_importtime(result.stderr)
+
+
+def by_package(imports):
+    """Paquete de primer nivel -> (tiempo propio total en segundos, módulos importados)"""
+    packages = {}
+    for name, own, _, _ in imports:
+        package = name.split('.', 1)[0]
+        total, count = packages.get(package, (0, 0))
+        packages[package] = (total + own, count + 1)
+    return {
+        package: {'seconds': total / 1e6, 'modules': count}
+        for package, (total, count) in sorted(packages.items(), key=lambda item: -item[1][0])
+    }
+
+
+def profile(module, repeat=DEFAULT_REPEAT):
+    """Perfil de arranque: mediana de `repeat` procesos y desglose de la ejecución mediana"""
+    runs = [profile_once(module) for _ in range(repeat)]
+    runs.sort(key=lambda run: run[0])
+    wall, imports = runs[len(runs) // 2]
+
+    loaded = {name.split('.', 1)[0] for name, _, _, _ in imports}
+
+    return {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'module': module,
+        'python': sys.version.split()[0],
+        'repeat': repeat,
+        'wall_seconds': [run[0] for run in runs],
+        'median_seconds': statistics.median(run[0] for run in runs),
+        'import_seconds': sum(own for _, own, _, _ in imports) / 1e6,
+        'modules': len(imports),
+        'packages': by_package(imports),
+        'deferred_loaded': [name for name in DEFERRED_MODULES if name in loaded]
+    }
+
+
+def print_report(report, budget, top=DEFAULT_TOP):
+    print(f"Arranque de {report['module']}: mediana {report['median_seconds'] * 1000:.0f} ms "
+          f"de {report['repeat']} procesos ({report['modules']} módulos importados), "
+          f"presupuesto {budget * 1000:.0f} ms")
+    print(f"\n{'paquete':<28} {'ms':>9} {'%':>6} {'módulos':>8}")
+
+    total = report['import_seconds'] or 1
+    for package, stats in list(report['packages'].items())[:top]:
+        print(f"{package:<28} {stats['seconds'] * 1000:>9.1f} {stats['seconds'] / total * 100:>6.1f} "
+              f"{stats['modules']:>8}")
+
+    if report['deferred_loaded']:
+        print(f"\nSe importan al arrancar módulos que deberían cargarse al descargar: "
+              f"{', '.join(report['deferred_loaded'])}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--module', default='app', help='Módulo a importar (por defecto, la aplicación)')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help='Procesos medidos')
+    parser.add_argument('--budget', type=float, default=STARTUP_BUDGET, help='Presupuesto en segundos')
+    parser.add_argument('--top', type=int, default=DEFAULT_TOP, help='Paquetes que se muestran')
+    parser.add_argument('--output', help='Fichero JSON con el informe completo')
+    args = parser.parse_args(argv)
+
+    report = profile(args.module, args.repeat)
+    report['budget_seconds'] = args.budget
+    print_report(report, args.budget, args.top)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as handle:
+            json.dump(report, handle, indent=2)
+        print(f"\nInforme guardado en {args.output}")
+
+    if report['median_seconds'] > args.budget:
+        print(f"\nArranque por encima del presupuesto ({report['median_seconds']:.2f} s > {args.budget:.2f} s)")
+        return 1
+    return 1 if report['deferred_loaded'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
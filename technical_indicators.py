@@ -0,0 +1,442 @@
+import json
+import math
+from functools import cached_property
+
+import numpy as np
+import pandas as pd
+
+from rolling_state import RollingMean
+
+# Ventanas de los indicadores (en sesiones)
+MA_WINDOWS = (20, 50, 200)
+RSI_WINDOW = 14
+VOLATILITY_WINDOW = 20
+ATR_WINDOW = 14
+HIGH_WINDOW = 252           # Máximo de 52 semanas
+
+# Sesiones por año para anualizar la volatilidad
+TRADING_DAYS = 252
+
+# Indicadores que se calculan para cada mercado (claves de sus datos)
+INDICATOR_COLUMNS = tuple(f'ma{window}' for window in MA_WINDOWS) + (
+    f'rsi{RSI_WINDOW}', f'volatility{VOLATILITY_WINDOW}', f'atr{ATR_WINDOW}', 'drawdown'
+)
+
+
+def align_last(values, valid):
+    """Desplaza las observaciones válidas de cada columna al final de la matriz
+
+    Los huecos (festivos locales) quedan arriba como NaN, así que las últimas
+    `n` filas son las últimas `n` sesiones de cada mercado. Devuelve la matriz
+    alineada y el orden de filas aplicado, para alinear igual otros campos.
+    """
+    if valid.all():
+        return values, None  # Sin huecos: ya está alineada
+
+    order = np.argsort(valid, axis=0, kind='stable')
+    return np.take_along_axis(np.where(valid, values, np.nan), order, axis=0), order
+
+
+def wilder_average(values, window):
+    """Media de Wilder de cada columna en la última fila (NaN si no hay `window` valores)
+
+    La semilla es la media simple de los primeros `window` valores; después cada
+    valor pesa 1/window. Los valores de cada columna deben ser contiguos y llegar
+    hasta la última fila (matriz de align_last), así que la recursión se resuelve
+    con dos sumas acumuladas en lugar de recorrer las fechas.
+    """
+    rows_count, cols_count = values.shape
+    count = (~np.isnan(values)).sum(axis=0)
+    if rows_count == 0:
+        return np.full(cols_count, np.nan)
+
+    alpha = 1.0 / window
+    # Peso en la última fila de un valor de la fila t tras la semilla: (1 - 1/window)^(n-1-t)
+    decay = (1 - alpha) ** np.arange(rows_count - 1, -1, -1)
+
+    filled = np.nan_to_num(values)
+    plain = np.vstack([np.zeros((1, cols_count)), np.cumsum(filled, axis=0)])
+    weighted = np.vstack([np.zeros((1, cols_count)), np.cumsum(filled * decay[:, None], axis=0)])
+
+    cols = np.arange(cols_count)
+    start = rows_count - count                              # Primera fila con valor
+    seed_row = (start + window - 1).clip(max=rows_count - 1)  # Fila en la que se completa la semilla
+
+    seed = (plain[seed_row + 1, cols] - plain[start, cols]) / window
+    tail = alpha * (weighted[rows_count, cols] - weighted[seed_row + 1, cols])
+
+    return np.where(count >= window, seed * decay[seed_row] + tail, np.nan)
+
+
+def relative_strength(gains, losses):
+    """RSI a partir de las medias de subidas y bajadas (100 sin bajadas, 50 sin movimiento)"""
+    gains = np.asarray(gains, dtype=float)
+    losses = np.asarray(losses, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rsi = 100 - 100 / (1 + gains / losses)
+    rsi = np.where(losses == 0, np.where(gains > 0, 100.0, 50.0), rsi)
+    return np.where(np.isnan(gains) | np.isnan(losses), np.nan, rsi)
+
+
+class IndicatorPanel:
+    """Indicadores técnicos de todos los mercados sobre una matriz (fechas × símbolos)
+
+    Los intermedios (suma acumulada de los últimos cierres, cierre anterior,
+    rendimientos, rango verdadero, máximo de 52 semanas...) se calculan la
+    primera vez que los pide un indicador y los reutilizan los demás: las tres
+    medias comparten una suma acumulada y RSI y ATR una única pasada de Wilder.
+    """
+
+    def __init__(self, close, high=None, low=None):
+        values = close.to_numpy(dtype=float)
+        valid = ~np.isnan(values)
+
+        self.symbols = close.columns
+        self.counts = valid.sum(axis=0)
+        self.close, order = align_last(values, valid)
+        # Máximos y mínimos con el mismo orden; sin ellos se usa el cierre
+        self.high = self._aligned_field(high, close, valid, order)
+        self.low = self._aligned_field(low, close, valid, order)
+
+    def _aligned_field(self, field, close, valid, order):
+        if field is None:
+            return self.close
+        values = field.reindex(index=close.index, columns=close.columns).to_numpy(dtype=float)
+        aligned = values if order is None else np.take_along_axis(np.where(valid, values, np.nan), order, axis=0)
+        return np.where(np.isnan(aligned), self.close, aligned)
+
+    @cached_property
+    def trailing_close_sum(self):
+        """Suma de los últimos 1..max(MA_WINDOWS) cierres (fila k: últimos k+1)"""
+        tail = self.close[::-1][:max(MA_WINDOWS)]
+        return np.cumsum(np.nan_to_num(tail), axis=0)
+
+    @cached_property
+    def previous_close(self):
+        return np.vstack([np.full((1, self.close.shape[1]), np.nan), self.close[:-1]])
+
+    @cached_property
+    def changes(self):
+        return self.close - self.previous_close
+
+    @cached_property
+    def log_returns(self):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.log(self.close / self.previous_close)
+
+    @cached_property
+    def true_range(self):
+        previous = self.previous_close
+        return np.maximum(self.high - self.low,
+                          np.maximum(np.abs(self.high - previous), np.abs(self.low - previous)))
+
+    @cached_property
+    def high_52w(self):
+        """Máximo de las últimas HIGH_WINDOW sesiones de cada mercado"""
+        window = self.high[-HIGH_WINDOW:]
+        if window.shape[0] == 0:
+            return np.full(self.close.shape[1], np.nan)
+        return np.where(self.counts > 0, np.where(np.isnan(window), -np.inf, window).max(axis=0), np.nan)
+
+    @cached_property
+    def last_close(self):
+        if self.close.shape[0] == 0:
+            return np.full(self.close.shape[1], np.nan)
+        return self.close[-1]
+
+    def _wilder(self, window):
+        """Medias de Wilder de subidas, bajadas y rango verdadero, calculadas juntas"""
+        cache = self.__dict__.setdefault('_wilder_cache', {})
+        if window not in cache:
+            changes = self.changes
+            stacked = np.hstack([np.maximum(changes, 0.0), np.maximum(-changes, 0.0), self.true_range])
+            cache[window] = np.split(wilder_average(stacked, window), 3)
+        return cache[window]
+
+    def moving_average(self, window):
+        if window > self.trailing_close_sum.shape[0]:
+            return np.full(self.close.shape[1], np.nan)
+        return np.where(self.counts >= window, self.trailing_close_sum[window - 1] / window, np.nan)
+
+    def rsi(self, window=RSI_WINDOW):
+        gains, losses, _ = self._wilder(window)
+        return relative_strength(gains, losses)
+
+    def volatility(self, window=VOLATILITY_WINDOW):
+        """Volatilidad realizada anualizada (%) de los últimos `window` rendimientos"""
+        returns = self.log_returns[-window:]
+        if returns.shape[0] < window:
+            return np.full(self.close.shape[1], np.nan)
+        with np.errstate(invalid='ignore'):
+            deviation = np.std(returns, axis=0, ddof=1)
+        return np.where(self.counts > window, deviation * math.sqrt(TRADING_DAYS) * 100, np.nan)
+
+    def atr(self, window=ATR_WINDOW):
+        return self._wilder(window)[2]
+
+    def drawdown(self):
+        """Distancia (%) del último cierre al máximo de 52 semanas"""
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return (self.last_close / self.high_52w - 1) * 100
+
+    def frame(self):
+        """DataFrame indexado por símbolo con una columna por indicador"""
+        columns = {f'ma{window}': self.moving_average(window) for window in MA_WINDOWS}
+        columns[f'rsi{RSI_WINDOW}'] = self.rsi()
+        columns[f'volatility{VOLATILITY_WINDOW}'] = self.volatility()
+        columns[f'atr{ATR_WINDOW}'] = self.atr()
+        columns['drawdown'] = self.drawdown()
+        return pd.DataFrame(columns, index=self.symbols)[list(INDICATOR_COLUMNS)]
+
+
+def compute_indicators(close, high=None, low=None):
+    """Calcula todos los indicadores de un panel de cierres (y máximos/mínimos si los hay)"""
+    return IndicatorPanel(close, high, low).frame()
+
+
+def indicator_fields(values):
+    """Indicadores de un mercado como floats (None si no hay datos suficientes)"""
+    fields = {}
+    for column in INDICATOR_COLUMNS:
+        value = values.get(column)
+        fields[column] = None if value is None or math.isnan(value) else float(value)
+    return fields
+
+
+class WilderMean:
+    """Media de Wilder con actualización O(1) y corrección de la última barra
+
+    Guarda el estado previo al último valor para poder sustituirlo (barra actual
+    aún en formación) sin recorrer el histórico.
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self._count = 0
+        self._total = 0.0
+        self._value = None
+        self._before = None
+
+    def push(self, value):
+        self._before = (self._count, self._total, self._value)
+        self._count += 1
+
+        if self._count <= self.window:
+            self._total += value
+            if self._count == self.window:
+                self._value = self._total / self.window
+        else:
+            self._value = (self._value * (self.window - 1) + value) / self.window
+
+    def replace_last(self, value):
+        if self._before is None:
+            self.push(value)
+            return
+        self._count, self._total, self._value = self._before
+        self.push(value)
+
+    @property
+    def value(self):
+        """Media actual, o None si aún no hay `window` valores"""
+        return self._value
+
+    def to_dict(self):
+        return {'window': self.window, 'count': self._count, 'total': self._total,
+                'value': self._value, 'before': self._before}
+
+    @classmethod
+    def from_dict(cls, payload):
+        mean = cls(payload['window'])
+        mean._count, mean._total, mean._value = payload['count'], payload['total'], payload['value']
+        mean._before = tuple(payload['before']) if payload['before'] is not None else None
+        return mean
+
+
+class RollingMax:
+    """Máximo de las últimas `window` barras con coste amortizado O(1)
+
+    Las barras cerradas viven en una cola monótona (posición, valor) y la última
+    barra se guarda aparte para poder sustituirla sin perder candidatos.
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self._closed = []     # (posición, valor) con valores decrecientes
+        self._position = -1   # Posición de la última barra
+        self._last = None
+
+    def push(self, value):
+        if self._last is not None:
+            while self._closed and self._closed[-1][1] <= self._last:
+                self._closed.pop()
+            self._closed.append((self._position, self._last))
+
+        self._position += 1
+        self._last = value
+
+        start = 0
+        while start < len(self._closed) and self._closed[start][0] <= self._position - self.window:
+            start += 1
+        if start:
+            del self._closed[:start]
+
+    def replace_last(self, value):
+        if self._last is None:
+            self.push(value)
+            return
+        self._last = value
+
+    @property
+    def value(self):
+        if self._last is None:
+            return None
+        return max(self._closed[0][1], self._last) if self._closed else self._last
+
+    def to_dict(self):
+        """Candidatos con su antigüedad respecto a la última barra"""
+        return {
+            'window': self.window,
+            'closed': [[self._position - position, value] for position, value in self._closed],
+            'last': self._last
+        }
+
+    @classmethod
+    def from_dict(cls, payload):
+        rolling = cls(payload['window'])
+        rolling._last = payload['last']
+        rolling._position = 0 if rolling._last is not None else -1
+        rolling._closed = [(-age, value) for age, value in payload['closed']]
+        return rolling
+
+
+class IndicatorState:
+    """Estado incremental de todos los indicadores de un símbolo
+
+    Cada barra nueva actualiza medias, rendimientos, medias de Wilder y máximo
+    en O(1); un cierre de la misma fecha sustituye la barra en curso. Da los
+    mismos valores que IndicatorPanel sobre el histórico completo.
+    """
+
+    def __init__(self):
+        self.averages = {window: RollingMean(window) for window in MA_WINDOWS}
+        self.returns = RollingMean(VOLATILITY_WINDOW)
+        self.squared_returns = RollingMean(VOLATILITY_WINDOW)
+        self.gains = WilderMean(RSI_WINDOW)
+        self.losses = WilderMean(RSI_WINDOW)
+        self.true_range = WilderMean(ATR_WINDOW)
+        self.high = RollingMax(HIGH_WINDOW)
+        self.last_close = None
+        self.previous_close = None   # Cierre de la barra anterior a la última
+        self.last_date = None
+
+    def update(self, date, close, high=None, low=None):
+        """Incorpora una barra fechada (sin máximo o mínimo se usa el cierre)"""
+        date = pd.Timestamp(date).normalize()
+
+        if self.last_date is not None and date < self.last_date:
+            return  # Barra antigua ya contabilizada
+
+        close = float(close)
+        high = close if high is None or math.isnan(high) else float(high)
+        low = close if low is None or math.isnan(low) else float(low)
+
+        if date == self.last_date:
+            action = 'replace_last'
+        else:
+            action = 'push'
+            self.previous_close = self.last_close
+        previous = self.previous_close
+
+        for rolling in self.averages.values():
+            getattr(rolling, action)(close)
+        getattr(self.high, action)(high)
+
+        if previous is not None:
+            change = close - previous
+            log_return = math.log(close / previous)
+            true_range = max(high - low, abs(high - previous), abs(low - previous))
+
+            getattr(self.returns, action)(log_return)
+            getattr(self.squared_returns, action)(log_return * log_return)
+            getattr(self.gains, action)(max(change, 0.0))
+            getattr(self.losses, action)(max(-change, 0.0))
+            getattr(self.true_range, action)(true_range)
+
+        self.last_close = close
+        self.last_date = date
+
+    def sync(self, hist):
+        """Incorpora solo las barras del histórico posteriores a la última procesada"""
+        bars = hist.dropna(subset=['Close'])
+
+        if self.last_date is not None and not bars.empty:
+            dates = bars.index.normalize()
+            if self.last_date < dates[0]:
+                # El estado es más antiguo que el histórico disponible: reconstruir
+                self.__init__()
+            else:
+                bars = bars[dates >= self.last_date]
+
+        high = bars['High'] if 'High' in bars else bars['Close']
+        low = bars['Low'] if 'Low' in bars else bars['Close']
+        for date, close, bar_high, bar_low in zip(bars.index, bars['Close'], high, low):
+            self.update(date, close, bar_high, bar_low)
+
+        return self
+
+    def mean(self, window):
+        """Media móvil actual de la ventana indicada (None si no está completa)"""
+        return self.averages[window].value
+
+    def values(self):
+        """Indicadores actuales, con las mismas claves que compute_indicators"""
+        values = {f'ma{window}': rolling.value for window, rolling in self.averages.items()}
+
+        gains, losses = self.gains.value, self.losses.value
+        values[f'rsi{RSI_WINDOW}'] = None if gains is None else float(relative_strength(gains, losses))
+
+        volatility = None
+        if self.returns.ready:
+            mean = self.returns.value
+            variance = max(self.squared_returns.value - mean * mean, 0.0) * VOLATILITY_WINDOW / (VOLATILITY_WINDOW - 1)
+            volatility = math.sqrt(variance * TRADING_DAYS) * 100
+        values[f'volatility{VOLATILITY_WINDOW}'] = volatility
+
+        values[f'atr{ATR_WINDOW}'] = self.true_range.value
+
+        high = self.high.value
+        values['drawdown'] = (self.last_close / high - 1) * 100 if high else None
+
+        return values
+
+    def to_json(self):
+        """Serializa el estado para guardarlo entre reinicios"""
+        return json.dumps({
+            'last_date': self.last_date.strftime('%Y-%m-%d') if self.last_date is not None else None,
+            'last_close': self.last_close,
+            'previous_close': self.previous_close,
+            'averages': [rolling.to_dict() for rolling in self.averages.values()],
+            'returns': self.returns.to_dict(),
+            'squared_returns': self.squared_returns.to_dict(),
+            'gains': self.gains.to_dict(),
+            'losses': self.losses.to_dict(),
+            'true_range': self.true_range.to_dict(),
+            'high': self.high.to_dict()
+        })
+
+    @classmethod
+    def from_json(cls, payload):
+        """Reconstruye el estado desde to_json()"""
+        data = json.loads(payload)
+        state = cls()
+        state.averages = {item['window']: RollingMean.from_dict(item) for item in data['averages']}
+        state.returns = RollingMean.from_dict(data['returns'])
+        state.squared_returns = RollingMean.from_dict(data['squared_returns'])
+        state.gains = WilderMean.from_dict(data['gains'])
+        state.losses = WilderMean.from_dict(data['losses'])
+        state.true_range = WilderMean.from_dict(data['true_range'])
+        state.high = RollingMax.from_dict(data['high'])
+        state.last_close = data['last_close']
+        state.previous_close = data['previous_close']
+        state.last_date = pd.Timestamp(data['last_date']) if data['last_date'] else None
+        return state
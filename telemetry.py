@@ -0,0 +1,272 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Endpoint local con las métricas en formato de texto de Prometheus (puerto 0: desactivado)
+METRICS_HOST = os.environ.get('MAPA_METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.environ.get('MAPA_METRICS_PORT', '9464'))
+
+# Límites superiores de los buckets de latencia (segundos)
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Resultados de una lectura de la caché compartida
+CACHE_RESULTS = ('hit', 'stale', 'negative', 'miss')
+
+METRICS_PREFIX = 'mapa'
+
+
+class Histogram:
+    """Recuento por buckets, suma, máximo y último valor de una latencia
+
+    Observar un valor es una búsqueda binaria y unas sumas: se puede llamar en
+    el camino caliente sin coste apreciable.
+    """
+
+    __slots__ = ('buckets', 'counts', 'count', 'sum', 'max', 'last')
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.last = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.last = value
+        if value > self.max:
+            self.max = value
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else 0.0
+
+    def cumulative(self):
+        """(límite, recuento acumulado) por bucket, incluido +Inf, como los espera Prometheus"""
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            yield bound, total
+
+
+def _label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    return '{' + ','.join(f'{name}="{_label_value(value)}"' for name, value in labels.items()) + '}'
+
+
+def _bound(value):
+    return '+Inf' if value == float('inf') else repr(value)
+
+
+class Telemetry:
+    """Métricas del proceso: tiempos por etapa, latencia del proveedor y uso de la caché
+
+    Las etapas se identifican con (etapa, paso): ('fetch', 'batch'), ('parse',
+    'append'), ('render', 'map')... Todas las sesiones del proceso comparten los
+    mismos contadores.
+    """
+
+    def __init__(self):
+        self.started_at = time.time()
+        self._stages = {}
+        self._upstream = {}
+        self._cache = {}
+        self._counters = {'upstream_requests': 0, 'upstream_errors': 0, 'upstream_bytes': 0}
+        self._gauges = {}   # Nombre -> (ayuda, función que devuelve el valor actual)
+        self._lock = threading.Lock()
+
+    def observe(self, stage, step, seconds):
+        with self._lock:
+            histogram = self._stages.get((stage, step))
+            if histogram is None:
+                histogram = self._stages[(stage, step)] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, stage, step='total'):
+        """Mide el bloque como una observación de la etapa"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, step, time.perf_counter() - start)
+
+    def record_upstream(self, symbols, seconds, nbytes=0, step='single'):
+        """Petición al proveedor: la latencia se apunta a cada símbolo que trae"""
+        with self._lock:
+            self._counters['upstream_requests'] += 1
+            self._counters['upstream_bytes'] += int(nbytes)
+            for symbol in symbols:
+                histogram = self._upstream.get(symbol)
+                if histogram is None:
+                    histogram = self._upstream[symbol] = Histogram()
+                histogram.observe(seconds)
+        self.observe('fetch', step, seconds)
+
+    def record_upstream_error(self):
+        with self._lock:
+            self._counters['upstream_errors'] += 1
+
+    def record_cache(self, key, result):
+        """Lectura de la caché compartida; se agrupa por el espacio de nombres de la clave"""
+        namespace = key.split(':', 1)[0]
+        with self._lock:
+            self._cache[(namespace, result)] = self._cache.get((namespace, result), 0) + 1
+
+    def register_gauge(self, name, help_text, value_fn):
+        """Métrica instantánea que se calcula al leerla (circuitos abiertos, memoria...)"""
+        with self._lock:
+            self._gauges[name] = (help_text, value_fn)
+
+    def gauges(self):
+        """Nombre -> (ayuda, valor actual) de las métricas instantáneas registradas"""
+        with self._lock:
+            gauges = sorted(self._gauges.items())
+        return {name: (help_text, value_fn()) for name, (help_text, value_fn) in gauges}
+
+    def stages(self):
+        """(etapa, paso) -> {'count', 'mean', 'max', 'last'} en segundos"""
+        with self._lock:
+            return {
+                key: {'count': h.count, 'mean': h.mean, 'max': h.max, 'last': h.last}
+                for key, h in sorted(self._stages.items())
+            }
+
+    def cache_ratios(self):
+        """Espacio de nombres -> recuento por resultado y proporción de aciertos"""
+        with self._lock:
+            counts = dict(self._cache)
+
+        summary = {}
+        for (namespace, result), count in counts.items():
+            summary.setdefault(namespace, dict.fromkeys(CACHE_RESULTS, 0))[result] = count
+
+        for values in summary.values():
+            total = sum(values[result] for result in CACHE_RESULTS)
+            values['total'] = total
+            values['hit_ratio'] = (values['hit'] + values['stale']) / total if total else 0.0
+
+        return dict(sorted(summary.items()))
+
+    def slowest_symbols(self, limit=5):
+        """Símbolos con mayor latencia media del proveedor"""
+        with self._lock:
+            latencies = [(symbol, h.mean, h.count) for symbol, h in self._upstream.items()]
+        return sorted(latencies, key=lambda item: -item[1])[:limit]
+
+    def counters(self):
+        with self._lock:
+            return dict(self._counters)
+
+    def prometheus(self):
+        """Todas las métricas en formato de texto de Prometheus"""
+        lines = []
+
+        def histogram_lines(name, labels, histogram):
+            for bound, count in histogram.cumulative():
+                lines.append(f'{name}_bucket{_labels(**labels, le=_bound(bound))} {count}')
+            lines.append(f'{name}_sum{_labels(**labels)} {histogram.sum!r}')
+            lines.append(f'{name}_count{_labels(**labels)} {histogram.count}')
+
+        with self._lock:
+            name = f'{METRICS_PREFIX}_stage_seconds'
+            lines += [f'# HELP {name} Tiempo de cada etapa (descarga, lectura, cálculo, render).',
+                      f'# TYPE {name} histogram']
+            for (stage, step), histogram in sorted(self._stages.items()):
+                histogram_lines(name, {'stage': stage, 'step': step}, histogram)
+
+            name = f'{METRICS_PREFIX}_upstream_seconds'
+            lines += [f'# HELP {name} Latencia del proveedor de datos por símbolo.',
+                      f'# TYPE {name} histogram']
+            for symbol, histogram in sorted(self._upstream.items()):
+                histogram_lines(name, {'symbol': symbol}, histogram)
+
+            name = f'{METRICS_PREFIX}_cache_requests_total'
+            lines += [f'# HELP {name} Lecturas de la caché compartida por resultado.',
+                      f'# TYPE {name} counter']
+            for (namespace, result), count in sorted(self._cache.items()):
+                lines.append(f'{name}{_labels(namespace=namespace, result=result)} {count}')
+
+            for counter, help_text in (
+                ('upstream_requests', 'Peticiones al proveedor de datos.'),
+                ('upstream_errors', 'Peticiones al proveedor que han fallado.'),
+                ('upstream_bytes', 'Bytes recibidos del proveedor (tamaño de los datos en memoria).'),
+            ):
+                name = f'{METRICS_PREFIX}_{counter}_total'
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter',
+                          f'{name} {self._counters[counter]}']
+
+        for gauge, (help_text, value) in self.gauges().items():
+            name = f'{METRICS_PREFIX}_{gauge}'
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} gauge', f'{name} {value!r}']
+
+        name = f'{METRICS_PREFIX}_process_start_time_seconds'
+        lines += [f'# HELP {name} Inicio del proceso (epoch).', f'# TYPE {name} gauge',
+                  f'{name} {self.started_at!r}']
+
+        return '\n'.join(lines) + '\n'
+
+
+_telemetry = Telemetry()
+
+
+def get_telemetry():
+    """Métricas compartidas por todo el proceso"""
+    return _telemetry
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """Sirve /metrics en formato de texto de Prometheus"""
+
+    def do_GET(self):
+        if self.path.split('?', 1)[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+
+        body = get_telemetry().prometheus().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Sin una línea en la consola por cada scrape
+        pass
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(host=METRICS_HOST, port=METRICS_PORT):
+    """Arranca (una vez por proceso) el endpoint de métricas en un hilo en segundo plano
+
+    Devuelve el servidor, o None si está desactivado o el puerto ya está en uso
+    (p. ej. otra réplica en el mismo host ya lo sirve).
+    """
+    global _server
+
+    if not port:
+        return None
+
+    with _server_lock:
+        if _server is None:
+            try:
+                _server = ThreadingHTTPServer((host, port), MetricsHandler)
+            except OSError as e:
+                print(f"No se pudo abrir el endpoint de métricas en {host}:{port}: {e}")
+                return None
+            _server.daemon_threads = True
+            threading.Thread(target=_server.serve_forever, name='metrics-server', daemon=True).start()
+
+    return _server
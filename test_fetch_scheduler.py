@@ -0,0 +1,85 @@
+import pytest
+
+import fetch_scheduler
+from fetch_scheduler import CircuitBreaker, CircuitOpenError, FetchScheduler, TokenBucket
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Reloj monotónico controlado por el test"""
+    now = [1000.0]
+    monkeypatch.setattr(fetch_scheduler.time, 'monotonic', lambda: now[0])
+    return now
+
+
+def open_breaker(breaker, symbol):
+    for _ in range(breaker.threshold):
+        breaker.record_failure(symbol)
+
+
+def test_half_open_allows_a_single_probe(clock):
+    breaker = CircuitBreaker(threshold=2, reset_timeout=60)
+    open_breaker(breaker, 'X')
+    assert not breaker.allow('X')
+
+    clock[0] += 60
+    assert breaker.available('X')
+    assert breaker.allow('X')
+    assert not breaker.allow('X')
+    assert not breaker.available('X')
+
+    # La prueba falla: vuelve a abrirse
+    breaker.record_failure('X')
+    assert not breaker.allow('X')
+
+    # Pasado otro plazo, una prueba que acierta cierra el circuito
+    clock[0] += 60
+    assert breaker.allow('X')
+    breaker.record_success('X')
+    assert breaker.allow('X') and breaker.allow('X')
+
+
+def test_lost_probe_is_released_after_reset_timeout(clock):
+    breaker = CircuitBreaker(threshold=1, reset_timeout=60)
+    open_breaker(breaker, 'X')
+
+    clock[0] += 60
+    assert breaker.allow('X')
+    clock[0] += 59
+    assert not breaker.allow('X')
+    clock[0] += 1
+    assert breaker.allow('X')
+
+
+def test_burst_during_half_open_reaches_upstream_once(clock):
+    scheduler = FetchScheduler(
+        bucket=TokenBucket(rate=1000, capacity=1000),
+        breaker=CircuitBreaker(threshold=1, reset_timeout=60),
+        retries=1
+    )
+    calls = []
+
+    def failing():
+        calls.append(1)
+        raise RuntimeError('caído')
+
+    with pytest.raises(RuntimeError):
+        scheduler.call(['X'], failing)
+    clock[0] += 60
+
+    # La primera llamada reserva la prueba; mientras no se resuelve, el resto se corta
+    scheduler.breaker.allow('X')
+    for _ in range(5):
+        with pytest.raises(CircuitOpenError):
+            scheduler.call(['X'], failing)
+    assert len(calls) == 1
+
+
+def test_open_circuits_are_exported(clock, monkeypatch):
+    monkeypatch.setattr(fetch_scheduler, '_scheduler', None)
+    breaker = fetch_scheduler.get_fetch_scheduler().breaker
+    open_breaker(breaker, 'X')
+
+    assert 'mapa_open_circuits 1' in fetch_scheduler.get_telemetry().prometheus()
+    clock[0] += breaker.reset_timeout
+    assert 'mapa_open_circuits 0' in fetch_scheduler.get_telemetry().prometheus()
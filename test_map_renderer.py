@@ -0,0 +1,30 @@
+from map_renderer import MapRenderer
+
+STATUS = {'is_open': True, 'status': 'Abierto'}
+
+
+def color_by_change(change_pct):
+    if change_pct > 1:
+        return 'strong-up'
+    elif change_pct > 0:
+        return 'up'
+    elif change_pct > -1:
+        return 'down'
+    return 'strong-down'
+
+
+def test_card_class_uses_raw_change_near_thresholds():
+    renderer = MapRenderer(color_by_change, color_by_change)
+
+    for change, expected in ((0.004, 'up'), (1.004, 'strong-up'), (-0.996, 'down'), (-0.004, 'down')):
+        card = renderer.card('^X', 'Mercado', {'price': 100.0, 'change_percent': change}, STATUS)
+        assert f'border: 2px solid {expected};' in card, change
+
+
+def test_card_is_reused_while_nothing_visible_changes():
+    renderer = MapRenderer(color_by_change, color_by_change)
+    data = {'price': 100.0, 'change_percent': 0.5}
+
+    first = renderer.card('^X', 'Mercado', data, STATUS)
+    assert renderer.card('^X', 'Mercado', {**data, 'change_percent': 0.501}, STATUS) is first
+    assert (renderer.hits, renderer.misses) == (1, 1)
@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+
+from market_correlation import CORRELATION_WINDOWS, CorrelationTracker, daily_returns
+
+
+def full_correlation(close, window):
+    """Correlación recalculada desde cero sobre todo el histórico"""
+    returns = daily_returns(close).iloc[-window:]
+    complete = returns.notna().all().to_numpy()
+    matrix = returns.corr().to_numpy().copy()
+    matrix[~complete] = np.nan
+    matrix[:, ~complete] = np.nan
+    return matrix
+
+
+def test_tracker_matches_full_recompute_with_revised_bars():
+    rng = np.random.default_rng(0)
+    dates = pd.bdate_range('2025-06-02', periods=320)
+    close = pd.DataFrame(np.exp(np.cumsum(rng.normal(0, 0.01, (len(dates), 6)), axis=0)) * 100,
+                         index=dates, columns=[f's{i}' for i in range(6)])
+    close[close > close.quantile(0.97)] = np.nan   # Festivos
+    close.iloc[:150, 2] = np.nan                   # Mercado que empieza a cotizar más tarde
+
+    tracker = CorrelationTracker(close.iloc[:260], close.columns, version=0)
+    for window in CORRELATION_WINDOWS:
+        tracker.correlation(window)
+
+    for row in range(260, len(dates)):
+        # La última barra llega primero a medias y después corregida, con los últimos días releídos
+        partial = close.iloc[row - 7:row + 1].copy()
+        partial.iloc[-1, ::2] = np.nan
+        tracker.update(partial, row)
+        tracker.update(close.iloc[row - 7:row + 1], row)
+
+    for window in CORRELATION_WINDOWS:
+        np.testing.assert_allclose(tracker.correlation(window).to_numpy(), full_correlation(close, window),
+                                   atol=1e-9)
+
+
+def test_tracker_starts_empty():
+    close = pd.DataFrame({'a': [1.0, 1.1, 1.2, 1.1], 'b': [2.0, 2.1, 2.3, 2.2]},
+                         index=pd.bdate_range('2026-10-12', periods=4))
+
+    tracker = CorrelationTracker(close.iloc[:0], close.columns)
+    # La primera fecha no tiene rentabilidad
+    assert tracker.update(close) == 3
+    assert tracker.update(close.iloc[-2:]) == 0
+    pd.testing.assert_frame_equal(tracker.close, close, check_freq=False)
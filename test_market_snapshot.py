@@ -0,0 +1,148 @@
+import threading
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import fetch_scheduler
+import intraday
+import data_utils_module as du
+from cache_backend import MemoryCacheBackend, NEGATIVE_PREFIX, set_cache_backend
+from data_providers import ReplayProvider, fixture_name, set_data_provider
+from fetch_scheduler import FetchScheduler, TokenBucket
+from history_store import HistoryStore, set_history_store
+from intraday import IntradayStore
+from refresh_scheduler import SnapshotScheduler
+
+
+@pytest.fixture
+def replay(tmp_path, monkeypatch):
+    """Caché, almacén y proveedor de reproducción vacíos, sin esperas entre peticiones"""
+    backend = set_cache_backend(MemoryCacheBackend())
+    set_history_store(HistoryStore(str(tmp_path / 'history.sqlite')))
+    monkeypatch.setattr(fetch_scheduler, '_scheduler', FetchScheduler(
+        bucket=TokenBucket(rate=1000, capacity=1000), retries=1
+    ))
+
+    def use(failure_rate=0.0, symbols=()):
+        for position, symbol in enumerate(symbols):
+            dates = pd.bdate_range(end='2026-10-16', periods=260)
+            close = 100 + position + np.cumsum(np.full(len(dates), 0.1))
+            frame = pd.DataFrame({'Open': close, 'High': close + 1, 'Low': close - 1,
+                                  'Close': close, 'Volume': 1000.0}, index=dates)
+            frame.to_csv(tmp_path / f'{fixture_name(symbol)}.csv')
+        set_data_provider(ReplayProvider(path=str(tmp_path), failure_rate=failure_rate, seed=1))
+        return backend
+
+    yield use
+    set_data_provider(None)
+    set_history_store(None)
+    set_cache_backend(None)
+
+
+def test_snapshot_without_markets_is_not_cached(replay):
+    backend = replay(failure_rate=1.0)
+
+    assert du.build_market_snapshot() is None
+    assert du.load_market_snapshot() is None
+
+    key = du.snapshot_cache_key(True)
+    assert backend.get(key) is None
+    assert backend.get(f'{NEGATIVE_PREFIX}{key}') is not None
+
+    # El hilo de refresco no publica nada y volverá a intentarlo en el próximo ciclo
+    scheduler = SnapshotScheduler(du.load_market_snapshot)
+    assert scheduler.refresh() is None
+    assert scheduler.latest() is None
+
+
+def test_partial_snapshot_ttl_is_capped(replay):
+    symbols = list(du.MARKETS_CONFIG)[:2]
+    backend = replay(symbols=symbols)
+
+    market_data = du.load_market_snapshot()
+    assert [symbol for symbol, data in market_data.items() if data] == symbols
+
+    entry = backend.get(du.snapshot_cache_key(True))
+    assert entry.expires_at - entry.created_at <= du.OPEN_MARKET_TTL + 1
+
+
+def test_snapshot_ttl_follows_sessions_when_complete():
+    market_data = dict.fromkeys(du.MARKETS_CONFIG, {'price': 1.0})
+    # Sábado: todos los mercados cerrados hasta el lunes
+    now = pd.Timestamp('2026-10-17 12:00', tz='UTC').to_pydatetime()
+
+    assert du.snapshot_ttl(market_data, now) > du.OPEN_MARKET_TTL
+    assert du.snapshot_ttl({**market_data, next(iter(market_data)): None}, now) == du.OPEN_MARKET_TTL
+
+
+def test_intraday_view_only_reads_buffers(replay, tmp_path, monkeypatch):
+    store = IntradayStore()
+    monkeypatch.setattr(intraday, '_store', store)
+    symbol = next(iter(du.MARKETS_CONFIG))
+    minutes = pd.date_range('2026-10-16 13:30', periods=30, freq='min', tz='UTC')
+    pd.DataFrame({'Open': 10.0, 'High': 10.0, 'Low': 10.0, 'Close': np.linspace(10, 11, 30),
+                  'Volume': 1.0}, index=minutes).to_csv(tmp_path / f'{fixture_name(symbol, "1m")}.csv')
+    replay()
+
+    # La sesión solo apunta el símbolo: nada se descarga mientras se pinta
+    assert store.request([symbol])
+    assert not store.request([symbol])
+    assert du.get_intraday_market_data([symbol]) == {}
+    assert store.last_fetch == 0.0
+
+    # El hilo de refresco descarga lo pedido en sus tareas
+    scheduler = SnapshotScheduler(lambda: None, tasks=(du.refresh_intraday,))
+    scheduler._run_tasks()
+    assert store.version > 0
+    assert du.get_intraday_market_data([symbol])[symbol]['price'] == pytest.approx(11.0)
+
+    # Dentro de INTRADAY_REFRESH no se vuelve a descargar, salvo que se pida un símbolo nuevo
+    other = list(du.MARKETS_CONFIG)[1]
+    fetched = store.last_fetch
+    scheduler._run_tasks()
+    assert store.last_fetch == fetched
+    assert store.request([other])
+    scheduler._run_tasks()
+    assert store.last_fetch > fetched
+
+
+def test_market_session_date_uses_market_timezone():
+    by_timezone = {config['timezone']: symbol for symbol, config in du.MARKETS_CONFIG.items()}
+    tokyo, new_york = by_timezone['Asia/Tokyo'], by_timezone['America/New_York']
+
+    # Sin zona se toma como UTC; 23:30 UTC del 15 ya es el 16 en Tokio y 01:00 UTC del 17 aún es el 16 en Nueva York
+    assert str(du.market_session_date(tokyo, pd.Timestamp('2026-10-16 01:00'))) == '2026-10-16'
+    assert str(du.market_session_date(tokyo, pd.Timestamp('2026-10-15 23:30', tz='UTC'))) == '2026-10-16'
+    assert str(du.market_session_date(new_york, pd.Timestamp('2026-10-17 01:00', tz='UTC'))) == '2026-10-16'
+
+
+def test_request_refresh_waits_for_the_refresh_thread():
+    builds = []
+
+    def build():
+        builds.append(threading.current_thread().name)
+        return {'^X': {'price': float(len(builds))}}
+
+    scheduler = SnapshotScheduler(build, interval=3600).start()
+    try:
+        assert scheduler.wait(5).market_data['^X']['price'] == 1.0
+        # La construcción pedida se hace en el hilo de refresco, no en el que espera
+        assert scheduler.request_refresh(wait=5).market_data['^X']['price'] == 2.0
+        assert builds == ['snapshot-scheduler'] * 2
+    finally:
+        scheduler.stop()
+
+
+def test_intraday_memory_is_bounded_and_exported(monkeypatch):
+    monkeypatch.setattr(intraday, '_store', None)
+    store = intraday.get_intraday_store()
+    empty = intraday.MinuteRingBuffer(store.capacity).nbytes
+
+    # El doble de barras de las que caben: la memoria sigue siendo la de un buffer por símbolo
+    minutes = pd.date_range('2026-10-16 07:00', periods=2 * store.capacity, freq='min', tz='UTC')
+    store.update('^X', pd.DataFrame({'Close': 1.0, 'Volume': 1.0}, index=minutes), session='2026-10-16')
+    assert len(store.buffer('^X')) == store.capacity
+    assert store.nbytes == empty
+
+    assert f'mapa_intraday_bytes {empty}' in du.get_telemetry().prometheus()
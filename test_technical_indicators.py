@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from technical_indicators import INDICATOR_COLUMNS, IndicatorPanel, IndicatorState
+
+
+def history(periods=300, seed=0):
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range('2025-08-01', periods=periods)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, periods)))
+    spread = np.abs(rng.normal(0, 0.5, periods))
+    return pd.DataFrame({'Close': close, 'High': close + spread, 'Low': close - spread}, index=dates)
+
+
+def panel_values(hist):
+    frame = IndicatorPanel(hist[['Close']].rename(columns={'Close': '^X'}),
+                           hist[['High']].rename(columns={'High': '^X'}),
+                           hist[['Low']].rename(columns={'Low': '^X'})).frame()
+    return frame.loc['^X']
+
+
+def assert_matches_panel(state, hist):
+    expected = panel_values(hist)
+    values = state.values()
+    for column in INDICATOR_COLUMNS:
+        assert values[column] == pytest.approx(expected[column], rel=1e-9), column
+
+
+def test_sync_matches_panel_with_revised_last_bar():
+    hist = history()
+    state = IndicatorState().sync(hist.iloc[:250])
+    assert_matches_panel(state, hist.iloc[:250])
+
+    # Barras nuevas de una en una; la última llega primero a medias y luego corregida
+    for end in range(251, len(hist) + 1):
+        partial = hist.iloc[:end].copy()
+        partial.iloc[-1] = partial.iloc[-1] * 0.98
+        state.sync(partial)
+        assert_matches_panel(state, partial)
+
+        # El estado guardado entre reinicios sigue dando lo mismo
+        state = IndicatorState.from_json(state.to_json()).sync(hist.iloc[:end])
+        assert_matches_panel(state, hist.iloc[:end])
+
+
+def test_sync_rebuilds_when_history_starts_after_state():
+    hist = history()
+    state = IndicatorState().sync(hist.iloc[:50])
+
+    state.sync(hist.iloc[100:])
+    assert_matches_panel(state, hist.iloc[100:])